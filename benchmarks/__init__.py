@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the parse, build, sign and verify paths
+
+    $ python -m benchmarks -o results.json
+
+Every operation runs in its own process over synthetic inputs so the memory
+figures are not polluted by previous runs. Results are emitted as JSON to
+compare releases.
+"""
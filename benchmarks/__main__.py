@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import argparse
+import json
+import sys
+
+from .suite import FULL_SCENARIOS, OPERATIONS, QUICK_SCENARIOS, run
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks',
+        description='Time and memory-profile parse, build, sign and verify'
+    )
+    parser.add_argument('--full', action='store_true',
+                        help='run the full matrix (up to 10k invoices, '
+                             '1000 lines and 10 MB attachments)')
+    parser.add_argument('--operation', action='append', choices=OPERATIONS,
+                        help='operation to run, can be repeated '
+                             '(default: all)')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='repetitions of every measure (default: 3)')
+    parser.add_argument('-o', '--output', default=None,
+                        help='write the JSON report to this file')
+    args = parser.parse_args(argv)
+
+    def progress(result):
+        status = result.get('error') and 'ERROR' or '{0:.4f}s'.format(
+            result['best'])
+        sys.stderr.write('{dimension:>10} {invoices:>6} inv {lines:>5} lin '
+                         '{attachment_bytes:>9} B {operation:>9}: '.format(
+                             **result) + status + '\n')
+
+    report = run(
+        scenarios=FULL_SCENARIOS if args.full else QUICK_SCENARIOS,
+        operations=tuple(args.operation or OPERATIONS),
+        repeat=args.repeat,
+        progress=progress,
+    )
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        sys.stdout.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+import os
+
+from facturae.generator import FacturaeGenerator
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+CERTIFICATE = os.path.join(ROOT_DIR, 'specs', 'certs', 'gisce.pfx')
+CERTIFICATE_PUBLIC = os.path.join(ROOT_DIR, 'specs', 'certs', 'public.pem')
+CERTIFICATE_PASSWD = 'gisce'
+
+
+def read_certificates():
+    """Bundled test PKCS12, its password and its public certificate"""
+    with open(CERTIFICATE, 'rb') as f:
+        certificate = f.read()
+    with open(CERTIFICATE_PUBLIC, 'rb') as f:
+        public = f.read()
+    return certificate, CERTIFICATE_PASSWD, public
+
+
+def build_root(invoices=1, lines=1, attachment_size=0, seed=0):
+    """
+    Fed FacturaeRoot with the given number of invoices and lines per invoice
+
+    :param attachment_size: bytes of the attachment added to every invoice
+    """
+    generator = FacturaeGenerator(seed=seed, lines=(lines, lines),
+                                  attachment_size=attachment_size)
+    return generator.root(invoices)
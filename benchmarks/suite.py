@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+import platform
+import sys
+import timeit
+import traceback
+from multiprocessing import Pool
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+from lxml import etree
+
+import facturae
+from facturae.facturae_parser import FacturaeParser
+from facturae.serializer import to_bytes
+from facturae.verification import check_signature
+
+from .fixtures import build_root, read_certificates
+
+MB = 1024 * 1024
+
+# (dimension, invoices, lines per invoice, attachment bytes per invoice)
+FULL_SCENARIOS = (
+    [('invoices', n, 1, 0) for n in (1, 100, 10000)] +
+    [('lines', 1, n, 0) for n in (100, 1000)] +
+    [('attachment', 1, 1, n) for n in (MB, 10 * MB)]
+)
+
+QUICK_SCENARIOS = (
+    [('invoices', n, 1, 0) for n in (1, 100)] +
+    [('lines', 1, 100, 0)] +
+    [('attachment', 1, 1, MB)]
+)
+
+OPERATIONS = ('feed', 'serialize', 'to_bytes', 'parse', 'sign', 'verify',
+              'verify_streaming')
+
+
+def max_rss_kb():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def serialize(root):
+    root.build_tree()
+    return root.serialize()
+
+
+def verify(signed, streaming=False):
+    """
+    Check the digests and signature value with the package's verification
+
+    FacturaeRoot.sign_verify also validates the certificate chain, which
+    rejects the self-signed certificate of the fixtures.
+    """
+    certificates, error = check_signature(signed, streaming=streaming)
+    if error is not None:
+        raise ValueError(error)
+
+
+def measure(operation, repeat, setup=None):
+    """
+    Time operation repeat times and report the growth of the peak memory
+
+    :param setup: callable whose result is passed to operation, run before
+                  every repetition and not timed
+    """
+    seconds = []
+    rss_before = max_rss_kb()
+    for _ in range(repeat):
+        arg = setup() if setup is not None else None
+        start = timeit.default_timer()
+        operation(arg)
+        seconds.append(timeit.default_timer() - start)
+    rss_after = max_rss_kb()
+
+    res = {'seconds': seconds, 'best': min(seconds)}
+    if rss_before is not None:
+        res['max_rss_kb'] = rss_after
+        res['peak_growth_kb'] = rss_after - rss_before
+    return res
+
+
+def run_case(case):
+    """Run one operation over one scenario, meant to run in a new process"""
+    dimension, invoices, lines, attachment_size, operation, repeat = case
+    res = {
+        'dimension': dimension,
+        'invoices': invoices,
+        'lines': lines,
+        'attachment_bytes': attachment_size,
+        'operation': operation,
+    }
+
+    def new_root(_=None):
+        return build_root(invoices, lines, attachment_size)
+
+    try:
+        if operation == 'feed':
+            res.update(measure(new_root, repeat))
+        elif operation == 'serialize':
+            res.update(measure(serialize, repeat, setup=new_root))
+        elif operation == 'to_bytes':
+            res.update(measure(to_bytes, repeat, setup=new_root))
+        else:
+            certificate, password, _ = read_certificates()
+            root = new_root()
+            xml = serialize(root)
+            res['document_bytes'] = len(xml)
+            if operation == 'parse':
+                res.update(measure(lambda _: FacturaeParser(xml), repeat))
+            elif operation == 'sign':
+                res.update(measure(
+                    lambda _: root.sign(certificate, password), repeat))
+            elif operation in ('verify', 'verify_streaming'):
+                signed = root.sign(certificate, password)
+                streaming = operation == 'verify_streaming'
+                res.update(measure(
+                    lambda _: verify(signed, streaming), repeat))
+    except Exception:
+        res['error'] = traceback.format_exc()
+
+    return res
+
+
+def run(scenarios=QUICK_SCENARIOS, operations=OPERATIONS, repeat=3,
+        progress=None):
+    """
+    Run every operation over every scenario
+
+    :param progress: callable called with every result as it is available
+    :return: report dict, JSON serializable
+    """
+    report = {
+        'python': sys.version,
+        'platform': platform.platform(),
+        'facturae': facturae.__version__,
+        'lxml': '.'.join(str(v) for v in etree.LXML_VERSION),
+        'repeat': repeat,
+        'results': [],
+    }
+
+    for scenario in scenarios:
+        for operation in operations:
+            case = tuple(scenario) + (operation, repeat)
+            pool = Pool(1)
+            try:
+                result = pool.apply(run_case, (case,))
+            finally:
+                pool.terminate()
+                pool.join()
+            report['results'].append(result)
+            if progress is not None:
+                progress(result)
+
+    return report
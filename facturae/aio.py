@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+Asyncio ingestion of Facturae documents, Python 3.7 or later
+
+    async with Pipeline(validate=True, verifier=verifier) as pipeline:
+        async for result in pipeline.results(documents):
+            if result.error:
+                log(result.key, result.error)
+
+Every document goes through the signature verification, XSD validation and
+parse stages that are enabled, in that order, stopping at the first one that
+fails. The stages run in executors, by default a pool of processes per
+stage, and at most concurrency[stage] documents of a run are in each stage
+at once, so the event loop is never blocked. Documents are read from the
+source only while fewer than max_pending of them are in the pipeline or
+waiting to be consumed, which bounds the memory used when the consumer or
+the stages are slower than the source.
+"""
+import asyncio
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from io import BytesIO
+from multiprocessing import cpu_count
+
+from . import validation, xmldsig
+from .facturae_parser import FacturaeParser
+from .verification import check_signature
+
+VERIFY = 'verify'
+VALIDATE = 'validate'
+PARSE = 'parse'
+STAGES = (VERIFY, VALIDATE, PARSE)
+
+
+class IngestResult(namedtuple('IngestResult', ['key', 'result', 'validation',
+                                               'verification', 'error'])):
+    """
+    Outcome of a document
+
+    :ivar key: key of the document in the source, its position by default
+    :ivar result: parsed dict, as FacturaeParser.xml_dict, None when the
+                  document wasn't parsed
+    :ivar validation: list of ValidationError, None when not validated
+    :ivar verification: VerifyResult, None when not verified
+    :ivar error: why the document was rejected, None when it wasn't
+    """
+
+    __slots__ = ()
+
+
+def _error(e):
+    return '{0}: {1}'.format(type(e).__name__, e)
+
+
+def parse_document(data, typed=False, fields=None):
+    """Parse a whole document, as FacturaeParser.parse_xml, raising errors"""
+    with FacturaeParser.iter_invoices(BytesIO(data), typed=typed,
+                                      fields=fields) as stream:
+        result = dict(stream.xml_dict)
+        result['Invoices'] = list(stream)
+    return result
+
+
+async def _iterate(source):
+    if hasattr(source, '__aiter__'):
+        async for item in source:
+            yield item
+    else:
+        for item in source:
+            yield item
+
+
+class Pipeline(object):
+    """
+    Verification, validation and parse stages run in executors
+    """
+
+    def __init__(self, parse=True, validate=False, verifier=None,
+                 typed=False, fields=None, concurrency=None,
+                 max_pending=None, ordered=False, executor=None):
+        """
+        :param parse: parse the documents
+        :param validate: validate the documents against the Facturae schema
+        :param verifier: FacturaeVerifier checking the signatures, None not
+                         to verify them. The certificate decisions are taken
+                         and cached in the calling process
+        :param typed: parse into records, see FacturaeParser
+        :param fields: keys of the values to extract, see FacturaeParser
+        :param concurrency: dict with the documents run at once by stage,
+                            defaults to the number of CPUs for every stage
+        :param max_pending: documents read from the source and not yet
+                            consumed, defaults to twice the largest stage
+                            concurrency
+        :param ordered: yield the results in the order of the source,
+                        otherwise as they are completed
+        :param executor: concurrent.futures executor shared by the stages,
+                         by default every stage gets a pool of processes as
+                         large as its concurrency
+        """
+        self.parse = parse
+        self.validate = validate
+        self.verifier = verifier
+        self.typed = typed
+        self.fields = fields
+        self.ordered = ordered
+        if verifier is not None and verifier.streaming:
+            xmldsig.warn_in_memory()
+
+        self.concurrency = dict((stage, cpu_count()) for stage in STAGES)
+        self.concurrency.update(concurrency or {})
+        self.max_pending = max_pending or 2 * max(self.concurrency.values())
+
+        self._own_executors = executor is None
+        self._executors = {}
+        for stage in self.stages():
+            if executor is None:
+                self._executors[stage] = ProcessPoolExecutor(
+                    self.concurrency[stage],
+                    initializer=xmldsig.ignore_in_memory)
+            else:
+                self._executors[stage] = executor
+
+    def stages(self):
+        """Stages enabled, in the order they are run"""
+        enabled = {VERIFY: self.verifier is not None,
+                   VALIDATE: self.validate, PARSE: self.parse}
+        return [stage for stage in STAGES if enabled[stage]]
+
+    def limits(self):
+        """Semaphores bounding the documents in each stage during a run"""
+        return dict((stage, asyncio.Semaphore(self.concurrency[stage]))
+                    for stage in STAGES)
+
+    async def _run(self, limits, stage, func):
+        async with limits[stage]:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executors[stage], func)
+
+    async def process(self, key, data, limits=None):
+        """
+        Run the stages on a document
+
+        :param data: encoded document
+        :param limits: semaphores of the run, as returned by limits(), a
+                       new set by default
+        :return: IngestResult
+        """
+        if limits is None:
+            limits = self.limits()
+        verification = errors = None
+        if self.verifier is not None:
+            checked = await self._run(limits, VERIFY, partial(
+                check_signature, data, streaming=self.verifier.streaming))
+            # The trust store and its cache stay in this process, a thread
+            # keeps the certificate validation off the loop
+            verification = await asyncio.get_running_loop().run_in_executor(
+                None, self.verifier.result, checked)
+            if not verification.valid:
+                return IngestResult(key, None, None, verification,
+                                    verification.error)
+
+        if self.validate:
+            errors = await self._run(limits, VALIDATE,
+                                     partial(validation.validate, data))
+            if errors:
+                return IngestResult(key, None, errors, verification,
+                                    _error(validation.InvalidDocument(errors)))
+
+        result = None
+        if self.parse:
+            result = await self._run(limits, PARSE, partial(
+                parse_document, data, typed=self.typed, fields=self.fields))
+        return IngestResult(key, result, errors, verification, None)
+
+    async def results(self, source):
+        """
+        Run the documents of source through the pipeline
+
+        :param source: async or plain iterable of encoded documents or of
+                       (key, document) tuples
+        :return: async iterator of IngestResult
+        """
+        loop = asyncio.get_running_loop()
+        limits = self.limits()
+        pending = asyncio.Semaphore(self.max_pending)
+        done = asyncio.Queue()
+        tasks = set()
+
+        async def process(index, key, data):
+            try:
+                res = await self.process(key, data, limits)
+            except Exception as e:
+                res = IngestResult(key, None, None, None, _error(e))
+            await done.put((index, res))
+
+        async def feed():
+            count = 0
+            try:
+                async for item in _iterate(source):
+                    await pending.acquire()
+                    if isinstance(item, tuple):
+                        key, data = item
+                    else:
+                        key, data = count, item
+                    task = loop.create_task(process(count, key, data))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                    count += 1
+            except Exception as e:
+                await done.put((None, (count, e)))
+            else:
+                await done.put((None, (count, None)))
+
+        feeder = loop.create_task(feed())
+        try:
+            total = None
+            yielded = 0
+            finished = {}
+            while total is None or yielded < total:
+                index, res = await done.get()
+                if index is None:
+                    total, error = res
+                    if error is not None:
+                        raise error
+                    continue
+                finished[index] = res
+                while finished:
+                    if self.ordered:
+                        if yielded not in finished:
+                            break
+                        res = finished.pop(yielded)
+                    else:
+                        res = finished.popitem()[1]
+                    yielded += 1
+                    pending.release()
+                    yield res
+        finally:
+            feeder.cancel()
+            for task in list(tasks):
+                task.cancel()
+
+    def close(self):
+        """Shut down the executors created by the pipeline"""
+        if self._own_executors:
+            for executor in self._executors.values():
+                executor.shutdown()
+        self._executors = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        # Waiting for the workers to exit would block the loop
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
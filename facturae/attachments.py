@@ -0,0 +1,538 @@
+# -*- coding: utf-8 -*-
+import base64
+import binascii
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+import zipfile
+import zlib
+from io import BytesIO
+
+ATTACHMENT_DATA_OPEN = re.compile(
+    br'<(?:[\w.-]+:)?AttachmentData(?:\s[^>]*)?>'
+)
+ATTACHMENT_DATA_CLOSE = re.compile(br'</(?:[\w.-]+:)?AttachmentData\s*>')
+
+ATTACHMENT_DATA_OPEN_TEXT = re.compile(
+    u'<(?:[\\w.-]+:)?AttachmentData(?:\\s[^>]*)?>'
+)
+ATTACHMENT_DATA_CLOSE_TEXT = re.compile(u'</(?:[\\w.-]+:)?AttachmentData\\s*>')
+
+WHITESPACE = b' \t\r\n'
+
+#: AttachmentCompressionAlgorithm values
+ZIP = 'ZIP'
+GZIP = 'GZIP'
+NONE = 'NONE'
+
+CHUNK_SIZE = 64 * 1024
+#: Compressed data kept in memory before spilling to a temporary file
+SPOOL_SIZE = 4 * 1024 * 1024
+#: End of a ZIP archive kept to read its central directory
+ZIP_TAIL_SIZE = 128 * 1024
+
+
+def find_attachment_data(buf, pos=0):
+    """
+    Locate the next AttachmentData text in a raw Facturae document
+
+    :param buf: bytes, text or mmap with the document
+    :param pos: offset where the search starts
+    :return: tuple (start, end) with the offsets of the element text or None
+             when there are no more AttachmentData elements
+    """
+    if isinstance(buf, bytes) or not hasattr(buf, 'encode'):
+        open_tag, close_tag = ATTACHMENT_DATA_OPEN, ATTACHMENT_DATA_CLOSE
+        self_closing = b'/>'
+    else:
+        open_tag, close_tag = ATTACHMENT_DATA_OPEN_TEXT, ATTACHMENT_DATA_CLOSE_TEXT
+        self_closing = u'/>'
+
+    opened = open_tag.search(buf, pos)
+    if opened is None:
+        return None
+    start = opened.end()
+    if opened.group(0).endswith(self_closing):
+        return start, start
+    closed = close_tag.search(buf, start)
+    if closed is None:
+        return None
+    return start, closed.start()
+
+
+def is_plain_text(buf, start, end):
+    """
+    Check that a document region holds character data only, without
+    entities, CDATA sections or comments, so it can be read verbatim
+    """
+    if isinstance(buf, bytes) or not hasattr(buf, 'encode'):
+        amp, lt = b'&', b'<'
+    else:
+        amp, lt = u'&', u'<'
+    return buf.find(amp, start, end) == -1 and buf.find(lt, start, end) == -1
+
+
+def decode_base64(chunks):
+    """
+    Decode an iterable of base64 chunks, yielding the decoded bytes
+    """
+    pending = b''
+    for chunk in chunks:
+        if not isinstance(chunk, bytes):
+            chunk = chunk.encode('ascii')
+        chunk = pending + chunk.translate(None, WHITESPACE)
+        cut = len(chunk) - len(chunk) % 4
+        pending = chunk[cut:]
+        if cut:
+            yield binascii.a2b_base64(chunk[:cut])
+    if pending:
+        yield binascii.a2b_base64(pending)
+
+
+def encode_base64(chunks):
+    """
+    Encode an iterable of bytes chunks, yielding base64 ASCII bytes
+    """
+    pending = b''
+    for chunk in chunks:
+        chunk = pending + chunk
+        cut = len(chunk) - len(chunk) % 3
+        pending = chunk[cut:]
+        if cut:
+            yield base64.b64encode(chunk[:cut])
+    if pending:
+        yield base64.b64encode(pending)
+
+
+def iter_source(data=None, path=None, fileobj=None, chunk_size=CHUNK_SIZE):
+    """
+    Yield in chunks the bytes of data, of the file name path or of the
+    binary file object fileobj
+    """
+    assert [data, path, fileobj].count(None) == 2, \
+        "One of data, path or fileobj must be provided"
+
+    if data is not None:
+        for pos in range(0, len(data), chunk_size):
+            yield data[pos:pos + chunk_size]
+        return
+
+    f = open(path, 'rb') if path is not None else fileobj
+    try:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        if path is not None:
+            f.close()
+
+
+def _algorithm(algorithm):
+    return (algorithm or NONE).strip().upper()
+
+
+def _spool(chunks):
+    """
+    Seekable file with the bytes of chunks, positioned at its start
+
+    The bytes are kept in memory up to SPOOL_SIZE and moved to a temporary
+    file past it. SpooledTemporaryFile isn't used, zipfile can't read from
+    it before Python 3.11 as it lacks seekable().
+    """
+    spool = BytesIO()
+    for chunk in chunks:
+        spool.write(chunk)
+        if isinstance(spool, BytesIO) and spool.tell() > SPOOL_SIZE:
+            f = tempfile.TemporaryFile()
+            f.write(spool.getvalue())
+            spool = f
+    spool.seek(0)
+    return spool
+
+
+def _zip(chunks, name):
+    """Spooled ZIP archive with chunks deflated as its only member"""
+    spool = tempfile.SpooledTemporaryFile(SPOOL_SIZE)
+    archive = zipfile.ZipFile(spool, 'w', zipfile.ZIP_DEFLATED,
+                              allowZip64=True)
+    try:
+        info = zipfile.ZipInfo(name, date_time=(1980, 1, 1, 0, 0, 0))
+        info.compress_type = zipfile.ZIP_DEFLATED
+        if sys.version_info >= (3, 6):
+            # Archive members can be written as a stream
+            with archive.open(info, 'w', force_zip64=True) as member:
+                for chunk in chunks:
+                    member.write(chunk)
+        else:
+            with tempfile.NamedTemporaryFile() as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                f.flush()
+                archive.write(f.name, name)
+    finally:
+        archive.close()
+    spool.seek(0)
+    return spool
+
+
+def compress_data(chunks, algorithm, name='attachment'):
+    """
+    Compress an iterable of bytes chunks, yielding the compressed bytes
+
+    :param algorithm: AttachmentCompressionAlgorithm, ZIP, GZIP or NONE
+    :param name: name of the archive member for ZIP
+    """
+    algorithm = _algorithm(algorithm)
+    if algorithm == NONE:
+        for chunk in chunks:
+            yield chunk
+    elif algorithm == GZIP:
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+    elif algorithm == ZIP:
+        spool = _zip(chunks, name)
+        try:
+            for chunk in iter_source(fileobj=spool):
+                yield chunk
+        finally:
+            spool.close()
+    else:
+        raise ValueError(
+            'Unsupported AttachmentCompressionAlgorithm {0}'.format(algorithm))
+
+
+def decompress_data(chunks, algorithm):
+    """
+    Decompress an iterable of bytes chunks, yielding the original bytes
+
+    Data with an algorithm other than ZIP or GZIP is yielded as it is. A ZIP
+    archive is spooled to read its first member.
+    """
+    algorithm = _algorithm(algorithm)
+    if algorithm == GZIP:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        for chunk in chunks:
+            data = decompressor.decompress(chunk)
+            if data:
+                yield data
+        yield decompressor.flush()
+    elif algorithm == ZIP:
+        spool = _spool(chunks)
+        try:
+            archive = zipfile.ZipFile(spool)
+            try:
+                member = archive.open(archive.infolist()[0])
+                for chunk in iter_source(fileobj=member):
+                    yield chunk
+            finally:
+                archive.close()
+        finally:
+            spool.close()
+    else:
+        for chunk in chunks:
+            yield chunk
+
+
+def decompressed_size(chunks, algorithm):
+    """
+    Size of the original bytes of an iterable of compressed chunks, read
+    from the archive instead of decompressing it
+
+    The size of a ZIP archive is the one of its first member in the central
+    directory, read from the last ZIP_TAIL_SIZE bytes. The size of GZIP data
+    is the ISIZE of its trailer, which holds it modulo 2 ** 32 and only for
+    the last member of the stream.
+    """
+    algorithm = _algorithm(algorithm)
+    if algorithm not in (ZIP, GZIP):
+        return sum(len(chunk) for chunk in chunks)
+    keep = ZIP_TAIL_SIZE if algorithm == ZIP else 4
+    tail = b''
+    for chunk in chunks:
+        tail = (tail + chunk)[-keep:]
+    if algorithm == GZIP:
+        return struct.unpack('<I', tail)[0]
+    # zipfile locates the central directory relative to the end record, so
+    # the archive can be read without its start
+    archive = zipfile.ZipFile(BytesIO(tail))
+    try:
+        return archive.infolist()[0].file_size
+    finally:
+        archive.close()
+
+
+def encode_attachment(data=None, path=None, fileobj=None, compression=ZIP,
+                      name=None):
+    """
+    Compress and base64 encode a document as an AttachmentData text
+
+    The document is read, compressed and encoded in chunks, only the
+    resulting text is held in memory as a whole.
+
+    :param data: bytes of the document
+    :param path: file name of the document
+    :param fileobj: binary file object with the document
+    :param compression: AttachmentCompressionAlgorithm, ZIP, GZIP or NONE
+    :param name: name of the ZIP archive member, defaults to the base name
+                 of path
+    :return: base64 text
+    """
+    if name is None:
+        name = os.path.basename(path) if path is not None else 'attachment'
+    chunks = iter_source(data, path, fileobj)
+    encoded = encode_base64(compress_data(chunks, compression, name))
+    return b''.join(encoded).decode('ascii')
+
+
+def decode_attachment(text, encoding='BASE64', compression=None):
+    """
+    Original bytes of an AttachmentData text
+
+    :param encoding: AttachmentEncoding of the attachment
+    :param compression: AttachmentCompressionAlgorithm of the attachment
+    """
+    chunks = [text]
+    if encoding and encoding.upper() == 'BASE64':
+        chunks = decode_base64(chunks)
+    elif not isinstance(text, bytes):
+        chunks = [text.encode('utf-8')]
+    return b''.join(decompress_data(chunks, compression))
+
+
+class AttachmentSource(object):
+    """
+    AttachmentData read from a document when the Facturae is written
+
+    Assigned as the value of Attachment.attachmentdata, the document is
+    compressed and base64 encoded in chunks straight into the output by
+    serializer.write_element and FacturaeWriter, so its text is never held
+    in memory as a whole. Anything else renders it with str().
+    """
+
+    #: Multiple of 3, so every chunk encodes on its own
+    CHUNK_SIZE = 3 * 16 * 1024
+
+    def __init__(self, data=None, path=None, fileobj=None, compression=NONE,
+                 name=None):
+        """
+        :param data: bytes or buffer with the document
+        :param path: file name of the document, memory mapped when read
+        :param fileobj: seekable binary file object with the document
+        :param compression: AttachmentCompressionAlgorithm, ZIP, GZIP or NONE
+        :param name: name of the ZIP archive member, defaults to the base
+                     name of path
+        """
+        assert [data, path, fileobj].count(None) == 2, \
+            "One of data, path or fileobj must be provided"
+
+        self.data = data
+        self.path = path
+        self.fileobj = fileobj
+        self.compression = compression or NONE
+        if name is None:
+            name = os.path.basename(path) if path is not None else 'attachment'
+        self.name = name
+
+    def __repr__(self):
+        return '<AttachmentSource {0} compression={1}>'.format(
+            self.path or self.name, self.compression)
+
+    def iter_data(self, chunk_size=None):
+        """Yield the bytes of the document"""
+        chunk_size = chunk_size or self.CHUNK_SIZE
+
+        if self.fileobj is not None:
+            self.fileobj.seek(0)
+            for chunk in iter_source(fileobj=self.fileobj,
+                                     chunk_size=chunk_size):
+                yield chunk
+            return
+
+        if self.data is not None:
+            for pos in range(0, len(self.data), chunk_size):
+                yield bytes(self.data[pos:pos + chunk_size])
+            return
+
+        with open(self.path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if not size:
+                return
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for pos in range(0, size, chunk_size):
+                    yield buf[pos:pos + chunk_size]
+            finally:
+                buf.close()
+
+    def iter_encoded(self, chunk_size=None):
+        """Yield the compressed, base64 encoded document as ASCII bytes"""
+        chunks = compress_data(self.iter_data(chunk_size), self.compression,
+                               self.name)
+        return encode_base64(chunks)
+
+    def __str__(self):
+        return b''.join(self.iter_encoded()).decode('ascii')
+
+
+class AttachmentPayload(object):
+    """
+    Lazy handle over the AttachmentData of an Attachment
+
+    It only keeps where the data lives (an in-memory document, a file name
+    or an open file) and the offsets of the text, decoding it on demand.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, start, end, buf=None, path=None, fileobj=None,
+                 compression=False, format=False, encoding=False):
+        """
+        :param start: offset where the AttachmentData text starts
+        :param end: offset where the AttachmentData text ends
+        :param buf: in-memory document holding the text
+        :param path: file name of the document holding the text
+        :param fileobj: seekable file object holding the text
+        :param compression: AttachmentCompressionAlgorithm of the attachment
+        :param format: AttachmentFormat of the attachment
+        :param encoding: AttachmentEncoding of the attachment
+        """
+        assert [buf, path, fileobj].count(None) == 2, \
+            "One of buf, path or fileobj must be provided"
+
+        self.start = start
+        self.end = end
+        self.buf = buf
+        self.path = path
+        self.fileobj = fileobj
+        self.compression = compression
+        self.format = format
+        self.encoding = encoding
+
+    @property
+    def size(self):
+        """Length of the encoded data"""
+        return self.end - self.start
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return '<AttachmentPayload format={0} encoding={1} size={2}>'.format(
+            self.format, self.encoding, self.size
+        )
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self.fileobj is not None:
+            # Open files can't be pickled, ship the text itself
+            data = b''.join(self.iter_raw())
+            state.update({'start': 0, 'end': len(data), 'buf': data,
+                          'fileobj': None})
+        return state
+
+    def iter_raw(self, chunk_size=None):
+        """Yield the encoded data as it is in the document"""
+        chunk_size = chunk_size or self.CHUNK_SIZE
+
+        if self.buf is not None:
+            for pos in range(self.start, self.end, chunk_size):
+                yield self.buf[pos:min(pos + chunk_size, self.end)]
+            return
+
+        if self.path is not None:
+            f = open(self.path, 'rb')
+        else:
+            f = self.fileobj
+        try:
+            f.seek(self.start)
+            remaining = self.size
+            while remaining > 0:
+                data = f.read(min(chunk_size, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+        finally:
+            if self.path is not None:
+                f.close()
+
+    def iter_chunks(self, chunk_size=None, decompress=True):
+        """
+        Yield the decoded data in chunks
+
+        :param decompress: undo the AttachmentCompressionAlgorithm, ZIP or
+                           GZIP, returning the original document
+        """
+        chunks = self.iter_raw(chunk_size)
+        if self.encoding and self.encoding.upper() == 'BASE64':
+            chunks = decode_base64(chunks)
+        chunks = (chunk if isinstance(chunk, bytes) else chunk.encode('utf-8')
+                  for chunk in chunks)
+        if decompress:
+            chunks = decompress_data(chunks, self.compression)
+        for chunk in chunks:
+            yield chunk
+
+    def read(self, decompress=True):
+        """Return the decoded, and decompressed, data"""
+        return b''.join(self.iter_chunks(decompress=decompress))
+
+    def document_size(self, chunk_size=None):
+        """
+        Length of the decoded, and decompressed, data
+
+        The data is decoded in chunks but not decompressed, the size is read
+        from the archive, see decompressed_size
+        """
+        return decompressed_size(
+            self.iter_chunks(chunk_size, decompress=False), self.compression)
+
+    @property
+    def text(self):
+        """Encoded data, as the AttachmentData text of the document"""
+        data = b''.join(
+            chunk if isinstance(chunk, bytes) else chunk.encode('utf-8')
+            for chunk in self.iter_raw()
+        )
+        return data if str is bytes else data.decode('utf-8')
+
+    def save(self, target, chunk_size=None, decompress=True):
+        """
+        Write the decoded, and decompressed, data to a file
+
+        :param target: file name or file-like object
+        :return: number of bytes written
+        """
+        written = 0
+        if hasattr(target, 'write'):
+            for chunk in self.iter_chunks(chunk_size, decompress):
+                target.write(chunk)
+                written += len(chunk)
+            return written
+
+        with open(target, 'wb') as f:
+            return self.save(f, chunk_size, decompress)
+
+    @classmethod
+    def spill(cls, text, fileobj, **kwargs):
+        """
+        Append an AttachmentData text to a spill file and return its handle
+
+        :param text: AttachmentData text
+        :param fileobj: seekable file object used as spill storage
+        """
+        if not isinstance(text, bytes):
+            text = text.encode('utf-8')
+        fileobj.seek(0, 2)
+        start = fileobj.tell()
+        fileobj.write(text)
+        return cls(start, start + len(text), fileobj=fileobj, **kwargs)
@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar export of parse results
+
+    with CSVWriter('export/') as writer:
+        exporter = Exporter(writer)
+        for result in parse_many(paths, typed=True):
+            exporter.add(result)
+        exporter.close()
+
+Every parse result is flattened into the rows of five normalized tables,
+batches, invoices, lines, taxes and attachments, joined by the batch key,
+the source of the document or its BatchIdentifier, and the invoice and line
+positions, so exports of different runs can be loaded together. Decimal
+amounts, dates and counts keep their types, texts of untyped results are
+converted. Rows are written in chunks of chunk_size per table, so the memory
+used doesn't grow with the export.
+
+ParquetWriter needs pyarrow, installed with the parquet extra.
+"""
+import csv
+import io
+import os
+from collections import OrderedDict, namedtuple
+from decimal import Decimal
+
+from .attachments import AttachmentPayload
+from .records import to_date, to_decimal, to_int
+
+STRING = 'string'
+DECIMAL = 'decimal'
+DATE = 'date'
+INT = 'int'
+
+CONVERTERS = {DECIMAL: to_decimal, DATE: to_date, INT: to_int}
+
+#: Scale of the Parquet decimal columns, the Facturae amounts have up to 8
+DECIMAL_SCALE = 8
+
+string_types = (str, type(u''))
+
+Column = namedtuple('Column', ['name', 'type'])
+
+
+def columns(spec):
+    return tuple(Column(name, type_) for name, type_ in spec)
+
+
+TABLES = OrderedDict([
+    ('batches', columns([
+        ('batch', STRING),
+        ('source', STRING),
+        ('SchemaVersion', STRING),
+        ('Modality', STRING),
+        ('InvoiceIssuerType', STRING),
+        ('BatchIdentifier', STRING),
+        ('InvoicesCount', INT),
+        ('TotalInvoicesAmount', DECIMAL),
+        ('TotalOutstandingAmount', DECIMAL),
+        ('TotalExecutableAmount', DECIMAL),
+        ('InvoiceCurrencyCode', STRING),
+        ('SellerTaxIdentificationNumber', STRING),
+        ('SellerCorporateName', STRING),
+        ('BuyerTaxIdentificationNumber', STRING),
+        ('BuyerCorporateName', STRING),
+    ])),
+    ('invoices', columns([
+        ('batch', STRING),
+        ('invoice', INT),
+        ('InvoiceNumber', STRING),
+        ('InvoiceSeriesCode', STRING),
+        ('InvoiceDocumentType', STRING),
+        ('InvoiceClass', STRING),
+        ('IssueDate', DATE),
+        ('InvoiceCurrencyCode', STRING),
+        ('TaxCurrencyCode', STRING),
+        ('LanguageName', STRING),
+        ('TotalGrossAmount', DECIMAL),
+        ('TotalGrossBeforeTaxes', DECIMAL),
+        ('TotalTaxOutputs', DECIMAL),
+        ('TotalTaxesWithheld', DECIMAL),
+        ('InvoiceTotal', DECIMAL),
+        ('TotalOutstandingAmount', DECIMAL),
+        ('TotalExecutableAmount', DECIMAL),
+        ('InstallmentDueDate', DATE),
+        ('InstallmentAmount', DECIMAL),
+        ('PaymentMeans', STRING),
+        ('IBAN', STRING),
+        ('BIC', STRING),
+        ('AdditionalInformation', STRING),
+    ])),
+    ('lines', columns([
+        ('batch', STRING),
+        ('invoice', INT),
+        ('line', INT),
+        ('ItemDescription', STRING),
+        ('Quantity', DECIMAL),
+        ('UnitPriceWithoutTax', DECIMAL),
+        ('TotalCost', DECIMAL),
+        ('GrossAmount', DECIMAL),
+    ])),
+    ('taxes', columns([
+        ('batch', STRING),
+        ('invoice', INT),
+        ('line', INT),
+        ('tax', INT),
+        ('TaxTypeCode', STRING),
+        ('TaxRate', DECIMAL),
+        ('TaxableBase', DECIMAL),
+        ('TaxAmount', DECIMAL),
+    ])),
+    ('attachments', columns([
+        ('batch', STRING),
+        ('invoice', INT),
+        ('attachment', INT),
+        ('AttachmentCompressionAlgorithm', STRING),
+        ('AttachmentFormat', STRING),
+        ('AttachmentEncoding', STRING),
+        # Bytes of the attached document, decoded and decompressed
+        ('AttachmentSize', INT),
+    ])),
+])
+
+
+def _value(value, type_):
+    """Value of a column, None for the missing ones"""
+    if value is None or value is False:
+        return None
+    if type_ != STRING and isinstance(value, string_types):
+        return CONVERTERS[type_](value)
+    return value
+
+
+def _row(table, data, *ids):
+    """Row of a table with ids followed by the values of data"""
+    row = list(ids)
+    for column in TABLES[table][len(ids):]:
+        row.append(_value(data.get(column.name), column.type))
+    return tuple(row)
+
+
+class Exporter(object):
+    """
+    Flattens parse results into the rows of TABLES and hands them over to a
+    writer in chunks
+    """
+
+    def __init__(self, writer, chunk_size=10000,
+                 decompressed_attachments=False):
+        """
+        :param writer: CSVWriter, ParquetWriter or any object with a
+                       write(table, rows) method
+        :param chunk_size: rows of a table buffered before writing them
+        :param decompressed_attachments: the results were parsed with
+                                         decompress_attachments, their
+                                         AttachmentData are the documents
+        """
+        self.writer = writer
+        self.chunk_size = chunk_size
+        self.decompressed_attachments = decompressed_attachments
+        self.rows = dict((table, []) for table in TABLES)
+        self.batches = 0
+
+    def _append(self, table, row):
+        rows = self.rows[table]
+        rows.append(row)
+        if len(rows) >= self.chunk_size:
+            self.flush(table)
+
+    def add(self, result, source=None):
+        """
+        Add a parse result
+
+        :param result: dict returned by the parsers, as FacturaeParser's
+                       xml_dict, with dicts or records, or a ParseResult. The
+                       ParseResults with an error are skipped
+        :param source: text identifying the document, the ParseResult path
+                       by default. It keys the batch, the BatchIdentifier
+                       does when there is none
+        :return: batch key of the result, None when it was skipped
+        :raises ValueError: when the result has neither source nor
+                            BatchIdentifier
+        """
+        if hasattr(result, 'error'):
+            if result.error:
+                return None
+            source = source if source is not None else result.path
+            result = result.result
+
+        batch = source if source is not None else result.get(
+            'BatchIdentifier')
+        if not batch:
+            raise ValueError('A source or a BatchIdentifier is needed to key '
+                             'the batch')
+        self.batches += 1
+
+        header = dict(result)
+        header['source'] = source
+        for prefix, key in (('Seller', 'seller'), ('Buyer', 'buyer')):
+            party = result.get(key) or {}
+            for name in ('TaxIdentificationNumber', 'CorporateName'):
+                header[prefix + name] = party.get(name)
+        self._append('batches', _row('batches', header, batch))
+
+        for invoice_pos, invoice in enumerate(result.get('Invoices') or ()):
+            self._add_invoice(batch, invoice_pos, invoice)
+        return batch
+
+    def _add_invoice(self, batch, pos, invoice):
+        self._append('invoices', _row('invoices', invoice, batch, pos))
+
+        # Taxes of the invoice have no line, those of the lines have theirs
+        for tax_pos, tax in enumerate(invoice.get('Taxes') or ()):
+            self._append('taxes', _row('taxes', tax,
+                                       batch, pos, None, tax_pos))
+
+        for line_pos, line in enumerate(invoice.get('InvoiceLines') or ()):
+            self._append('lines', _row('lines', line, batch, pos, line_pos))
+            for tax_pos, tax in enumerate(line.get('TaxesOutputs') or ()):
+                self._append('taxes', _row('taxes', tax,
+                                           batch, pos, line_pos, tax_pos))
+
+        for attachment_pos, attachment in enumerate(
+                invoice.get('Attachments') or ()):
+            self._append('attachments', _row(
+                'attachments', attachment, batch, pos, attachment_pos
+            )[:-1] + (self._attachment_size(attachment),))
+
+    def _attachment_size(self, attachment):
+        """
+        Size of the attached document, decoded in chunks and read from its
+        ZIP central directory or GZIP trailer without decompressing it
+        """
+        data = attachment.get('AttachmentData')
+        if not data:
+            return None
+        if self.decompressed_attachments:
+            return len(data)
+        if not isinstance(data, AttachmentPayload):
+            data = AttachmentPayload(
+                0, len(data), buf=data,
+                compression=attachment.get('AttachmentCompressionAlgorithm'),
+                encoding=attachment.get('AttachmentEncoding'))
+        return data.document_size()
+
+    def flush(self, table=None):
+        """Write the buffered rows, of a table or of all of them"""
+        for name in [table] if table else TABLES:
+            rows = self.rows[name]
+            if rows:
+                self.writer.write(name, rows)
+                self.rows[name] = []
+
+    def close(self):
+        """Write the rows left"""
+        self.flush()
+
+
+def export(results, writer, chunk_size=10000,
+           decompressed_attachments=False):
+    """
+    Export parse results and close the writer
+
+    :param results: iterable of parse result dicts or ParseResults
+    :param writer: CSVWriter or ParquetWriter
+    :param decompressed_attachments: the results were parsed with
+                                     decompress_attachments
+    :return: number of batches exported
+    """
+    exporter = Exporter(writer, chunk_size, decompressed_attachments)
+    try:
+        for result in results:
+            exporter.add(result)
+        exporter.close()
+    finally:
+        writer.close()
+    return exporter.batches
+
+
+class _Writer(object):
+    """Writer of a file per table inside a directory"""
+
+    extension = None
+
+    def __init__(self, directory):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.files = {}
+
+    def path(self, table):
+        return os.path.join(self.directory,
+                            '{0}.{1}'.format(table, self.extension))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _csv_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, Decimal):
+        return str(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if str is bytes and isinstance(value, type(u'')):
+        return value.encode('utf-8')
+    return value
+
+
+class CSVWriter(_Writer):
+    """
+    Writes every table to a CSV file with a header, UTF-8 encoded, dates in
+    ISO format and missing values empty
+    """
+
+    extension = 'csv'
+
+    def _open(self, table):
+        if str is bytes:
+            f = open(self.path(table), 'wb')
+        else:
+            f = io.open(self.path(table), 'w', encoding='utf-8', newline='')
+        writer = csv.writer(f)
+        writer.writerow([column.name for column in TABLES[table]])
+        self.files[table] = (f, writer)
+        return self.files[table]
+
+    def write(self, table, rows):
+        f, writer = self.files.get(table) or self._open(table)
+        writer.writerows([_csv_text(value) for value in row] for row in rows)
+
+    def close(self):
+        for f, writer in self.files.values():
+            f.close()
+        self.files = {}
+
+
+class ParquetWriter(_Writer):
+    """
+    Writes every table to a Parquet file, a row group per chunk
+
+    Amounts are decimal(38, 8) columns, dates date32 ones and positions and
+    counts int64 ones.
+    """
+
+    extension = 'parquet'
+
+    def __init__(self, directory, compression='snappy'):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError('ParquetWriter needs pyarrow, install '
+                              'facturae[parquet]')
+        super(ParquetWriter, self).__init__(directory)
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.compression = compression
+        self.quantum = Decimal(1).scaleb(-DECIMAL_SCALE)
+        self.types = {
+            STRING: pyarrow.string(),
+            DECIMAL: pyarrow.decimal128(38, DECIMAL_SCALE),
+            DATE: pyarrow.date32(),
+            INT: pyarrow.int64(),
+        }
+
+    def schema(self, table):
+        return self.pa.schema([(column.name, self.types[column.type])
+                               for column in TABLES[table]])
+
+    def write(self, table, rows):
+        writer = self.files.get(table)
+        schema = self.schema(table)
+        if writer is None:
+            writer = self.files[table] = self.pq.ParquetWriter(
+                self.path(table), schema, compression=self.compression)
+
+        arrays = []
+        for pos, column in enumerate(TABLES[table]):
+            values = [row[pos] for row in rows]
+            if column.type == DECIMAL:
+                values = [value if value is None
+                          else value.quantize(self.quantum)
+                          for value in values]
+            arrays.append(self.pa.array(values, type=self.types[column.type]))
+        writer.write_table(self.pa.Table.from_arrays(arrays, schema=schema))
+
+    def close(self):
+        for writer in self.files.values():
+            writer.close()
+        self.files = {}
@@ -1,9 +1,45 @@
 # -*- coding: utf-8 -*-
+import os
 
 from libcomxml.core import XmlModel, XmlField
-from .utils import FacturaeUtils
-from signxml import XMLSigner, XMLVerifier
-from xml.etree import ElementTree
+from .attachments import NONE, ZIP, AttachmentSource, encode_attachment
+from .signing import FacturaeSigner
+from .validation import DEFAULT_VERSION, validate
+from signxml import XMLVerifier
+
+
+class LazyXmlModel(XmlModel):
+    """
+    XmlModel whose optional members are created on first use
+
+    _lazy maps attribute names to the factories of their fields and
+    sub-models, called the first time the attribute is read, fed or
+    assigned. Members never used don't exist, so they take no time nor
+    memory and are left out of the document, as they would be dropped for
+    being empty anyway.
+    """
+
+    _lazy = {}
+
+    def __getattr__(self, name):
+        factory = type(self)._lazy.get(name)
+        if factory is None:
+            raise AttributeError(name)
+        member = factory()
+        setattr(self, name, member)
+        return member
+
+    def created(self, name):
+        """Member if it was already created, without creating it"""
+        return self.__dict__.get(name)
+
+
+def created(model, name):
+    """Member of a model, None for the lazy ones not created yet"""
+    if isinstance(model, LazyXmlModel):
+        return model.created(name)
+    return getattr(model, name, None)
+
 
 class FacturaeRoot(XmlModel):
     _sort_order = ('root', 'fileheader', 'parties', 'invoices')
@@ -20,27 +56,49 @@ class FacturaeRoot(XmlModel):
         self.invoices = Invoices()
         super(FacturaeRoot, self).__init__('Facturae', 'root')
 
-    def sign(self, certificate, password):
+    def sign(self, certificate, password, target=None, validate=False,
+             streaming=False):
         """
         Sign an InvoiceRoot using the provided PKCS12 certificate
 
+        The document is rendered, signed and serialized as a single lxml
+        tree, without any rewriting once signed. To sign many documents
+        with the same certificate use a FacturaeSigner, which decrypts the
+        PKCS12 only once.
+
         :param certificate: must be the pkcs12 certificate
         :param password: must be the password of the certificate
+        :param target: file name or binary file-like object where the signed
+                       document is written instead of being returned
+        :param validate: check the document against the Facturae schema
+                         before signing it, raising InvalidDocument
+        :param streaming: compute the digest feeding the canonical form to
+                          the hash in chunks, for documents with large
+                          attachments
+        :return: signed document as UTF-8 bytes, None when written to target
         """
 
-        xml = str(self)
+        return FacturaeSigner(certificate, password).sign(
+            self, target, validate=validate, streaming=streaming
+        )
 
-        pkcs12_key, pkcs12_cert = FacturaeUtils.extract_from_pkcs12(
-                                                pk=certificate, passwd=password)
-
-        root = ElementTree.fromstring(xml)
-        signed_root = XMLSigner().sign(root, key=pkcs12_key, cert=pkcs12_cert)
+    def compute_totals(self):
+        """
+        Feed the taxes and totals of every invoice, computed from its lines,
+        and the totals of the batch
 
-        string_signed_root = ElementTree.tostring(signed_root, encoding='utf8',
-                                                  method='xml').replace("\n","")
+        :return: totals.BatchTotals
+        """
+        from .totals import compute_root
+        return compute_root(self)
 
+    def validate(self, version=DEFAULT_VERSION):
+        """
+        Validate the document against the Facturae schema
 
-        return string_signed_root
+        :return: list of ValidationError, empty when the document is valid
+        """
+        return validate(self, version)
 
     def sign_verify(self, signed_root):
         """
@@ -123,6 +181,7 @@ class Party(XmlModel):
 
     _sort_order = ('party', 'taxidentification',
                    'administrativecentres', 'legalentity')
+    _cacheable = True
 
     def __init__(self, tag):
         self.party = XmlField(tag)
@@ -254,60 +313,69 @@ class Invoices(XmlModel):
 # 3.1
 
 
-class Invoice(XmlModel):
+class Invoice(LazyXmlModel):
 
     _sort_order = ('invoice', 'invoiceheader', 'invoiceissuedata',
                    'taxesoutputs', 'taxeswithhelds', 'invoicetotals',
                    'items', 'paymentdetails', 'legalliterals',
                    'additionaldata')
 
+    _lazy = {
+        'invoiceheader': lambda: InvoiceHeader(),
+        'invoiceissuedata': lambda: InvoiceIssueData(),
+        'taxesoutputs': lambda: Taxes('TaxesOutputs'),
+        'taxeswithhelds': lambda: Taxes('TaxesWithhelds'),
+        'invoicetotals': lambda: InvoiceTotals(),
+        'items': lambda: Items(),
+        'paymentdetails': lambda: PaymentDetails(),
+        'legalliterals': lambda: LegalLiterals(),
+        'additionaldata': lambda: AdditionalData(),
+    }
+
     def __init__(self):
         self.invoice = XmlField('Invoice')
-        self.invoiceheader = InvoiceHeader()
-        self.invoiceissuedata = InvoiceIssueData()
-        self.taxesoutputs = Taxes('TaxesOutputs')
-        self.taxeswithhelds = Taxes('TaxesWithhelds')
-        self.invoicetotals = InvoiceTotals()
-        self.items = Items()
-        self.paymentdetails = PaymentDetails()
-        self.legalliterals = LegalLiterals()
-        self.additionaldata = AdditionalData()
         super(Invoice, self).__init__('Invoice', 'invoice')
 
 # 3.1.1
 
 
-class InvoiceHeader(XmlModel):
+class InvoiceHeader(LazyXmlModel):
 
     _sort_order = ('invoice_header', 'invoicenumber', 'invoiceseriescode',
                    'invoicedocumenttype', 'invoiceclass', 'corrective')
 
+    _lazy = {
+        'invoiceseriescode': lambda: XmlField('InvoiceSeriesCode'),
+        'corrective': lambda: Corrective(),
+    }
+
     def __init__(self):
         self.invoiceheader = XmlField('InvoiceHeader')
         self.invoicenumber = XmlField('InvoiceNumber')
-        self.invoiceseriescode = XmlField('InvoiceSeriesCode')
         self.invoicedocumenttype = XmlField('InvoiceDocumentType')
         self.invoiceclass = XmlField('InvoiceClass')
-        self.corrective = Corrective()
         super(InvoiceHeader, self).__init__('InvoiceHeader', 'invoiceheader')
 
 # 3.1.1.5
 
 
-class Corrective(XmlModel):
+class Corrective(LazyXmlModel):
 
     _sort_order = ('corrective', 'invoicenumber', 'invoiceseriescode',
                    'reasoncode', 'reasondescription', 'taxperiod',
                    'correctionmethod', 'correctionmethoddescription',
                    'additionalreasondescription')
 
+    _lazy = {
+        'taxperiod': lambda: TaxPeriod(),
+    }
+
     def __init__(self):
         self.corrective = XmlField('Corrective')
         self.invoicenumber = XmlField('InvoiceNumber')
         self.invoiceseriescode = XmlField('InvoiceSeriesCode')
         self.reasoncode = XmlField('ReasonCode')
         self.reasondescription = XmlField('ReasonDescription')
-        self.taxperiod = TaxPeriod()
         self.correctionmethod = XmlField('CorrectionMethod')
         self.correctionmethoddescription = XmlField(
                                             'CorrectionMethodDescription')
@@ -331,20 +399,23 @@ class TaxPeriod(XmlModel):
 # 3.1.2
 
 
-class InvoiceIssueData(XmlModel):
+class InvoiceIssueData(LazyXmlModel):
 
     _sort_order = ('invoiceissuedata', 'issuedate', 'operationdate',
                    'placeofissue', 'invoicingperiod', 'invoicecurrencycode',
                    'exchangeratedetails', 'taxcurrencycode', 'languagename')
 
+    _lazy = {
+        'operationdate': lambda: XmlField('OperationDate'),
+        'placeofissue': lambda: PlaceOfIssue(),
+        'invoicingperiod': lambda: InvoicingPeriod(),
+        'exchangeratedetails': lambda: ExchangeRateDetails(),
+    }
+
     def __init__(self):
         self.invoiceissuedata = XmlField('InvoiceIssueData')
         self.issuedate = XmlField('IssueDate')
-        self.operationdate = XmlField('OperationDate')
-        self.placeofissue = PlaceOfIssue()
-        self.invoicingperiod = InvoicingPeriod()
         self.invoicecurrencycode = XmlField('InvoiceCurrencyCode')
-        self.exchangeratedetails = ExchangeRateDetails()
         self.taxcurrencycode = XmlField('TaxCurrencyCode')
         self.languagename = XmlField('LanguageName')
         super(InvoiceIssueData, self).__init__('InvoiceIssueData',
@@ -408,22 +479,26 @@ class Taxes(XmlModel):
 # 3.1.3.1
 
 
-class Tax(XmlModel):
+class Tax(LazyXmlModel):
 
     _sort_order = ('tax', 'taxtypecode', 'taxrate', 'taxablebase',
                    'taxamount', 'specialtaxablebase', 'specialtaxamount',
                    'equivalencesurcharge', 'equivalencesurchargeamount')
 
+    _lazy = {
+        'taxablebase': lambda: TaxData('TaxableBase'),
+        'taxamount': lambda: TaxData('TaxAmount'),
+        'specialtaxablebase': lambda: TaxData('SpecialTaxableBase'),
+        'specialtaxamount': lambda: TaxData('SpecialTaxAmount'),
+        'equivalencesurcharge': lambda: XmlField('EquivalenceSurcharge'),
+        'equivalencesurchargeamount':
+            lambda: TaxData('EquivalenceSurchargeAmount'),
+    }
+
     def __init__(self):
         self.tax = XmlField('Tax')
         self.taxtypecode = XmlField('TaxTypeCode')
         self.taxrate = XmlField('TaxRate', rep=lambda x: '%.8f' % x)
-        self.taxablebase = TaxData('TaxableBase')
-        self.taxamount = TaxData('TaxAmount')
-        self.specialtaxablebase = TaxData('SpecialTaxableBase')
-        self.specialtaxamount = TaxData('SpecialTaxAmount')
-        self.equivalencesurcharge = XmlField('EquivalenceSurcharge')
-        self.equivalencesurchargeamount = TaxData('EquivalenceSurchargeAmount')
         super(Tax, self).__init__('Tax', 'tax')
 
 # 3.1.3.1.3
@@ -447,25 +522,37 @@ class TaxData(XmlModel):
 # 3.1.5
 
 
-class InvoiceTotals(XmlModel):
+class InvoiceTotals(LazyXmlModel):
 
     _sort_order = ('invoicetotals', 'totalgrossamount', 'generaldiscounts',
                    'generalsurcharges', 'totalgeneraldiscounts',
                    'totalgeneralsurcharges', 'totalgrossamountbeforetaxes',
                    'totaltaxoutputs', 'totaltaxeswithheld', 'invoicetotal',
-                   'subsidies', 'totalfinancialexpenses',
+                   'subsidies', 'paymentsonaccount', 'reinbursableexpenses',
+                   'totalfinancialexpenses',
                    'totaloutstandingamount', 'totalpaymentsonaccount',
                    'amountswithheld', 'totalexecutableamount',
                    'totalreinbursableexpenses')
 
+    _lazy = {
+        'generaldiscounts': lambda: GeneralDiscounts('GeneralDiscounts'),
+        'generalsurcharges': lambda: GeneralDiscounts('GeneralSurcharges'),
+        'totalgeneraldiscounts': lambda: XmlField('TotalGeneralDiscounts'),
+        'totalgeneralsurcharges': lambda: XmlField('TotalGeneralSurcharges'),
+        'subsidies': lambda: Subsidies(),
+        'paymentsonaccount': lambda: PaymentsOnAccount(),
+        'reinbursableexpenses': lambda: ReinbursableExpenses(),
+        'totalfinancialexpenses': lambda: XmlField('TotalFinancialExpenses'),
+        'totalpaymentsonaccount': lambda: XmlField('TotalPaymentsOnAccount'),
+        'amountswithheld': lambda: AmountsWithheld(),
+        'totalreinbursableexpenses':
+            lambda: XmlField('TotalReimbursableExpenses'),
+    }
+
     def __init__(self):
         self.invoicetotals = XmlField('InvoiceTotals')
         self.totalgrossamount = XmlField('TotalGrossAmount',
                                          rep=lambda x: '%.2f' % x)
-        self.generaldiscounts = GeneralDiscounts('GeneralDiscounts')
-        self.generalsurcharges = GeneralDiscounts('GeneralSurcharges')
-        self.totalgeneraldiscounts = XmlField('TotalGeneralDiscounts')
-        self.totalgeneralsurcharges = XmlField('TotalGeneralSurcharges')
         self.totalgrossamountbeforetaxes = XmlField(
                                             'TotalGrossAmountBeforeTaxes',
                                             rep=lambda x: '%.2f' % x)
@@ -475,17 +562,10 @@ class InvoiceTotals(XmlModel):
                                             rep=lambda x: '%.2f' % x)
         self.invoicetotal = XmlField('InvoiceTotal',
                                      rep=lambda x: '%.2f' % x)
-        self.subsidies = Subsidies()
-        self.paymentsonaccount = PaymentsOnAccount()
-        self.reinbursableexpenses = ReinbursableExpenses()
-        self.totalfinancialexpenses = XmlField('TotalFinancialExpenses')
         self.totaloutstandingamount = XmlField('TotalOutstandingAmount',
                                                rep=lambda x: '%.2f' % x)
-        self.totalpaymentsonaccount = XmlField('TotalPaymentsOnAccount')
-        self.amountswithheld = AmountsWithheld()
         self.totalexecutableamount = XmlField('TotalExecutableAmount',
                                               rep=lambda x: '%.2f' % x)
-        self.totalreinbursableexpenses = XmlField('TotalReinbursableExpenses')
         super(InvoiceTotals, self).__init__('InvoiceTotals',
                                             'invoicetotals')
 
@@ -607,9 +687,9 @@ class ReinbursableExpenses(XmlModel):
     _sort_order = ('reinbursableexpenses', 'reinbursableexpens')
 
     def __init__(self):
-        self.reinbursableexpenses = XmlField('ReinbursableExpenses')
+        self.reinbursableexpenses = XmlField('ReimbursableExpenses')
         self.reinbursableexpens = []
-        super(ReinbursableExpenses, self).__init__('ReinbursableExpenses',
+        super(ReinbursableExpenses, self).__init__('ReimbursableExpenses',
                                                    'reinbursableexpenses')
 
 # 3.1.5.12.1
@@ -623,17 +703,17 @@ class ReinbursableExpens(XmlModel):
                    'reinbursableexpensesamount')
 
     def __init__(self):
-        self.reinbursableexpens = XmlField('ReinbursableExpenses')
+        self.reinbursableexpens = XmlField('ReimbursableExpenses')
         self.reinbursableexpensessellerparty = ReinbursableExpensesParty(
-                                            'ReinbursableExpensesSellerParty')
+                                            'ReimbursableExpensesSellerParty')
         self.reinbursableexpensesbuyerparty = ReinbursableExpensesParty(
-                                            'ReinbursableExpensesBuyerParty')
+                                            'ReimbursableExpensesBuyerParty')
         self.issuedate = XmlField('IssueDate')
         self.invoicenumber = XmlField('InvoiceNumber')
         self.invoiceseriescode = XmlField('InvoiceSeriesCode')
         self.reinbursableexpensesamount = XmlField(
-                                            'ReinbursableExpensesAmount')
-        super(ReinbursableExpens, self).__init__('ReinbursableExpenses',
+                                            'ReimbursableExpensesAmount')
+        super(ReinbursableExpens, self).__init__('ReimbursableExpenses',
                                                  'reinbursableexpens')
 
 # 3.1.5.12.1.1
@@ -643,7 +723,7 @@ class ReinbursableExpens(XmlModel):
 class ReinbursableExpensesParty(XmlModel):
 
     _sort_order = ('reinbursableexpensesparty', 'persontypecode',
-                   'residenctypecode', 'taxidentificationnumber')
+                   'residencetypecode', 'taxidentificationnumber')
 
     def __init__(self, tag):
         self.reinbursableexpensesparty = XmlField(tag)
@@ -684,7 +764,7 @@ class Items(XmlModel):
 # 3.1.6.1
 
 
-class InvoiceLine(XmlModel):
+class InvoiceLine(LazyXmlModel):
 
     _sort_order = ('invoiceline', 'issuercontractreference',
                    'issuercontractdate', 'issuertransactionreference',
@@ -699,38 +779,45 @@ class InvoiceLine(XmlModel):
                    'transactiondate', 'additionallineiteminformation',
                    'specialtaxableevent', 'articlecode')
 
+    _lazy = {
+        'issuercontractreference':
+            lambda: XmlField('IssuerContractReference'),
+        'issuercontractdate': lambda: XmlField('IssuerContractDate'),
+        'issuertransactionreference':
+            lambda: XmlField('IssuerTransactionReference'),
+        'issuertransactiondate': lambda: XmlField('IssuerTransactionDate'),
+        'receivercontractreference':
+            lambda: XmlField('ReceiverContractReference'),
+        'receivercontractdate': lambda: XmlField('ReceiverContractDate'),
+        'receivertransactionreference':
+            lambda: XmlField('ReceiverTransactionReference'),
+        'receivertransactiondate':
+            lambda: XmlField('ReceiverTransactionDate'),
+        'filereference': lambda: XmlField('FileReference'),
+        'sequencenumber': lambda: XmlField('SequenceNumber'),
+        'deliverynotesreference': lambda: DeliveryNotesReference(),
+        'unitofmeasure': lambda: XmlField('UnitOfMeasure'),
+        'discountandrebates':
+            lambda: GeneralDiscounts('DiscountsAndRebates'),
+        'charges': lambda: GeneralSurcharges('Charges'),
+        'taxeswithheld': lambda: Taxes('TaxesWithheld'),
+        'taxesoutputs': lambda: Taxes('TaxesOutputs'),
+        'lineitemperiod': lambda: LineItemPeriod(),
+        'transactiondate': lambda: XmlField('TransactionDate'),
+        'additionallineiteminformation':
+            lambda: XmlField('AdditionalLineItemInformation'),
+        'specialtaxableevent': lambda: SpecialTaxableEvent(),
+        'articlecode': lambda: XmlField('ArticleCode'),
+    }
+
     def __init__(self):
         self.invoiceline = XmlField('InvoiceLine')
-        self.issuercontractreference = XmlField('IssuerContractReference')
-        self.issuercontractdate = XmlField('IssuerContractDate')
-        self.issuertransactionreference = XmlField(
-                                            'IssuerTransactionReference')
-        self.issuertransactiondate = XmlField('IssuerTransactionDate')
-        self.receivercontractreference = XmlField('ReceiverContractReference')
-        self.receivercontractdate = XmlField('ReceiverContractDate')
-        self.receivertransactionreference = XmlField(
-                                            'ReceiverTransactionReference')
-        self.receivertransactiondate = XmlField('ReceiverTransactionDate')
-        self.filereference = XmlField('FileReference')
-        self.sequencenumber = XmlField('SequenceNumber')
-        self.deliverynotesreference = DeliveryNotesReference()
         self.itemdescription = XmlField('ItemDescription')
         self.quantity = XmlField('Quantity', rep=lambda x: '%.8f' % x)
-        self.unitofmeasure = XmlField('UnitOfMeasure')
         self.unitpricewithouttax = XmlField('UnitPriceWithoutTax',
                                             rep=lambda x: '%.8f' % x)
         self.totalcost = XmlField('TotalCost', rep=lambda x: '%.8f' % x)
-        self.discountandrebates = GeneralDiscounts('DiscountsAndRebates')
-        self.charges = GeneralSurcharges('Charges')
         self.grossamount = XmlField('GrossAmount', rep=lambda x: '%.8f' % x)
-        self.taxeswithheld = Taxes('TaxesWithheld')
-        self.taxesoutputs = Taxes('TaxesOutputs')
-        self.lineitemperiod = LineItemPeriod()
-        self.transactiondate = XmlField('TransactionDate')
-        self.additionallineiteminformation = XmlField(
-                                            'AdditionalLineItemInformation')
-        self.specialtaxableevent = SpecialTaxableEvent()
-        self.articlecode = XmlField('ArticleCode')
         super(InvoiceLine, self).__init__('InvoiceLine', 'invoiceline')
 
 # 3.1.6.1.12
@@ -806,7 +893,7 @@ class PaymentDetails(XmlModel):
 # 3.1.7.1
 
 
-class Installment(XmlModel):
+class Installment(LazyXmlModel):
 
     _sort_order = ('installment', 'installmentduedate', 'installmentamount',
                    'paymentmeans', 'accounttobecredited',
@@ -814,21 +901,25 @@ class Installment(XmlModel):
                    'collectionadditionalinformation',
                    'regulatoryreportingdata', 'debitreconciliationreference')
 
+    _lazy = {
+        'accounttobecredited': lambda: Account('AccountToBeCredited'),
+        'paymentreconciliationreference':
+            lambda: XmlField('PaymentReconciliationReference'),
+        'accounttobedebited': lambda: Account('AccountToBeDebited'),
+        'collectionadditionalinformation':
+            lambda: XmlField('CollectionAdditionalInformation'),
+        'regulatoryreportingdata':
+            lambda: XmlField('RegulatoryReportingData'),
+        'debitreconciliationreference':
+            lambda: XmlField('DebitReconciliationReference'),
+    }
+
     def __init__(self):
         self.installment = XmlField('Installment')
         self.installmentduedate = XmlField('InstallmentDueDate')
         self.installmentamount = XmlField('InstallmentAmount',
                                           rep=lambda x: '%.2f' % x)
         self.paymentmeans = XmlField('PaymentMeans')
-        self.accounttobecredited = Account('AccountToBeCredited')
-        self.paymentreconciliationreference = XmlField(
-                                            'PaymentReconciliationReference')
-        self.accounttobedebited = Account('AccountToBeDebited')
-        self.collectionadditionalinformation = XmlField(
-                                            'CollectionAdditionalInformation')
-        self.regulatoryreportingdata = XmlField('RegulatoryReportingData')
-        self.debitreconciliationreference = XmlField(
-                                            'DebitReconciliationReference')
         super(Installment, self).__init__('Installment', 'installment')
 
 # 3.1.7.1.4
@@ -852,6 +943,7 @@ class Account(XmlModel):
 class LegalLiterals(XmlModel):
 
     _sort_order = ('legalliterals', 'legalreference')
+    _cacheable = True
 
     def __init__(self):
         self.legalliterals = XmlField('LegalLiterals')
@@ -874,18 +966,21 @@ class LegalReference(XmlModel):
 # 3.1.9
 
 
-class AdditionalData(XmlModel):
+class AdditionalData(LazyXmlModel):
 
     _sort_order = ('additionaldata', 'relatedinvoice', 'relateddocuments',
                    'invoiceadditionalinformation', 'extensions')
 
+    _lazy = {
+        'relatedinvoice': lambda: XmlField('RelatedInvoice'),
+        'relateddocuments': lambda: RelatedDocuments(),
+        'invoiceadditionalinformation':
+            lambda: XmlField('InvoiceAdditionalInformation'),
+        'extensions': lambda: XmlField('Extensions'),
+    }
+
     def __init__(self):
         self.additionaldata = XmlField('AdditionalData')
-        self.relatedinvoice = XmlField('RelatedInvoice')
-        self.relateddocuments = RelatedDocuments()
-        self.invoiceadditionalinformation = XmlField(
-                                            'InvoiceAdditionalInformation')
-        self.extensions = XmlField('Extensions')
         super(AdditionalData, self).__init__('AdditionalData',
                                              'additionaldata')
 
@@ -921,3 +1016,40 @@ class Attachment(XmlModel):
         self.attachmentdata = XmlField('AttachmentData')
         super(Attachment, self).__init__('Attachment',
                                          'attachment')
+
+    def feed_data(self, data=None, path=None, fileobj=None,
+                  attachmentformat=None, compression=ZIP, description=None,
+                  name=None, stream=False):
+        """
+        Feed a document compressed and base64 encoded, with its algorithm,
+        format and encoding fields
+
+        :param data: bytes of the document
+        :param path: file name of the document
+        :param fileobj: binary file object with the document
+        :param attachmentformat: AttachmentFormat, defaults to the extension
+                                 of path
+        :param compression: AttachmentCompressionAlgorithm, ZIP, GZIP or NONE
+        :param description: AttachmentDescription
+        :param name: name of the document inside the ZIP archive
+        :param stream: feed an AttachmentSource, so the document is read
+                       and encoded when the Facturae is written instead of
+                       now
+        """
+        if attachmentformat is None and path is not None:
+            attachmentformat = os.path.splitext(path)[1][1:].lower() or None
+        if name is None and path is None and attachmentformat:
+            name = 'attachment.{0}'.format(attachmentformat)
+        if stream:
+            attachmentdata = AttachmentSource(data, path, fileobj,
+                                              compression, name)
+        else:
+            attachmentdata = encode_attachment(data, path, fileobj,
+                                               compression, name)
+        self.feed({
+            'attachmentcompressionalgorithm': compression or NONE,
+            'attachmentformat': attachmentformat,
+            'attachmentencoding': 'BASE64',
+            'attachmentdescription': description,
+            'attachmentdata': attachmentdata,
+        })
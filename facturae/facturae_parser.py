@@ -1,13 +1,453 @@
 # -*- coding: utf-8 -*-
+import hashlib
+import mmap
+import os
+import tempfile
+from collections import namedtuple
 from functools import reduce
-from lxml import objectify
+from io import BytesIO
+from lxml import etree, objectify
+
+from .attachments import (AttachmentPayload, decode_attachment,
+                          find_attachment_data, is_plain_text)
+from .records import (Address, Attachment, Invoice, InvoiceLine, Party, Tax,
+                      to_code, to_date, to_decimal, to_int)
+from . import validation
+
+
+class Field(object):
+    """
+    Text of the first element found at path, False when there is none
+
+    :param key: key of the value in the result dict
+    :param path: path relative to the parent element, defaults to key
+    :param convert: function applied to the text by the typed parser
+    :param method: name of the parser method that computes the value from
+                   the element found and the values already extracted
+    """
+
+    def __init__(self, key, path=None, convert=None, method=None):
+        self.key = key
+        self.path = path or key
+        self.convert = convert
+        self.method = method
+        self.xpath = etree.XPath(self.path)
+
+    @property
+    def is_child(self):
+        return self.method is None and '/' not in self.path
+
+    def extract(self, node, res, parser):
+        found = self.xpath(node)
+        if not found:
+            res[self.key] = None if parser.typed else False
+        elif self.method:
+            res[self.key] = getattr(parser, self.method)(found[0], res)
+        else:
+            value = found[0].text
+            if parser.typed and self.convert and value is not None:
+                value = self.convert(value)
+            res[self.key] = value
+
+    def project(self, fields):
+        return self if self.key in fields else None
+
+
+class Section(object):
+    """Entries of the first element found at path, merged in the result"""
+
+    def __init__(self, path, entries):
+        self.path = path
+        self.table = entries if isinstance(entries, Table) else Table(entries)
+        self.xpath = etree.XPath(path)
+
+    def project(self, fields):
+        table = self.table.project(fields)
+        if table is self.table:
+            return self
+        return Section(self.path, table) if table.entries else None
+
+    def extract(self, node, res, parser):
+        found = self.xpath(node)
+        if found:
+            self.table.extract(found[0], res, parser)
+
+
+class Record(object):
+    """Entries of the first element found at path, as a dict under key"""
+
+    def __init__(self, key, path, entries, record=None):
+        self.key = key
+        self.path = path
+        self.table = entries if isinstance(entries, Table) else Table(
+            entries, record=record)
+        self.xpath = etree.XPath(path)
+
+    def extract(self, node, res, parser):
+        found = self.xpath(node)
+        if found:
+            res[self.key] = self.table.parse(found[0], parser)
+
+    def project(self, fields):
+        table = self.table.project(fields)
+        if self.key in fields or table is self.table:
+            return self
+        return Record(self.key, self.path, table) if table.entries else None
+
+
+class Records(object):
+    """
+    Entries of every item element inside the container found at path, as a
+    list of dicts under key, False when there is no container
+    """
+
+    def __init__(self, key, path, item, entries, record=None):
+        self.key = key
+        self.path = path
+        self.item = item
+        self.table = entries if isinstance(entries, Table) else Table(
+            entries, record=record)
+        self.xpath = etree.XPath(path)
+        self.items = etree.XPath(item)
+
+    def extract(self, node, res, parser):
+        found = self.xpath(node)
+        if not found:
+            res[self.key] = None if parser.typed else False
+            return
+        res[self.key] = [self.table.parse(item, parser)
+                         for item in self.items(found[0])]
+
+    def project(self, fields):
+        table = self.table.project(fields)
+        if self.key in fields or table is self.table:
+            return self
+        if not table.entries:
+            return None
+        return Records(self.key, self.path, self.item, table)
+
+
+class Table(object):
+    """
+    Compiled list of entries extracted from the same element
+
+    The plain child fields are fetched together with a single XPath union,
+    the rest of the entries run their own compiled expressions.
+
+    :param entries: Field, Section, Record and Records entries
+    :param record: records class used by the typed parser instead of a dict
+    """
+
+    def __init__(self, entries, record=None):
+        self.entries = tuple(entries)
+        self.record = record
+        children = [entry for entry in self.entries
+                    if isinstance(entry, Field) and entry.is_child]
+        self.others = tuple(entry for entry in self.entries
+                            if entry not in children)
+        self.keys = dict((field.path, field.key) for field in children)
+        self.converters = dict((field.key, field.convert)
+                               for field in children if field.convert)
+        self.children = None
+        if children:
+            self.children = etree.XPath(
+                ' | '.join(field.path for field in children)
+            )
+
+    def project(self, fields):
+        """
+        Table with only the entries in fields, itself when all of them are
+
+        Fields are selected by their key, Record and Records entries by
+        their key with all their entries or by the keys of some of them,
+        and Sections by the keys of their entries.
+        """
+        entries = [entry.project(fields) for entry in self.entries]
+        if all(entry is original
+               for entry, original in zip(entries, self.entries)):
+            return self
+        return Table([entry for entry in entries if entry is not None],
+                     record=self.record)
+
+    def parse(self, node, parser):
+        """Extract the entries of node in a new dict or record"""
+        if parser.typed and self.record is not None:
+            return self.extract(node, self.record(), parser)
+        return self.extract(node, {}, parser)
+
+    def extract(self, node, res, parser):
+        """Extract the entries of node into res"""
+        if self.children is not None:
+            values = {}
+            for element in self.children(node):
+                key = self.keys[element.tag]
+                if key not in values:
+                    values[key] = element.text
+            if parser.typed:
+                for key in self.keys.values():
+                    value = values.get(key)
+                    convert = self.converters.get(key)
+                    if convert is not None and value is not None:
+                        value = convert(value)
+                    res[key] = value
+            else:
+                for key in self.keys.values():
+                    res[key] = values.get(key, False)
+        for entry in self.others:
+            entry.extract(node, res, parser)
+        return res
+
+
+HEADER_TABLE = Table([
+    Section('FileHeader', [
+        Field('SchemaVersion', convert=to_code),
+        Field('Modality', convert=to_code),
+        Field('InvoiceIssuerType', convert=to_code),
+        Section('Batch', [
+            Field('BatchIdentifier'),
+            Field('InvoicesCount', convert=to_int),
+            Field('TotalInvoicesAmount', 'TotalInvoicesAmount/TotalAmount',
+                  convert=to_decimal),
+            Field('TotalOutstandingAmount', 'TotalOutstandingAmount/TotalAmount',
+                  convert=to_decimal),
+            Field('TotalExecutableAmount', 'TotalExecutableAmount/TotalAmount',
+                  convert=to_decimal),
+            Field('InvoiceCurrencyCode', convert=to_code),
+        ]),
+    ]),
+])
+
+PARTY_TABLE = Table([
+    Section('TaxIdentification', [
+        Field('PersonTypeCode', convert=to_code),
+        Field('ResidenceTypeCode', convert=to_code),
+        Field('TaxIdentificationNumber'),
+    ]),
+    Section('LegalEntity', [
+        Field('CorporateName'),
+        Field('TradeName'),
+        Record('Address', 'AddressInSpain', [
+            Field('Street', 'Address'),
+            Field('PostCode'),
+            Field('Town'),
+            Field('Province'),
+            Field('CountryCode', convert=to_code),
+        ], record=Address),
+    ]),
+], record=Party)
+
+PARTIES_TABLE = Table([
+    Record('seller', 'Parties/SellerParty', PARTY_TABLE),
+    Record('buyer', 'Parties/BuyerParty', PARTY_TABLE),
+])
+
+TAX_TABLE = Table([
+    Field('TaxTypeCode', convert=to_code),
+    Field('TaxRate', convert=to_decimal),
+    Field('TaxableBase', 'TaxableBase/TotalAmount', convert=to_decimal),
+    Field('TaxAmount', 'TaxAmount/TotalAmount', convert=to_decimal),
+], record=Tax)
+
+LINE_TABLE = Table([
+    Field('ItemDescription'),
+    Field('Quantity', convert=to_decimal),
+    Field('UnitPriceWithoutTax', convert=to_decimal),
+    Field('TotalCost', convert=to_decimal),
+    Field('GrossAmount', convert=to_decimal),
+    Records('TaxesOutputs', 'TaxesOutputs', 'Tax', TAX_TABLE),
+], record=InvoiceLine)
+
+ATTACHMENT_TABLE = Table([
+    Field('AttachmentCompressionAlgorithm', convert=to_code),
+    Field('AttachmentFormat', convert=to_code),
+    Field('AttachmentEncoding', convert=to_code),
+    Field('AttachmentData', method='_get_attachment_data'),
+], record=Attachment)
+
+INVOICE_TABLE = Table([
+    Section('InvoiceHeader', [
+        Field('InvoiceNumber'),
+        Field('InvoiceSeriesCode'),
+        Field('InvoiceDocumentType', convert=to_code),
+        Field('InvoiceClass', convert=to_code),
+    ]),
+    Section('InvoiceIssueData', [
+        Field('IssueDate', convert=to_date),
+        Field('InvoiceCurrencyCode', convert=to_code),
+        Field('TaxCurrencyCode', convert=to_code),
+        Field('LanguageName', convert=to_code),
+    ]),
+    Records('Taxes', 'TaxesOutputs', 'Tax', TAX_TABLE),
+    Section('InvoiceTotals', [
+        Field('TotalGrossAmount', convert=to_decimal),
+        Field('TotalGrossBeforeTaxes', 'TotalGrossAmountBeforeTaxes',
+              convert=to_decimal),
+        Field('TotalTaxOutputs', convert=to_decimal),
+        Field('TotalTaxesWithheld', convert=to_decimal),
+        Field('InvoiceTotal', convert=to_decimal),
+        Field('TotalOutstandingAmount', convert=to_decimal),
+        Field('TotalExecutableAmount', convert=to_decimal),
+    ]),
+    Records('InvoiceLines', 'Items', 'InvoiceLine', LINE_TABLE),
+    Section('PaymentDetails/Installment', [
+        Field('InstallmentDueDate', convert=to_date),
+        Field('InstallmentAmount', convert=to_decimal),
+        Field('PaymentMeans', convert=to_code),
+        Section('AccountToBeDebited', [
+            Field('IBAN'),
+            Field('BIC'),
+        ]),
+    ]),
+    Section('AdditionalData', [
+        Records('Attachments', 'RelatedDocuments', 'Attachment',
+                ATTACHMENT_TABLE),
+        Field('AdditionalInformation', 'InvoiceAdditionalInformation'),
+    ]),
+], record=Invoice)
+
+TABLES = (HEADER_TABLE, PARTIES_TABLE, INVOICE_TABLE)
+
+
+def table_keys(table):
+    """Keys of the entries of a table, nested ones included"""
+    keys = set()
+    for entry in table.entries:
+        if hasattr(entry, 'key'):
+            keys.add(entry.key)
+        if hasattr(entry, 'table'):
+            keys.update(table_keys(entry.table))
+    return keys
+
+
+FIELDS = frozenset().union(*[table_keys(table) for table in TABLES])
+
+
+def skipped_paths(table, fields, prefix=()):
+    """
+    Paths, as tuples of tags, of the subtrees read by the entries of a table
+    that no key in fields selects
+    """
+    res = []
+    for entry in table.entries:
+        if isinstance(entry, Field) or getattr(entry, 'key', None) in fields:
+            continue
+        path = prefix + tuple(entry.path.split('/'))
+        if not table_keys(entry.table) & fields:
+            res.append(path)
+            continue
+        if isinstance(entry, Records):
+            path += (entry.item,)
+        res.extend(skipped_paths(entry.table, fields, path))
+    return res
+
+
+class Projection(object):
+    """
+    Tables of the header, parties and invoices restricted to some fields
+
+    :ivar skipped: paths of the invoice subtrees not read, inside the Invoice
+                   element, by their last tag
+    """
+
+    def __init__(self, fields=None):
+        """
+        :param fields: keys of the values to extract, as returned by the
+                       parser, None for all of them
+        :raises ValueError: when some key is not one the parser returns
+        """
+        if fields is None:
+            self.fields = FIELDS
+            self.header, self.parties, self.invoice = TABLES
+            self.skipped = {}
+            return
+
+        self.fields = frozenset(fields)
+        unknown = self.fields - FIELDS
+        if unknown:
+            raise ValueError('Unknown fields: {0}'.format(
+                ', '.join(sorted(unknown))))
+        self.header, self.parties, self.invoice = [
+            table.project(self.fields) for table in TABLES]
+        self.skipped = {}
+        for path in skipped_paths(INVOICE_TABLE, self.fields):
+            self.skipped.setdefault(path[-1], []).append(path)
+
+
+def _describe(table, res):
+    """Append the structure of a table to the list res"""
+    res.append(table.record.__name__ if table.record else None)
+    res.append(table.record._keys if table.record else None)
+    for entry in table.entries:
+        res.append((type(entry).__name__, getattr(entry, 'key', None),
+                    entry.path, getattr(entry, 'item', None),
+                    getattr(getattr(entry, 'convert', None), '__name__', None),
+                    getattr(entry, 'method', None)))
+        if hasattr(entry, 'table'):
+            _describe(entry.table, res)
+            res.append(None)
+    return res
+
+
+def tables_fingerprint():
+    """
+    SHA-256 of the structure of the extraction tables, it changes whenever
+    the values extracted do
+    """
+    res = []
+    for table in TABLES:
+        _describe(table, res)
+    return hashlib.sha256(repr(res).encode('utf-8')).hexdigest()
+
+
+ALL_FIELDS = Projection()
+_projections = {}
+
+
+def projection(fields):
+    """Projection of fields, shared by every parser asking for the same"""
+    if fields is None:
+        return ALL_FIELDS
+    key = frozenset(fields)
+    res = _projections.get(key)
+    if res is None:
+        res = _projections[key] = Projection(key)
+    return res
 
 
 class FacturaeParser(object):
 
-    def __init__(self, xml_data):
-        """Construir Facturae Parser"""
+    lazy_attachments = False
+    decompress_attachments = False
+    typed = False
+    projection = ALL_FIELDS
+
+    def __init__(self, xml_data, lazy_attachments=False, typed=False,
+                 fields=None, decompress_attachments=False):
+        """
+        Construir Facturae Parser
+
+        :param xml_data: Facturae document
+        :param lazy_attachments: return the AttachmentData as an
+                                 AttachmentPayload handle instead of text
+        :param decompress_attachments: return the AttachmentData as the bytes
+                                       of the attached document, decoded and
+                                       decompressed according to its
+                                       AttachmentCompressionAlgorithm
+        :param typed: return records with converted values (Decimal, date,
+                      int) and None for the missing ones instead of dicts
+        :param fields: keys of the values to extract, like 'InvoiceTotal' or
+                       'seller', by default all of them. The elements only
+                       read by other keys are never visited, the dicts
+                       returned leave their keys out and the records set
+                       them to None
+        :raises ValueError: when fields has a key the parser doesn't return
+        """
         self.xml_data = xml_data
+        self.lazy_attachments = lazy_attachments
+        self.decompress_attachments = decompress_attachments
+        self.typed = typed
+        self.projection = projection(fields)
+        self._attachment_offsets = None
         try:
             self.xml_obj = objectify.fromstring(self.xml_data)
             self.xml_dict = self.parse_xml()
@@ -23,6 +463,43 @@ class FacturaeParser(object):
         except:
             print('Something went really wrong.')
 
+    @classmethod
+    def iter_invoices(cls, source, chunk_size=None, lazy_attachments=False,
+                      typed=False, validate=False, fields=None,
+                      decompress_attachments=False):
+        """
+        Parse a Facturae document incrementally
+
+        :param source: file name or file-like object with the document
+        :param chunk_size: bytes read from the source on every step
+        :param lazy_attachments: return the AttachmentData as an
+                                 AttachmentPayload handle instead of text
+        :param decompress_attachments: return the AttachmentData as the bytes
+                                       of the attached document, see
+                                       FacturaeParser
+        :param typed: yield Invoice records instead of dicts
+        :param validate: validate the document against the Facturae schema
+                         while it is parsed
+        :param fields: keys of the values to extract, see FacturaeParser. The
+                       invoice subtrees they don't read are dropped as soon
+                       as they are parsed
+        :return: FacturaeStreamParser with the FileHeader and Parties data
+                 already parsed, iterable over the invoices
+        """
+        return FacturaeStreamParser(
+            source, chunk_size=chunk_size, lazy_attachments=lazy_attachments,
+            typed=typed, validate=validate, fields=fields,
+            decompress_attachments=decompress_attachments
+        )
+
+    def validate(self, version=validation.DEFAULT_VERSION):
+        """
+        Validate the parsed document against the Facturae schema
+
+        :return: list of ValidationError, empty when the document is valid
+        """
+        return validation.validate(self.xml_obj, version)
+
     def parse_xml(self):
         res = {}
 
@@ -33,254 +510,294 @@ class FacturaeParser(object):
         return res
 
     def get_header_dict(self, xml_obj):
-        res = {}
-
-        header = xml_obj.find('FileHeader')
-        batch = header.find('Batch')
-
-        if header is not None:
-            res.update({
-                'SchemaVersion': header.SchemaVersion.text if header.find(
-                    'SchemaVersion') is not None else False,
-                'Modality': header.Modality.text if header.find(
-                    'Modality') is not None else False,
-                'InvoiceIssuerType': header.InvoiceIssuerType.text if header.find(
-                    'InvoiceIssuerType') is not None else False,
-            })
-
-        if batch is not None:
-            res.update({
-                'BatchIdentifier': batch.BatchIdentifier.text if batch.find(
-                    'BatchIdentifier') is not None else False,
-                'InvoicesCount': batch.InvoicesCount.text if batch.find(
-                    'InvoicesCount') is not None else False,
-                'TotalInvoicesAmount': batch.TotalInvoicesAmount.TotalAmount.text if batch.find(
-                    'TotalInvoicesAmount') is not None else False,
-                'TotalOutstandingAmount': batch.TotalOutstandingAmount.TotalAmount.text if batch.find(
-                    'TotalOutstandingAmount') is not None else False,
-                'TotalExecutableAmount': batch.TotalExecutableAmount.TotalAmount.text if batch.find(
-                    'TotalExecutableAmount') is not None else False,
-                'InvoiceCurrencyCode': batch.InvoiceCurrencyCode.text if batch.find(
-                    'InvoiceCurrencyCode') is not None else False,
-            })
-
-        return res
+        return self.projection.header.parse(xml_obj, self)
 
     def get_parties_dict(self, xml_obj):
-        res = {'seller': {}, 'buyer': {}}
-        parties = xml_obj.find('Parties')
-
-        if parties is not None:
-            seller = parties.SellerParty
-            buyer = parties.BuyerParty
-
-            if seller is not None:
-                res['seller'] = self._get_party_data(seller)
-
-            if buyer is not None:
-                res['buyer'] = self._get_party_data(buyer)
-
-        return res
+        if self.typed:
+            res = {'seller': None, 'buyer': None}
+        else:
+            res = {'seller': {}, 'buyer': {}}
+        return self.projection.parties.extract(xml_obj, res, self)
 
     def _get_party_data(self, party):
-        res = {}
-
-        tax_identification = party.find('TaxIdentification')
-        legal_entity = party.find('LegalEntity')
-
-        if tax_identification is not None:
-            res.update({
-                'PersonTypeCode': tax_identification.PersonTypeCode.text if tax_identification.find(
-                    'PersonTypeCode') is not None else False,
-                'ResidenceTypeCode': tax_identification.ResidenceTypeCode.text if tax_identification.find(
-                    'ResidenceTypeCode') is not None else False,
-                'TaxIdentificationNumber': tax_identification.TaxIdentificationNumber.text if tax_identification.find(
-                    'TaxIdentificationNumber') is not None else False,
-            })
-
-        if legal_entity is not None:
-            res.update({
-                'CorporateName': legal_entity.CorporateName.text if legal_entity.find(
-                    'CorporateName') is not None else False,
-                'TradeName': legal_entity.TradeName.text if legal_entity.find(
-                    'TradeName') is not None else False,
-            })
-
-            party_address = legal_entity.find('AddressInSpain')
-
-            if party_address is not None:
-                res.update({
-                    'Address': {
-                        'Street': party_address.Address.text if party_address.find(
-                            'Address') is not None else False,
-                        'PostCode': party_address.PostCode.text if party_address.find(
-                            'PostCode') is not None else False,
-                        'Town': party_address.Town.text if party_address.find(
-                            'Town') is not None else False,
-                        'Province': party_address.Province.text if party_address.find(
-                            'Province') is not None else False,
-                        'CountryCode': party_address.CountryCode.text if party_address.find(
-                            'CountryCode') is not None else False,
-                    }
-                })
-
-        return res
+        return PARTY_TABLE.parse(party, self)
 
     def get_invoices_dict(self, xml_obj):
         res = {'Invoices': []}
         invoices = xml_obj.find('Invoices')
 
         for invoice in invoices.findall('Invoice'):
-            invoice_res = {}
-
-            invoice_header = invoice.find('InvoiceHeader')
-            if invoice_header is not None:
-                invoice_res.update({
-                    'InvoiceNumber': invoice_header.InvoiceNumber.text if invoice_header.find(
-                        'InvoiceNumber') is not None else False,
-                    'InvoiceSeriesCode': invoice_header.InvoiceSeriesCode.text if invoice_header.find(
-                        'InvoiceSeriesCode') is not None else False,
-                    'InvoiceDocumentType': invoice_header.InvoiceDocumentType.text if invoice_header.find(
-                        'InvoiceDocumentType') is not None else False,
-                    'InvoiceClass': invoice_header.InvoiceClass.text if invoice_header.find(
-                        'InvoiceClass') is not None else False,
-                })
-
-            invoice_issue_data = invoice.find('InvoiceIssueData')
-            if invoice_issue_data is not None:
-                invoice_res.update({
-                    'IssueDate': invoice_issue_data.IssueDate.text if invoice_issue_data.find(
-                        'IssueDate') is not None else False,
-                    'InvoiceCurrencyCode': invoice_issue_data.InvoiceCurrencyCode.text if invoice_issue_data.find(
-                        'InvoiceCurrencyCode') is not None else False,
-                    'TaxCurrencyCode': invoice_issue_data.TaxCurrencyCode.text if invoice_issue_data.find(
-                        'TaxCurrencyCode') is not None else False,
-                    'LanguageName': invoice_issue_data.LanguageName.text if invoice_issue_data.find(
-                        'LanguageName') is not None else False,
-                })
-
-            invoice_res.update({
-                'Taxes': self._get_taxes(invoice.TaxesOutputs) if invoice.find('TaxesOutputs') is not None else False,
-            })
-
-            invoice_totals = invoice.find('InvoiceTotals')
-            if invoice_totals is not None:
-                invoice_res.update({
-                    'TotalGrossAmount': invoice_totals.TotalGrossAmount.text if invoice_totals.find(
-                        'TotalGrossAmount') is not None else False,
-                    'TotalGrossBeforeTaxes': invoice_totals.TotalGrossAmountBeforeTaxes.text if invoice_totals.find(
-                        'TotalGrossAmountBeforeTaxes') is not None else False,
-                    'TotalTaxOutputs': invoice_totals.TotalTaxOutputs.text if invoice_totals.find(
-                        'TotalTaxOutputs') is not None else False,
-                    'TotalTaxesWithheld': invoice_totals.TotalTaxesWithheld.text if invoice_totals.find(
-                        'TotalTaxesWithheld') is not None else False,
-                    'InvoiceTotal': invoice_totals.InvoiceTotal.text if invoice_totals.find(
-                        'InvoiceTotal') is not None else False,
-                    'TotalOutstandingAmount': invoice_totals.TotalOutstandingAmount.text if invoice_totals.find(
-                        'TotalOutstandingAmount') is not None else False,
-                    'TotalExecutableAmount': invoice_totals.TotalExecutableAmount.text if invoice_totals.find(
-                        'TotalExecutableAmount') is not None else False,
-                })
-
-            invoice_res.update({
-                'InvoiceLines': self._get_invoice_lines(invoice.Items) if invoice.find(
-                    'Items') is not None else False,
-            })
-
-            payment_details = invoice.find('PaymentDetails')
-            if payment_details is not None:
-                installment = payment_details.find('Installment')
-                if installment is not None:
-                    invoice_res.update({
-                        'InstallmentDueDate': installment.InstallmentDueDate.text if installment.find(
-                            'InstallmentDueDate') is not None else False,
-                        'InstallmentAmount': installment.InstallmentAmount.text if installment.find(
-                            'InstallmentAmount') is not None else False,
-                        'PaymentMeans': installment.PaymentMeans.text if installment.find(
-                            'PaymentMeans') is not None else False,
-                    })
-
-                    bank_account = installment.find('AccountToBeDebited')
-                    if bank_account is not None:
-                        invoice_res.update({
-                            'IBAN': bank_account.IBAN.text if bank_account.find(
-                                'IBAN') is not None else False,
-                            'BIC': bank_account.BIC.text if bank_account.find(
-                                'BIC') is not None else False,
-                        })
-
-            additional_data = invoice.find('AdditionalData')
-            if additional_data is not None:
-                invoice_res.update({
-                    'Attachments': self._get_attachments(additional_data.RelatedDocuments) if additional_data.find(
-                        'RelatedDocuments') is not None else False,
-                    'AdditionalInformation': additional_data.InvoiceAdditionalInformation.text if additional_data.find(
-                        'InvoiceAdditionalInformation') is not None else False,
-                })
-
-            res['Invoices'].append(invoice_res)
+            res['Invoices'].append(self.get_invoice_dict(invoice))
 
         return res
 
-    def _get_taxes(self, taxes):
-        res = []
-
-        for tax in taxes.findall('Tax'):
-            tax_res = {
-                'TaxTypeCode': tax.TaxTypeCode.text if tax.find(
-                    'TaxTypeCode') is not None else False,
-                'TaxRate': tax.TaxRate.text if tax.find(
-                    'TaxRate') is not None else False,
-                'TaxableBase': tax.TaxableBase.TotalAmount.text if tax.find(
-                    'TaxableBase') is not None else False,
-                'TaxAmount': tax.TaxAmount.TotalAmount.text if tax.find(
-                    'TaxAmount') is not None else False,
-            }
-            res.append(tax_res)
+    def get_invoice_dict(self, invoice):
+        return self.projection.invoice.parse(invoice, self)
 
-        return res
+    def _get_taxes(self, taxes):
+        return [TAX_TABLE.parse(tax, self) for tax in taxes.findall('Tax')]
 
     def _get_invoice_lines(self, items):
-        res = []
-
-        for line in items.findall('InvoiceLine'):
-            line_res = {
-                'ItemDescription': line.ItemDescription.text if line.find(
-                    'ItemDescription') is not None else False,
-                'Quantity': line.Quantity.text if line.find(
-                    'Quantity') is not None else False,
-                'UnitPriceWithoutTax': line.UnitPriceWithoutTax.text if line.find(
-                    'UnitPriceWithoutTax') is not None else False,
-                'TotalCost': line.TotalCost.text if line.find(
-                    'TotalCost') is not None else False,
-                'GrossAmount': line.GrossAmount.text if line.find(
-                    'GrossAmount') is not None else False,
-                'TaxesOutputs': self._get_taxes(line.TaxesOutputs) if line.find(
-                    'TaxesOutputs') is not None else False,
-            }
-            res.append(line_res)
-
-        return res
+        return [LINE_TABLE.parse(line, self)
+                for line in items.findall('InvoiceLine')]
 
     def _get_attachments(self, related_documents):
-        res = []
-
-        for attachment in related_documents.findall('Attachment'):
-            attachment_res = {
-                'AttachmentCompressionAlgorithm': attachment.AttachmentCompressionAlgorithm.text if attachment.find(
-                    'AttachmentCompressionAlgorithm') is not None else False,
-                'AttachmentFormat': attachment.AttachmentFormat.text if attachment.find(
-                    'AttachmentFormat') is not None else False,
-                'AttachmentEncoding': attachment.AttachmentEncoding.text if attachment.find(
-                    'AttachmentEncoding') is not None else False,
-                'AttachmentData': attachment.AttachmentData.text if attachment.find(
-                    'AttachmentData') is not None else False,
-            }
-            res.append(attachment_res)
-
-        return res
+        return [ATTACHMENT_TABLE.parse(attachment, self)
+                for attachment in related_documents.findall('Attachment')]
+
+    def _get_attachment_data(self, attachment_data, attachment_res):
+        if self.lazy_attachments:
+            return self._get_attachment_payload(attachment_data,
+                                                attachment_res)
+        if self.decompress_attachments:
+            # Read from the Attachment, fields may leave them out of res
+            attachment = attachment_data.getparent()
+            return decode_attachment(
+                attachment_data.text or '',
+                attachment.findtext('AttachmentEncoding'),
+                attachment.findtext('AttachmentCompressionAlgorithm'))
+        return attachment_data.text
+
+    def _get_attachment_payload(self, attachment_data, attachment_res):
+        """Handle over the AttachmentData text of the in-memory document"""
+        if self._attachment_offsets is None:
+            self._attachment_offsets = {}
+            self._attachment_elements = []
+            pos = 0
+            for element in self.xml_obj.iter('AttachmentData'):
+                region = find_attachment_data(self.xml_data, pos)
+                if region is None:
+                    break
+                self._attachment_elements.append(element)
+                self._attachment_offsets[id(element)] = region
+                pos = region[1]
+
+        metadata = self._get_attachment_metadata(attachment_data)
+        region = self._attachment_offsets.get(id(attachment_data))
+        if region is not None and is_plain_text(self.xml_data, *region):
+            return AttachmentPayload(*region, buf=self.xml_data, **metadata)
+
+        text = attachment_data.text or ''
+        return AttachmentPayload(0, len(text), buf=text, **metadata)
+
+    def _get_attachment_metadata(self, attachment_data):
+        # Read from the Attachment, fields may leave them out of res
+        attachment = attachment_data.getparent()
+        return {
+            'compression': attachment.findtext('AttachmentCompressionAlgorithm'),
+            'format': attachment.findtext('AttachmentFormat'),
+            'encoding': attachment.findtext('AttachmentEncoding'),
+        }
 
     def _get_from_dict(self,dataDict, mapList):
         """Iterate nested dictionary"""
-        return reduce(dict.get, mapList, dataDict)
-
+        return reduce(
+            lambda data, key: data.get(key) if data is not None else None,
+            mapList, dataDict
+        )
+
+
+class FacturaeStreamParser(FacturaeParser):
+    """
+    Incremental Facturae parser
+
+    The FileHeader and Parties sections are parsed on construction, the
+    invoices are parsed one at a time while iterating and their subtrees are
+    cleared once processed, so memory stays bounded by a single invoice.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, source, chunk_size=None, lazy_attachments=False,
+                 typed=False, validate=False, fields=None,
+                 decompress_attachments=False):
+        """
+        Construir Facturae Stream Parser
+
+        With validate the document is checked against the Facturae schema
+        as it is read. Violations raise InvalidDocument while iterating, at
+        the latest once the end of the document is reached.
+        """
+        self.source = source
+        self.chunk_size = chunk_size or self.CHUNK_SIZE
+        self.lazy_attachments = lazy_attachments
+        self.decompress_attachments = decompress_attachments
+        self.typed = typed
+        self.projection = projection(fields)
+        if hasattr(source, 'read'):
+            self._file = source
+            self._close_file = False
+        else:
+            self._file = open(source, 'rb')
+            self._close_file = True
+        self._attachment_map = None
+        self._attachment_pos = 0
+        self._spill = None
+
+        self._parser = etree.XMLPullParser(
+            events=('start', 'end'),
+            tag=('Parties', 'Invoices', 'Invoice') +
+            tuple(self.projection.skipped),
+            remove_blank_text=True, huge_tree=True,
+            schema=validation.get_schema() if validate else None
+        )
+        self._parser.set_element_class_lookup(
+            objectify.ObjectifyElementClassLookup()
+        )
+        self._events = self._read_events()
+        self._root = None
+
+        self.xml_obj = None
+        for event, element in self._events:
+            if ((event == 'end' and element.tag == 'Parties') or
+                    (event == 'start' and element.tag == 'Invoices')):
+                self.xml_obj = element.getparent()
+                break
+        else:
+            self.xml_obj = self._root
+
+        self.xml_dict = {}
+        self.xml_dict.update(self.get_header_dict(self.xml_obj))
+        self.xml_dict.update(self.get_parties_dict(self.xml_obj))
+        self.sollicitud = self.xml_dict.get('BatchIdentifier', False)
+        self.num_factures = self.xml_dict.get('InvoicesCount', False)
+        self.total_factures = self.xml_dict.get('TotalInvoicesAmount', False)
+        self.seller = self.xml_dict.get('seller', False)
+        self.buyer = self.xml_dict.get('buyer', False)
+        self.issuer_type = self.xml_dict.get('InvoiceIssuerType')
+        self.vat_source = self._get_from_dict(self.xml_dict, ['seller', 'TaxIdentificationNumber'])
+        self.vat_destination = self._get_from_dict(self.xml_dict, ['buyer', 'TaxIdentificationNumber'])
+
+    def _read_events(self):
+        """Feed the source to the pull parser and yield its events"""
+        try:
+            while True:
+                data = self._file.read(self.chunk_size)
+                if not data:
+                    break
+                self._parser.feed(data)
+                for event in self._parser.read_events():
+                    yield event
+            self._root = self._parser.close()
+            for event in self._parser.read_events():
+                yield event
+        except etree.XMLSyntaxError as e:
+            errors = [validation.ValidationError.from_log_entry(entry)
+                      for entry in e.error_log
+                      if entry.domain_name == 'SCHEMASV']
+            if errors:
+                raise validation.InvalidDocument(errors)
+            raise
+        finally:
+            self.close()
+
+    def __iter__(self):
+        for event, element in self._events:
+            if event != 'end':
+                continue
+            if element.tag != 'Invoice':
+                self._skip(element)
+                continue
+            invoices = element.getparent()
+            if invoices is None or invoices.tag != 'Invoices':
+                continue
+
+            invoice = self.get_invoice_dict(element)
+
+            element.clear()
+            # objectify indexes siblings, remove the processed invoices
+            # through the etree API
+            previous = element.getprevious()
+            while previous is not None:
+                invoices.remove(previous)
+                previous = element.getprevious()
+
+            yield invoice
+
+    def _skip(self, element):
+        """Drop an invoice subtree the projection doesn't read"""
+        parent = element.getparent()
+        for path in self.projection.skipped.get(element.tag, ()):
+            node = parent
+            for tag in reversed(path[:-1]):
+                if node is None or node.tag != tag:
+                    break
+                node = node.getparent()
+            else:
+                if node is not None and node.tag == 'Invoice':
+                    element.clear()
+                    parent.remove(element)
+                    return
+
+    def _get_attachment_payload(self, attachment_data, attachment_res):
+        """
+        Handle over the AttachmentData text
+
+        When the source is a file name the handle points into it, otherwise
+        the text is spilled to a temporary file shared by the whole document.
+        """
+        metadata = self._get_attachment_metadata(attachment_data)
+
+        if self._close_file:
+            if self._attachment_map is None:
+                self._attachment_map = mmap.mmap(
+                    self._file.fileno(), 0, access=mmap.ACCESS_READ
+                )
+            region = find_attachment_data(self._attachment_map,
+                                          self._attachment_pos)
+            if region is not None:
+                self._attachment_pos = region[1]
+                if is_plain_text(self._attachment_map, *region):
+                    return AttachmentPayload(*region,
+                                             path=os.path.abspath(self.source),
+                                             **metadata)
+
+        if self._spill is None:
+            self._spill = tempfile.TemporaryFile()
+        return AttachmentPayload.spill(attachment_data.text or '',
+                                       self._spill, **metadata)
+
+    def close(self):
+        """Close the source if it was opened by the parser"""
+        if self._attachment_map is not None:
+            self._attachment_map.close()
+            self._attachment_map = None
+        if self._close_file and not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class Header(namedtuple('Header', ['sollicitud', 'num_factures',
+                                   'total_factures', 'issuer_type',
+                                   'vat_source', 'vat_destination'])):
+    """Header values of a document, as the FacturaeParser attributes"""
+
+    __slots__ = ()
+
+
+HEADER_FIELDS = ('BatchIdentifier', 'InvoicesCount', 'TotalInvoicesAmount',
+                 'InvoiceIssuerType', 'TaxIdentificationNumber')
+
+
+def peek_header(source, typed=False, chunk_size=8 * 1024):
+    """
+    Header values of a document, reading it only up to the end of Parties
+
+    :param source: file name, file-like object or the document bytes
+    :param typed: return the values converted, as FacturaeParser with typed
+    :param chunk_size: bytes read from the source on every step
+    :return: Header
+    """
+    if isinstance(source, bytes) and source[:64].lstrip().startswith(
+            (b'<', b'\xef\xbb\xbf')):
+        source = BytesIO(source)
+    with FacturaeStreamParser(source, chunk_size=chunk_size, typed=typed,
+                              fields=HEADER_FIELDS) as stream:
+        return Header(stream.sollicitud, stream.num_factures,
+                      stream.total_factures, stream.issuer_type,
+                      stream.vat_source, stream.vat_destination)
@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+"""
+Seeded generator of synthetic Facturae 3.2.1 documents
+
+    $ python -m facturae.generator --files 100 --invoices 10 -o corpus/
+    $ python -m facturae.generator --invoices 100000 -o batch.xml
+
+The same seed always produces the same documents. Amounts are computed with
+Decimal so lines, taxes, invoice totals and batch totals add up.
+"""
+import argparse
+import binascii
+import base64
+import os
+import random
+import sys
+from collections import OrderedDict
+from datetime import date, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+from . import facturae
+from .writer import FacturaeWriter
+
+CENTS = Decimal('0.01')
+TAX_RATES = (Decimal('21'), Decimal('10'), Decimal('4'))
+UNITS = ('Energia', 'Potencia', 'Alquiler equipo', 'Servicio', 'Material')
+TOWNS = (('08001', 'BARCELONA', 'Barcelona'), ('17001', 'GIRONA', 'Girona'),
+         ('28001', 'MADRID', 'Madrid'), ('46001', 'VALENCIA', 'Valencia'),
+         ('41001', 'SEVILLA', 'Sevilla'))
+STREETS = ('CALLE MAYOR', 'AVENIDA DIAGONAL', 'PLAZA CATALUNYA',
+           'CALLE NUEVA', 'PASEO DEL PRADO')
+COMPANIES = ('ELECTRICA', 'DISTRIBUIDORA', 'COMERCIALIZADORA', 'ENERGIAS',
+             'SUMINISTROS', 'SERVICIOS')
+CIF_TYPES = 'ABG'
+
+
+class Random(random.Random):
+    """
+    Random with randint and choice built on random(), so a seed gives the
+    same documents on Python 2 and 3
+    """
+
+    def randint(self, a, b):
+        return a + int(self.random() * (b - a + 1))
+
+    def choice(self, seq):
+        return seq[int(self.random() * len(seq))]
+
+
+def money(value):
+    return value.quantize(CENTS, rounding=ROUND_HALF_UP)
+
+
+def invoice_number(index):
+    return 'F{0:09d}'.format(index)
+
+
+def cif(rng):
+    """Random Spanish CIF with a valid control digit"""
+    digits = [rng.randint(0, 9) for _ in range(7)]
+    even = sum(digits[1::2])
+    odd = sum(sum(divmod(digit * 2, 10)) for digit in digits[0::2])
+    control = (10 - (even + odd) % 10) % 10
+    return '{0}{1}{2}'.format(rng.choice(CIF_TYPES),
+                              ''.join(str(d) for d in digits), control)
+
+
+def iban(rng):
+    """Random Spanish IBAN with valid check digits"""
+    account = ''.join(str(rng.randint(0, 9)) for _ in range(20))
+    check = 98 - int(account + '142800') % 97
+    return 'ES{0:02d}{1}'.format(check, account)
+
+
+class FacturaeGenerator(object):
+    """
+    Synthetic Facturae documents
+
+    :param seed: seed of the generated data
+    :param lines: (min, max) number of lines per invoice
+    :param attachment_size: bytes of the PDF attached to every invoice,
+                            0 for no attachment
+    :param issue_date: issue date of the first invoice
+    """
+
+    def __init__(self, seed=0, lines=(1, 10), attachment_size=0,
+                 issue_date=date(2019, 1, 1)):
+        self.seed = seed
+        self.lines = lines
+        self.attachment_size = attachment_size
+        self.issue_date = issue_date
+
+        rng = Random(seed)
+        self.seller = self._party_data(rng)
+
+    def _rng(self, index, stream=0):
+        return Random((self.seed * 1000003 + index) * 4 + stream)
+
+    def _party_data(self, rng):
+        postcode, town, province = rng.choice(TOWNS)
+        name = '{0} {1}, S.A.'.format(rng.choice(COMPANIES),
+                                      rng.choice(TOWNS)[1])
+        return {
+            'vat': cif(rng),
+            'name': name,
+            'address': '{0} {1}'.format(rng.choice(STREETS),
+                                        rng.randint(1, 200)),
+            'postcode': postcode,
+            'town': town,
+            'province': province,
+        }
+
+    def buyer(self, index):
+        """Buyer of the batch starting at invoice index"""
+        return self._party_data(self._rng(index, stream=1))
+
+    def invoice_data(self, index):
+        """
+        Plain data of the invoice number index, without model objects
+
+        :return: dict with the invoice lines, the taxes grouped by rate and
+                 the invoice totals
+        """
+        rng = self._rng(index)
+        lines, tax_list, gross, tax_total = self._amounts(rng)
+        issue_date = self.issue_date + timedelta(days=index % 365)
+
+        return {
+            'number': invoice_number(index),
+            'issue_date': issue_date,
+            'due_date': issue_date + timedelta(days=30),
+            'lines': lines,
+            'taxes': tax_list,
+            'gross': gross,
+            'tax_total': tax_total,
+            'total': gross + tax_total,
+            'iban': iban(rng),
+        }
+
+    def _amounts(self, rng):
+        """
+        Lines, taxes grouped by rate, gross and tax totals of an invoice,
+        drawn from its rng
+        """
+        lines = []
+        taxes = OrderedDict()
+        for _ in range(rng.randint(*self.lines)):
+            quantity = Decimal(rng.randint(1, 100000)) / 100
+            price = Decimal(rng.randint(1, 2000000)) / 1000000
+            total = money(quantity * price)
+            rate = rng.choice(TAX_RATES)
+            lines.append({
+                'description': rng.choice(UNITS),
+                'quantity': quantity,
+                'price': price,
+                'total': total,
+                'rate': rate,
+            })
+            taxes[rate] = taxes.get(rate, Decimal('0')) + total
+
+        gross = sum((line['total'] for line in lines), Decimal('0'))
+        tax_list = [{'rate': rate, 'base': base, 'amount': money(base * rate / 100)}
+                    for rate, base in taxes.items()]
+        tax_total = sum((tax['amount'] for tax in tax_list), Decimal('0'))
+        return lines, tax_list, gross, tax_total
+
+    def invoice_total(self, index):
+        """Total amount of the invoice number index, drawing its lines only"""
+        _, _, gross, tax_total = self._amounts(self._rng(index))
+        return gross + tax_total
+
+    def attachment_data(self, index):
+        """Base64 of the PDF attached to the invoice number index"""
+        rng = self._rng(index, stream=2)
+        block_size = min(self.attachment_size, 4096)
+        block = binascii.unhexlify(
+            '{0:0{1}x}'.format(rng.getrandbits(block_size * 8), block_size * 2)
+        )
+        header = b'%PDF-1.4\n'
+        body_size = max(self.attachment_size - len(header), 0)
+        body = (block * (body_size // len(block) + 1))[:body_size]
+        return base64.b64encode(header + body).decode('ascii')
+
+    def _tax(self, rate, base, amount=None):
+        tax = facturae.Tax()
+        tax.feed({'taxtypecode': '01', 'taxrate': rate})
+        tax.taxablebase.feed({'totalamount': base})
+        if amount is not None:
+            tax.taxamount.feed({'totalamount': amount})
+        return tax
+
+    def invoice(self, index):
+        """Fed Invoice model of the invoice number index"""
+        data = self.invoice_data(index)
+
+        invoice = facturae.Invoice()
+        invoice.invoiceheader.feed({
+            'invoicenumber': data['number'],
+            'invoicedocumenttype': 'FC',
+            'invoiceclass': 'OO',
+        })
+        invoice.invoiceissuedata.feed({
+            'issuedate': data['issue_date'].isoformat(),
+            'invoicecurrencycode': 'EUR',
+            'taxcurrencycode': 'EUR',
+            'languagename': 'es',
+        })
+        invoice.taxesoutputs.feed({'tax': [
+            self._tax(tax['rate'], tax['base'], tax['amount'])
+            for tax in data['taxes']
+        ]})
+        invoice.invoicetotals.feed({
+            'totalgrossamount': data['gross'],
+            'totalgrossamountbeforetaxes': data['gross'],
+            'totaltaxoutputs': data['tax_total'],
+            'totaltaxeswithheld': Decimal('0'),
+            'invoicetotal': data['total'],
+            'totaloutstandingamount': data['total'],
+            'totalexecutableamount': data['total'],
+        })
+
+        lines = []
+        for line_data in data['lines']:
+            line = facturae.InvoiceLine()
+            line.feed({
+                'itemdescription': line_data['description'],
+                'quantity': line_data['quantity'],
+                'unitpricewithouttax': line_data['price'],
+                'totalcost': line_data['total'],
+                'grossamount': line_data['total'],
+            })
+            line.taxesoutputs.feed({'tax': [
+                self._tax(line_data['rate'], line_data['total'])
+            ]})
+            lines.append(line)
+        invoice.items.feed({'invoiceline': lines})
+
+        installment = facturae.Installment()
+        installment.feed({
+            'installmentduedate': data['due_date'].isoformat(),
+            'installmentamount': data['total'],
+            'paymentmeans': '02',
+        })
+        installment.accounttobedebited.feed({'iban': data['iban']})
+        invoice.paymentdetails.feed({'installment': [installment]})
+
+        if self.attachment_size:
+            attachment = facturae.Attachment()
+            attachment.feed({
+                'attachmentcompressionalgorithm': 'NONE',
+                'attachmentformat': 'pdf',
+                'attachmentencoding': 'BASE64',
+                'attachmentdescription': 'Factura {0}'.format(data['number']),
+                'attachmentdata': self.attachment_data(index),
+            })
+            invoice.additionaldata.relateddocuments.feed({
+                'attachment': [attachment]
+            })
+
+        return invoice
+
+    def _party(self, tag, data):
+        party = facturae.Party(tag)
+        party.taxidentification.feed({
+            'persontypecode': 'J',
+            'residencetypecode': 'R',
+            'taxidentificationnumber': data['vat'],
+        })
+        party.legalentity.feed({
+            'corporatename': data['name'],
+            'tradename': data['name'],
+        })
+        party.legalentity.addressinspain.feed({
+            'address': data['address'],
+            'postcode': data['postcode'],
+            'town': data['town'],
+            'province': data['province'],
+            'countrycode': 'ESP',
+        })
+        return party
+
+    def batch_totals(self, invoices, start=0):
+        """Number of invoices and total amount of a batch"""
+        total = Decimal('0')
+        for index in range(start, start + invoices):
+            total += self.invoice_total(index)
+        return invoices, total
+
+    def header(self, invoices, start=0, total=None):
+        """Fed FileHeader and Parties models of a batch"""
+        if total is None:
+            invoices, total = self.batch_totals(invoices, start)
+
+        fileheader = facturae.FileHeader()
+        fileheader.feed({
+            'schemaversion': '3.2.1',
+            'modality': 'I' if invoices == 1 else 'L',
+            'invoiceissuertype': 'EM',
+        })
+        fileheader.batch.feed({
+            'batchidentifier': '{0}{1}'.format(
+                invoice_number(start), self.seller['vat']),
+            'invoicescount': invoices,
+            'invoicecurrencycode': 'EUR',
+        })
+        for totals in (fileheader.batch.totalinvoicesamount,
+                       fileheader.batch.totaloutstandingamount,
+                       fileheader.batch.totalexecutableamount):
+            totals.feed({'totalamount': total})
+
+        parties = facturae.Parties()
+        parties.feed({
+            'sellerparty': self._party('SellerParty', self.seller),
+            'buyerparty': self._party('BuyerParty', self.buyer(start)),
+        })
+        return fileheader, parties
+
+    def root(self, invoices=1, start=0):
+        """Fed FacturaeRoot with a batch of invoices"""
+        root = facturae.FacturaeRoot()
+        fileheader, parties = self.header(invoices, start)
+        root.feed({
+            'fileheader': fileheader,
+            'parties': parties,
+        })
+        root.invoices.feed({'invoice': [
+            self.invoice(index) for index in range(start, start + invoices)
+        ]})
+        return root
+
+    def write_batch(self, target, invoices=1, start=0):
+        """
+        Write a batch streaming one invoice at a time
+
+        The batch totals are computed up front from the invoice lines alone,
+        so the header is written first and the invoices go straight to the
+        target. Every invoice model is built once and no more than one is
+        alive at once.
+
+        :param target: file name or binary file-like object
+        :return: number of invoices written
+        """
+        fileheader, parties = self.header(invoices, start)
+        with FacturaeWriter(target, fileheader, parties) as writer:
+            for index in range(start, start + invoices):
+                writer.write(self.invoice(index))
+        return invoices
+
+    def write_files(self, directory, files, invoices=1,
+                    name='facturae_{0:06d}.xml'):
+        """
+        Write files documents with invoices invoices each
+
+        :return: list with the paths of the files written
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        paths = []
+        for number in range(files):
+            path = os.path.join(directory, name.format(number))
+            self.write_batch(path, invoices, start=number * invoices)
+            paths.append(path)
+        return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m facturae.generator',
+        description='Generate synthetic Facturae 3.2.1 documents'
+    )
+    parser.add_argument('-o', '--output', required=True,
+                        help='output directory with --files, file otherwise')
+    parser.add_argument('-f', '--files', type=int, default=None,
+                        help='number of files to write in the output directory')
+    parser.add_argument('-i', '--invoices', type=int, default=1,
+                        help='invoices per document (default: 1)')
+    parser.add_argument('-l', '--lines', type=int, nargs=2, default=(1, 10),
+                        metavar=('MIN', 'MAX'),
+                        help='lines per invoice (default: 1 10)')
+    parser.add_argument('-a', '--attachment-size', type=int, default=0,
+                        help='bytes of the PDF attached to every invoice')
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    generator = FacturaeGenerator(seed=args.seed, lines=tuple(args.lines),
+                                  attachment_size=args.attachment_size)
+    if args.files is None:
+        generator.write_batch(args.output, args.invoices)
+    else:
+        generator.write_files(args.output, args.files, args.invoices)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Bulk parsing of Facturae documents
+
+    $ python -m facturae.parse -j 4 inbox/
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+from collections import namedtuple
+from functools import partial
+from multiprocessing import Pool
+
+from .facturae_parser import FacturaeParser
+from .parse_cache import ParseCache
+
+ParseResult = namedtuple('ParseResult', ['path', 'result', 'error'])
+
+#: Fields read by summary
+SUMMARY_FIELDS = ('BatchIdentifier', 'InvoicesCount', 'TotalInvoicesAmount',
+                  'InvoiceIssuerType', 'TaxIdentificationNumber',
+                  'InvoiceNumber')
+
+_caches = {}
+
+
+def get_cache(cache):
+    """
+    ParseCache of a directory, opened once per process
+
+    The caches are kept by process id, as the SQLite connections can't be
+    shared with the processes forked from the one that opened them.
+    """
+    if cache is None or isinstance(cache, ParseCache):
+        return cache
+    key = (os.getpid(), cache)
+    res = _caches.get(key)
+    if res is None:
+        res = _caches[key] = ParseCache(cache)
+    return res
+
+
+def parse_file(path, lazy_attachments=False, typed=False, validate=False,
+               fields=None, cache=None, decompress_attachments=False):
+    """
+    Parse a single Facturae file, never raising
+
+    :param path: file name of the document
+    :param lazy_attachments: return the AttachmentData as AttachmentPayload
+                             handles pointing into the file
+    :param typed: return the invoices and parties as records
+    :param validate: report the documents not valid against the Facturae
+                     schema as errors
+    :param fields: keys of the values to extract, see FacturaeParser
+    :param cache: ParseCache or its directory, the results are read from
+                  and stored in it unless lazy_attachments or
+                  decompress_attachments are set
+    :param decompress_attachments: return the AttachmentData as the bytes of
+                                   the attached documents
+    :return: ParseResult with the parsed dict, as FacturaeParser.xml_dict,
+             or the error found
+    """
+    try:
+        cache = get_cache(cache)
+        if (cache is not None and not lazy_attachments and
+                not decompress_attachments):
+            with open(path, 'rb') as f:
+                data = f.read()
+            return ParseResult(path, cache.parse(data, typed=typed,
+                                                 fields=fields,
+                                                 validate=validate), None)
+        with FacturaeParser.iter_invoices(
+                path, lazy_attachments=lazy_attachments, typed=typed,
+                validate=validate, fields=fields,
+                decompress_attachments=decompress_attachments) as stream:
+            result = dict(stream.xml_dict)
+            result['Invoices'] = list(stream)
+        return ParseResult(path, result, None)
+    except Exception as e:
+        return ParseResult(path, None, '{0}: {1}'.format(type(e).__name__, e))
+
+
+def parse_many(paths, workers=None, ordered=True, lazy_attachments=False,
+               typed=False, chunksize=1, validate=False, fields=None,
+               cache=None, decompress_attachments=False):
+    """
+    Parse many Facturae files using a pool of processes
+
+    :param paths: iterable of file names
+    :param workers: number of processes, defaults to the number of CPUs.
+                    With 1 the files are parsed in the current process
+    :param ordered: yield the results in the order of paths, otherwise as
+                    they are completed
+    :param lazy_attachments: return the AttachmentData as AttachmentPayload
+                             handles pointing into the files
+    :param typed: return the invoices and parties as records
+    :param chunksize: files sent to a worker at a time
+    :param validate: report the documents not valid against the Facturae
+                     schema as errors, the schema is compiled once per
+                     process
+    :param fields: keys of the values to extract, see FacturaeParser
+    :param cache: directory of a ParseCache, see parse_file. Every process
+                  opens its own connection
+    :param decompress_attachments: return the AttachmentData as the bytes of
+                                   the attached documents
+    :return: iterator of ParseResult, one per file
+    """
+    parse = partial(parse_file, lazy_attachments=lazy_attachments,
+                    typed=typed, validate=validate, fields=fields,
+                    cache=cache,
+                    decompress_attachments=decompress_attachments)
+
+    if workers == 1:
+        for path in paths:
+            yield parse(path)
+        return
+
+    pool = Pool(workers)
+    try:
+        if ordered:
+            results = pool.imap(parse, paths, chunksize)
+        else:
+            results = pool.imap_unordered(parse, paths, chunksize)
+        for result in results:
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def iter_paths(paths, pattern='*.xsig'):
+    """Expand the directories in paths to the files matching pattern"""
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(glob.glob(os.path.join(path, pattern))):
+                yield name
+        else:
+            yield path
+
+
+def summary(result):
+    """Header values of a ParseResult as a JSON serializable dict"""
+    res = {'path': result.path}
+    if result.error:
+        res['error'] = result.error
+        return res
+
+    data = result.result
+    res.update({
+        'BatchIdentifier': data.get('BatchIdentifier', False),
+        'InvoicesCount': data.get('InvoicesCount', False),
+        'TotalInvoicesAmount': data.get('TotalInvoicesAmount', False),
+        'InvoiceIssuerType': data.get('InvoiceIssuerType', False),
+        'vat_source': data['seller'].get('TaxIdentificationNumber', False),
+        'vat_destination': data['buyer'].get('TaxIdentificationNumber', False),
+        'Invoices': [invoice.get('InvoiceNumber', False)
+                     for invoice in data['Invoices']],
+    })
+    return res
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m facturae.parse',
+        description='Parse Facturae files and print a JSON line per file'
+    )
+    parser.add_argument('paths', nargs='+',
+                        help='Facturae files or directories')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='number of processes (default: CPU count)')
+    parser.add_argument('-u', '--unordered', action='store_true',
+                        help='print the results as they are completed')
+    parser.add_argument('--validate', action='store_true',
+                        help='validate the files against the Facturae schema')
+    parser.add_argument('-p', '--pattern', default='*.xsig',
+                        help='files to parse inside directories '
+                             '(default: *.xsig)')
+    parser.add_argument('--cache', default=None, metavar='DIR',
+                        help='directory of a cache of the parse results')
+    args = parser.parse_args(argv)
+
+    errors = 0
+    results = parse_many(iter_paths(args.paths, args.pattern),
+                         workers=args.workers, ordered=not args.unordered,
+                         validate=args.validate, fields=SUMMARY_FIELDS,
+                         cache=args.cache)
+    for result in results:
+        if result.error:
+            errors += 1
+            sys.stderr.write('{0}: {1}\n'.format(result.path, result.error))
+        sys.stdout.write(json.dumps(summary(result), sort_keys=True) + '\n')
+
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent cache of parse results
+
+    cache = ParseCache('/var/cache/facturae')
+    result = cache.parse(data)
+
+Results are stored in a SQLite database inside the directory, keyed by the
+SHA-256 of the document, the parser version, the fingerprint of the
+extraction tables and the parse options, so hits are served without parsing
+the document again. Installs of other versions can share the directory, the
+entries nobody reads anymore are evicted as the least recently used ones
+once the stored results exceed max_size.
+
+Results are stored as JSON, tagging the decimals, dates, bytes and records
+to rebuild them, so reading the cache never runs code from its files.
+"""
+import base64
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from datetime import date
+from decimal import Decimal
+from io import BytesIO
+
+from . import __version__, records
+from .facturae_parser import FacturaeParser, tables_fingerprint
+
+FILENAME = 'parse-cache.sqlite'
+
+#: Format of the stored values, part of the keys
+FORMAT = 'json1'
+
+RECORDS = dict((cls.__name__, cls)
+               for cls in records.BaseRecord.__subclasses__())
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed);
+'''
+
+
+def _dump(value):
+    """Value made of the JSON types, tagging the others"""
+    if isinstance(value, dict):
+        return dict((key, _dump(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return [_dump(item) for item in value]
+    if isinstance(value, records.BaseRecord):
+        return {'$record': type(value).__name__,
+                'state': _dump(value.__getstate__())}
+    if isinstance(value, Decimal):
+        return {'$decimal': str(value)}
+    if isinstance(value, date):
+        return {'$date': value.isoformat()}
+    if isinstance(value, bytes):
+        try:
+            # Python 2 texts
+            if str is bytes:
+                value.decode('ascii')
+                return value
+        except UnicodeDecodeError:
+            pass
+        return {'$bytes': base64.b64encode(value).decode('ascii')}
+    return value
+
+
+def _load(value):
+    """object_hook rebuilding the values tagged by _dump"""
+    if '$decimal' in value:
+        return Decimal(value['$decimal'])
+    if '$date' in value:
+        return records.to_date(value['$date'])
+    if '$bytes' in value:
+        return base64.b64decode(value['$bytes'])
+    if '$record' in value:
+        record = RECORDS[value['$record']].__new__(RECORDS[value['$record']])
+        record.__setstate__(value['state'])
+        return record
+    return value
+
+
+def dumps(result):
+    """Encoded parse result"""
+    return json.dumps(_dump(result), separators=(',', ':')).encode('utf-8')
+
+
+def loads(data):
+    """Parse result encoded by dumps"""
+    return json.loads(data.decode('utf-8'), object_hook=_load)
+
+
+class ParseCache(object):
+    """
+    Parse results stored in a SQLite database
+
+    The attachments are stored as text, AttachmentPayload handles would point
+    into the parsed document.
+    """
+
+    def __init__(self, directory, max_size=256 * 1024 * 1024, timeout=30):
+        """
+        :param directory: directory of the database, created when missing
+        :param max_size: bytes of stored results kept at most
+        :param timeout: seconds waiting for another process writing to the
+                        database
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.path = os.path.join(directory, FILENAME)
+        self.max_size = max_size
+        self.fingerprint = tables_fingerprint()
+        self.version = '{0}:py{1}:{2}:{3}'.format(
+            __version__, sys.version_info[0], self.fingerprint, FORMAT)
+        self.connection = sqlite3.connect(self.path, timeout=timeout)
+        # Commits without waiting for the disk, readers don't block writers
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+
+    def key(self, data, typed=False, fields=None, validate=False):
+        """Key of the result of parsing data with the given options"""
+        options = '-' if fields is None else ','.join(sorted(fields))
+        return '{0}:{1}:{2}{3}:{4}'.format(
+            hashlib.sha256(data).hexdigest(), self.version, int(typed),
+            int(validate), options)
+
+    def get(self, data, typed=False, fields=None, validate=False):
+        """Stored result of parsing data, None when there is none"""
+        key = self.key(data, typed, fields, validate)
+        row = self.connection.execute(
+            'SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        with self.connection:
+            self.connection.execute(
+                'UPDATE results SET accessed = ? WHERE key = ?',
+                (time.time(), key))
+        return loads(bytes(row[0]))
+
+    def set(self, data, result, typed=False, fields=None, validate=False):
+        """Store the result of parsing data, evicting the oldest results"""
+        value = dumps(result)
+        if len(value) > self.max_size:
+            return
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)',
+                (self.key(data, typed, fields, validate), self.fingerprint,
+                 sqlite3.Binary(value), len(value), time.time()))
+            self._evict()
+
+    def _evict(self):
+        total = self.connection.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+        if total <= self.max_size:
+            return
+        rows = self.connection.execute(
+            'SELECT key, size FROM results ORDER BY accessed')
+        evicted = []
+        for key, size in rows:
+            if total <= self.max_size:
+                break
+            evicted.append((key,))
+            total -= size
+        self.connection.executemany('DELETE FROM results WHERE key = ?',
+                                    evicted)
+
+    def parse(self, data, typed=False, fields=None, validate=False):
+        """
+        Result of parsing a document, as FacturaeParser.parse_xml, from the
+        cache or parsed and stored
+
+        :param data: document bytes
+        :param typed: return records, see FacturaeParser
+        :param fields: keys of the values to extract, see FacturaeParser
+        :param validate: validate the document against the Facturae schema
+                         when it is parsed, only valid documents are stored
+        :raises InvalidDocument: when validate is set and the document is not
+                                 valid
+        """
+        result = self.get(data, typed, fields, validate)
+        if result is None:
+            with FacturaeParser.iter_invoices(
+                    BytesIO(data), typed=typed, validate=validate,
+                    fields=fields) as stream:
+                result = dict(stream.xml_dict)
+                result['Invoices'] = list(stream)
+            self.set(data, result, typed, fields, validate)
+        return result
+
+    def __len__(self):
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def clear(self):
+        with self.connection:
+            self.connection.execute('DELETE FROM results')
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Compact typed records returned by FacturaeParser(xml_data, typed=True)
+
+Records keep one slot per field, named as the lowercased Facturae tag like
+the models in facturae.py, and can also be read as dicts with the keys
+used by the untyped parser.
+"""
+from datetime import date
+from decimal import Decimal
+
+from .utils import LRUCache
+
+#: Code values shared by the records, bounded as a document can carry any
+#: text in a code
+_CODES = LRUCache(maxsize=1024)
+
+
+def to_decimal(text):
+    return Decimal(text.strip())
+
+
+def to_int(text):
+    return int(text)
+
+
+def to_date(text):
+    text = text.strip()
+    return date(int(text[0:4]), int(text[5:7]), int(text[8:10]))
+
+
+def to_code(text):
+    """Share a single instance of the code values (tax types, currencies..)"""
+    code = _CODES.get(text)
+    if code is None:
+        _CODES.set(text, text)
+        code = text
+    return code
+
+
+def slots(keys):
+    return tuple(key.lower() for key in keys)
+
+
+class BaseRecord(object):
+
+    __slots__ = ()
+    _keys = ()
+
+    def __init__(self, **kwargs):
+        for slot in self.__slots__:
+            setattr(self, slot, kwargs.get(slot))
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key.lower())
+        except AttributeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        setattr(self, key.lower(), value)
+
+    def get(self, key, default=None):
+        return getattr(self, key.lower(), default)
+
+    def keys(self):
+        return list(self._keys)
+
+    def to_dict(self):
+        """Record as a dict with the keys used by the untyped parser"""
+        res = {}
+        for key, slot in zip(self._keys, self.__slots__):
+            value = getattr(self, slot)
+            if isinstance(value, BaseRecord):
+                value = value.to_dict()
+            elif isinstance(value, list):
+                value = [item.to_dict() if isinstance(item, BaseRecord)
+                         else item for item in value]
+            res[key] = value
+        return res
+
+    def __getstate__(self):
+        return tuple(getattr(self, slot) for slot in self.__slots__)
+
+    def __setstate__(self, state):
+        for slot, value in zip(self.__slots__, state):
+            setattr(self, slot, value)
+
+    def __eq__(self, other):
+        return (type(self) is type(other) and
+                self.__getstate__() == other.__getstate__())
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '{0}({1})'.format(type(self).__name__, ', '.join(
+            '{0}={1!r}'.format(slot, getattr(self, slot))
+            for slot in self.__slots__
+        ))
+
+
+class Address(BaseRecord):
+
+    _keys = ('Street', 'PostCode', 'Town', 'Province', 'CountryCode')
+    __slots__ = slots(_keys)
+
+
+class Party(BaseRecord):
+
+    _keys = ('PersonTypeCode', 'ResidenceTypeCode', 'TaxIdentificationNumber',
+             'CorporateName', 'TradeName', 'Address')
+    __slots__ = slots(_keys)
+
+
+class Tax(BaseRecord):
+
+    _keys = ('TaxTypeCode', 'TaxRate', 'TaxableBase', 'TaxAmount')
+    __slots__ = slots(_keys)
+
+
+class InvoiceLine(BaseRecord):
+
+    _keys = ('ItemDescription', 'Quantity', 'UnitPriceWithoutTax',
+             'TotalCost', 'GrossAmount', 'TaxesOutputs')
+    __slots__ = slots(_keys)
+
+
+class Attachment(BaseRecord):
+
+    _keys = ('AttachmentCompressionAlgorithm', 'AttachmentFormat',
+             'AttachmentEncoding', 'AttachmentData')
+    __slots__ = slots(_keys)
+
+
+class Invoice(BaseRecord):
+
+    _keys = ('InvoiceNumber', 'InvoiceSeriesCode', 'InvoiceDocumentType',
+             'InvoiceClass', 'IssueDate', 'InvoiceCurrencyCode',
+             'TaxCurrencyCode', 'LanguageName', 'Taxes', 'TotalGrossAmount',
+             'TotalGrossBeforeTaxes', 'TotalTaxOutputs', 'TotalTaxesWithheld',
+             'InvoiceTotal', 'TotalOutstandingAmount', 'TotalExecutableAmount',
+             'InvoiceLines', 'InstallmentDueDate', 'InstallmentAmount',
+             'PaymentMeans', 'IBAN', 'BIC', 'Attachments',
+             'AdditionalInformation')
+    __slots__ = slots(_keys)
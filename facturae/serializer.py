@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+"""
+Direct lxml serialization of the Facturae models
+
+Renders a fed model, usually a FacturaeRoot, into an lxml element in a single
+pass, following the rules of libcomxml's XmlModel.build_tree: fields in
+_sort_order, empty fields and empty sub-models dropped. The models are not
+modified, so they can be fed again and serialized as many times as needed.
+
+AttachmentSource values are rendered with their whole text, unless a sources
+dict is given to collect them: their elements are then left empty, to be
+filled in chunks by write_element.
+
+Models whose class sets _cacheable, like the parties, are rendered once per
+content: the element is kept in an LRUCache keyed by the tags and texts of
+the model and copied into every later document with the same content.
+"""
+from copy import deepcopy
+
+from libcomxml.core import Field, Model, XmlField, XmlModel, clean_xml
+from lxml import etree
+
+from .attachments import AttachmentSource
+from .utils import LRUCache
+
+string_types = (str, type(u''))
+
+#: Elements of the _cacheable models already rendered, by model_key
+fragments = LRUCache(maxsize=256)
+
+
+def _tag(field):
+    if field.namespace:
+        return '{{{0!s}}}{1!s}'.format(field.namespace, field.name)
+    return field.name
+
+
+def _text(value):
+    """Element text of a plain field value, as libcomxml renders it"""
+    if value is None or value is False:
+        return None
+    if isinstance(value, bytes) and str is bytes:
+        return value.decode('utf-8')
+    return u'{0!s}'.format(value)
+
+
+def _is_plain(value):
+    return not isinstance(value, (XmlField, XmlModel, list))
+
+
+def _is_empty(element):
+    return ((element.text is None or element.text.strip() == '') and
+            len(element) == 0 and len(element.attrib) == 0)
+
+
+def model_fields(model):
+    """
+    (name, field) pairs of a model in rendering order
+
+    Lazy members not created yet are left out, without creating them.
+    """
+    if not model._sort_order:
+        fields = model._fields
+        return [(key, fields[key]) for key in fields.keys()]
+
+    lazy = getattr(model, '_lazy', ())
+    res = []
+    for key in model._sort_order:
+        if key.startswith('_'):
+            continue
+        if key in lazy:
+            field = model.__dict__.get(key)
+        else:
+            field = getattr(model, key, None)
+        if isinstance(field, (Field, Model, list)):
+            res.append((key, field))
+    return res
+
+
+def field_element(field, parent=None, sources=None):
+    """
+    Element of an XmlField or None when it has no value
+
+    :param parent: element the new element is appended to
+    :param sources: dict where an AttachmentSource value is stored, by its
+                    element, instead of being rendered
+    """
+    value = field.value
+    if sources is not None and isinstance(value, AttachmentSource):
+        if parent is None:
+            element = etree.Element(_tag(field), **field.attributes)
+        else:
+            element = etree.SubElement(parent, _tag(field), **field.attributes)
+        sources[element] = value
+        return element
+
+    if not _is_plain(value):
+        element = field.element()
+        if len(element) == 0 and not element.text:
+            return None
+        if parent is not None:
+            parent.append(element)
+        return element
+
+    text = _text(value)
+    if not text:
+        return None
+    if parent is None:
+        element = etree.Element(_tag(field), **field.attributes)
+    else:
+        element = etree.SubElement(parent, _tag(field), **field.attributes)
+    element.text = text
+    return element
+
+
+def _value_key(field):
+    """
+    Key of the value of a field: its type and rendered text, as equal values
+    such as 1 and True or Decimal('1') and Decimal('1.0') render differently
+    """
+    value = field.value
+    if isinstance(value, AttachmentSource):
+        raise TypeError('AttachmentSource values are not cached')
+    if _is_plain(value):
+        value = _text(value)
+    return (type(field._Field__value), value,
+            tuple(sorted(field.attributes.items())))
+
+
+def _model_key(model, res):
+    res.append(type(model))
+    res.append(model.root.name)
+    res.append(model.drop_empty)
+    for name, member in model.__dict__.items():
+        if isinstance(member, Field):
+            if member._Field__value is not None:
+                res.append((name, member.name, _value_key(member)))
+        elif isinstance(member, XmlModel):
+            res.append(name)
+            _model_key(member, res)
+            res.append(None)
+        elif isinstance(member, list) and member:
+            res.append(name)
+            for item in member:
+                if isinstance(item, XmlModel):
+                    _model_key(item, res)
+                elif isinstance(item, Field):
+                    res.append((item.name, _value_key(item)))
+                else:
+                    res.append(('xml', item))
+            res.append(None)
+    return res
+
+
+def model_key(model):
+    """
+    Key of the content of a model: its class and the values of its fields,
+    by type and rendered text, and sub-models, with their names. None when
+    some value can't be part of a key
+
+    Models of the same class with the same key render the same element.
+    """
+    try:
+        return tuple(_model_key(model, []))
+    except TypeError:
+        return None
+
+
+def to_element(model, sources=None, cache=fragments):
+    """
+    Render a model into a new lxml element
+
+    :param model: fed XmlModel
+    :param sources: dict collecting the AttachmentSource values by element,
+                    leaving their elements empty
+    :param cache: LRUCache with the elements of the _cacheable models, None
+                  to render them every time
+    :return: lxml element with the model, equal to the one build_tree leaves
+             in model.doc_root
+    """
+    if cache is not None and getattr(model, '_cacheable', False):
+        key = model_key(model)
+        if key is not None:
+            try:
+                element = cache.get(key)
+            except TypeError:
+                # Unhashable values
+                return _render(model, sources, cache)
+            if element is None:
+                element = _render(model, sources, cache)
+                cache.set(key, element)
+            return deepcopy(element)
+    return _render(model, sources, cache)
+
+
+def _render(model, sources, cache):
+    root = model.root
+    element = root.element()
+    drop_empty = model.drop_empty
+
+    for key, field in model_fields(model):
+        if field is root:
+            continue
+
+        if isinstance(field, XmlModel):
+            child = to_element(field, sources, cache)
+            if drop_empty and field.drop_empty and len(child) == 0:
+                continue
+            element.append(child)
+
+        elif isinstance(field, list):
+            for item in field:
+                if isinstance(item, XmlField):
+                    child = item.element()
+                    if drop_empty and _is_empty(child):
+                        continue
+                    element.append(child)
+                elif isinstance(item, XmlModel):
+                    child = to_element(item, sources, cache)
+                    if drop_empty and len(child) == 0:
+                        continue
+                    element.append(child)
+                elif isinstance(item, string_types):
+                    element.append(etree.fromstring(clean_xml(item)))
+
+        elif (field.parent or root.name) == root.name:
+            if drop_empty:
+                field_element(field, element, sources)
+            else:
+                field.element(element)
+
+        else:
+            for parent in element.iterdescendants(tag=field.parent):
+                if drop_empty:
+                    field_element(field, parent, sources)
+                else:
+                    field.element(parent)
+                break
+
+    return element
+
+
+def to_bytes(model, xml_declaration=True, encoding='UTF-8',
+             pretty_print=False):
+    """
+    Render a model into an encoded document
+
+    With the default arguments the result is the same as str(model) after
+    model.build_tree() on Python 2.
+    """
+    return etree.tostring(to_element(model), xml_declaration=xml_declaration,
+                          encoding=encoding, pretty_print=pretty_print)
+
+
+def to_document(element, encoding='UTF-8'):
+    """Serialize an element as an encoded document with XML declaration"""
+    return etree.tostring(element, xml_declaration=True, encoding=encoding)
+
+
+def _new_namespaces(element):
+    parent = element.getparent()
+    if parent is None:
+        return element.nsmap
+    inherited = parent.nsmap
+    return dict((prefix, uri) for prefix, uri in element.nsmap.items()
+                if inherited.get(prefix) != uri)
+
+
+def write_streamed(xf, element, sources, _streamed=None):
+    """
+    Write an element to an lxml xmlfile, encoding the AttachmentSource of
+    the elements in sources into it in chunks
+    """
+    if _streamed is None:
+        _streamed = set()
+        for source_element in sources:
+            _streamed.add(source_element)
+            _streamed.update(source_element.iterancestors())
+
+    if element not in _streamed:
+        if element.getparent() is not None:
+            # Written in place it would repeat the namespace declarations
+            # in scope
+            element = deepcopy(element)
+        xf.write(element)
+        return
+
+    with xf.element(element.tag, dict(element.attrib),
+                    nsmap=_new_namespaces(element)):
+        source = sources.get(element)
+        if source is not None:
+            for chunk in source.iter_encoded():
+                xf.write(chunk.decode('ascii'))
+        elif element.text:
+            xf.write(element.text)
+        for child in element:
+            write_streamed(xf, child, sources, _streamed)
+    if element.tail:
+        xf.write(element.tail)
+
+
+def write_element(element, target, encoding='UTF-8', sources=None):
+    """
+    Write an element as an encoded document
+
+    :param target: file name or binary file-like object
+    :param sources: AttachmentSource values collected by to_element, encoded
+                    into their elements as they are written
+    """
+    if not sources:
+        etree.ElementTree(element).write(target, xml_declaration=True,
+                                         encoding=encoding)
+        return
+
+    with etree.xmlfile(target, encoding=encoding) as xf:
+        xf.write_declaration()
+        write_streamed(xf, element, sources)
+
+
+def write_model(model, target, encoding='UTF-8'):
+    """
+    Render a model and write it as an encoded document, streaming the
+    AttachmentSource values into the output
+
+    :param target: file name or binary file-like object
+    """
+    sources = {}
+    write_element(to_element(model, sources), target, encoding, sources)
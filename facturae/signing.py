@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+Signing of Facturae documents with a reusable signer
+
+    signer = FacturaeSigner(certificate, password)
+    for root in roots:
+        signed = signer.sign(root)
+
+    for signed in sign_many(roots, certificate, password, workers=4):
+        store(signed)
+"""
+import hashlib
+import hmac
+import os
+from functools import partial
+from multiprocessing import Pool, cpu_count
+
+from libcomxml.core import XmlModel
+from lxml import etree
+from signxml import XMLSigner
+
+from . import xmldsig
+from .serializer import to_bytes, to_document, to_element, write_element
+from .utils import FacturaeUtils, LRUCache, bounded_imap
+from .validation import assert_valid
+
+
+class FacturaeSigner(object):
+    """
+    Signer holding the key material of a PKCS12 certificate
+
+    The PKCS12 is decrypted once, on creation, and the parsed private key,
+    certificate and configured XMLSigner are reused for every document.
+    """
+
+    #: Signers kept by FacturaeSigner.cached, by certificate fingerprint
+    cache = LRUCache(maxsize=16)
+
+    #: Certificate fingerprints of the PKCS12 and passwords already loaded,
+    #: keyed by their HMAC with index_key
+    fingerprints = LRUCache(maxsize=64)
+
+    #: Random key of the fingerprints index, so its keys can't be used to
+    #: check guessed passwords
+    index_key = os.urandom(32)
+
+    def __init__(self, certificate, password):
+        """
+        :param certificate: must be the pkcs12 certificate
+        :param password: must be the password of the certificate
+        """
+        self.key, self.cert, self.fingerprint = FacturaeUtils.load_pkcs12(
+            certificate, password
+        )
+        self.cert_chain = [FacturaeUtils.certificate_base64(self.cert)]
+        self.signer = XMLSigner()
+
+    @classmethod
+    def cached(cls, certificate, password):
+        """
+        Signer of a certificate, reusing the one created by a previous call
+
+        Signers are kept in FacturaeSigner.cache, bounded to its maxsize and
+        keyed by the SHA-256 fingerprint of their certificate, so the exports
+        of a certificate share one. The fingerprint of a PKCS12 and password
+        already seen is remembered, finding its signer without decrypting it.
+        """
+        if not isinstance(password, bytes):
+            password = password.encode('utf-8')
+        key = hmac.new(cls.index_key, certificate + b'\0' + password,
+                       hashlib.sha256).hexdigest()
+
+        fingerprint = cls.fingerprints.get(key)
+        signer = cls.cache.get(fingerprint) if fingerprint else None
+        if signer is None:
+            signer = cls(certificate, password)
+            signer = cls.cache.get(signer.fingerprint) or signer
+            cls.cache.set(signer.fingerprint, signer)
+            cls.fingerprints.set(key, signer.fingerprint)
+        return signer
+
+    def sign_element(self, element, streaming=False):
+        """
+        Add an enveloped signature to an lxml element
+
+        :param streaming: compute the digest feeding the canonical form of
+                          the document to the hash in chunks, signing the
+                          element in place instead of a copy. The signature
+                          is the same signxml produces
+        :return: the signed element
+        """
+        if streaming:
+            xmldsig.warn_in_memory()
+        return self._sign_element(element, streaming)
+
+    def _sign_element(self, element, streaming):
+        if streaming:
+            return xmldsig.sign(element, self.key, self.cert_chain)
+        return self.signer.sign(element, key=self.key, cert=self.cert_chain)
+
+    def sign(self, document, target=None, validate=False, streaming=False):
+        """
+        Sign a document
+
+        :param document: fed FacturaeRoot, lxml element or encoded document
+        :param target: file name or binary file-like object where the signed
+                       document is written instead of being returned
+        :param validate: check the document against the Facturae schema
+                         before signing it
+        :param streaming: stream the digest computation, for documents with
+                          large attachments
+        :raises InvalidDocument: when validate is set and the document is not
+                                 valid
+        :return: signed document as UTF-8 bytes, None when written to target
+        """
+        if isinstance(document, XmlModel):
+            element = to_element(document)
+        elif isinstance(document, bytes):
+            element = etree.fromstring(document)
+        else:
+            element = document
+
+        if validate:
+            assert_valid(element)
+
+        if streaming:
+            xmldsig.warn_in_memory()
+        signed = self._sign_element(element, streaming)
+        if target is not None:
+            write_element(signed, target)
+            return None
+        return to_document(signed)
+
+
+_worker_signer = None
+
+
+def _init_worker(certificate, password):
+    global _worker_signer
+    _worker_signer = FacturaeSigner(certificate, password)
+    xmldsig.ignore_in_memory()
+
+
+def _sign(document, streaming=False):
+    return _worker_signer.sign(document, streaming=streaming)
+
+
+def _encode(document):
+    """Document as bytes, as models and elements can't be sent to workers"""
+    if isinstance(document, XmlModel):
+        return to_bytes(document)
+    if isinstance(document, bytes):
+        return document
+    return to_document(document)
+
+
+def sign_many(documents, certificate, password, workers=None,
+              max_pending=None, streaming=False):
+    """
+    Sign many documents using a pool of processes
+
+    Every worker decrypts the PKCS12 once. Documents are read from
+    documents as the signed ones are consumed, so at most max_pending of
+    them are held at once.
+
+    :param documents: iterable of fed FacturaeRoot, lxml elements or
+                      encoded documents
+    :param certificate: must be the pkcs12 certificate
+    :param password: must be the password of the certificate
+    :param workers: number of processes, defaults to the number of CPUs.
+                    With 1 the documents are signed in the current process
+    :param max_pending: documents sent to the workers and not yet yielded,
+                        defaults to twice the number of workers
+    :param streaming: stream the digest computation, see
+                      FacturaeSigner.sign_element
+    :raises ValueError: when the PKCS12 can't be decrypted or workers is
+                        below 1, on the call and not on the first document
+    :return: iterator of signed documents as UTF-8 bytes, in the order of
+             documents
+    """
+    if workers is not None and workers < 1:
+        raise ValueError('workers must be at least 1, got {0}'.format(
+            workers))
+    # Fail here on a wrong certificate or password, not in every worker
+    signer = FacturaeSigner(certificate, password)
+    if streaming:
+        xmldsig.warn_in_memory()
+    return _sign_many(signer, documents, certificate, password, workers,
+                      max_pending, streaming)
+
+
+def _sign_many(signer, documents, certificate, password, workers,
+               max_pending, streaming):
+    if workers == 1:
+        for document in documents:
+            yield signer.sign(document, streaming=streaming)
+        return
+
+    workers = workers or cpu_count()
+    pool = Pool(workers, _init_worker, (certificate, password))
+    try:
+        documents = (_encode(document) for document in documents)
+        sign = partial(_sign, streaming=streaming)
+        for signed in bounded_imap(pool, sign, documents,
+                                   max_pending or 2 * workers):
+            yield signed
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
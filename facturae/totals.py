@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+"""
+Totals of Facturae invoices and batches derived from their lines
+
+    compute_root(root)
+
+feeds every Invoice of a FacturaeRoot with its TaxesOutputs, TaxesWithhelds
+and InvoiceTotals, and the Batch with InvoicesCount and its three totals.
+Each invoice walks its lines once and the batch adds up the invoice totals,
+so the amounts of the document always agree with each other.
+
+The arithmetic is exact, with Decimal. Line amounts are rounded to 8
+decimals and invoice and batch amounts to 2, half up. Taxes are grouped by
+TaxTypeCode and TaxRate and their amount is computed on the grouped base.
+"""
+from collections import OrderedDict, namedtuple
+from decimal import ROUND_HALF_UP, Decimal
+
+from . import facturae
+from .facturae import created
+
+ZERO = Decimal('0')
+CENTS = Decimal('0.01')
+LINE_PRECISION = Decimal('0.00000001')
+#: TaxTypeCode of the taxes fed without one, IVA
+DEFAULT_TAX_TYPE = '01'
+
+
+class TaxTotal(namedtuple('TaxTotal', ['type_code', 'rate', 'base',
+                                       'amount'])):
+    """Tax of an invoice grouped by type and rate"""
+
+    __slots__ = ()
+
+
+class InvoiceTotals(namedtuple('InvoiceTotals', [
+        'gross', 'general_discounts', 'general_surcharges', 'before_taxes',
+        'taxes_outputs', 'taxes_withheld', 'tax_outputs', 'tax_withheld',
+        'total', 'outstanding', 'executable', 'subsidies',
+        'payments_on_account', 'amounts_withheld', 'reimbursable_expenses',
+        'financial_expenses'])):
+    """Totals of an invoice, with its lists of TaxTotal"""
+
+    __slots__ = ()
+
+
+class BatchTotals(object):
+    """
+    Running totals of a batch of invoices
+
+    add() takes the totals of every invoice and feed() writes the result to
+    a FileHeader.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = ZERO
+        self.outstanding = ZERO
+        self.executable = ZERO
+
+    def add(self, totals):
+        """
+        :param totals: InvoiceTotals of an invoice
+        """
+        self.count += 1
+        self.total += totals.total
+        self.outstanding += totals.outstanding
+        self.executable += totals.executable
+
+    def add_invoice(self, invoice):
+        """Add an Invoice with the InvoiceTotals it was fed"""
+        totals = invoice.invoicetotals
+        self.count += 1
+        self.total += field_decimal(totals.invoicetotal) or ZERO
+        self.outstanding += field_decimal(totals.totaloutstandingamount) or ZERO
+        self.executable += field_decimal(totals.totalexecutableamount) or ZERO
+
+    def feed(self, fileheader):
+        """
+        Feed InvoicesCount and the totals of the Batch of a FileHeader, and
+        its Modality when missing
+        """
+        batch = fileheader.batch
+        batch.feed({'invoicescount': self.count})
+        batch.totalinvoicesamount.feed({'totalamount': self.total})
+        batch.totaloutstandingamount.feed({'totalamount': self.outstanding})
+        batch.totalexecutableamount.feed({'totalamount': self.executable})
+        if fileheader.modality.value is None:
+            fileheader.feed({'modality': 'I' if self.count == 1 else 'L'})
+
+
+def money(value):
+    return value.quantize(CENTS, rounding=ROUND_HALF_UP)
+
+
+def line_amount(value):
+    return value.quantize(LINE_PRECISION, rounding=ROUND_HALF_UP)
+
+
+def raw_value(field):
+    """Value fed to a field, before its rep formatting"""
+    return field._Field__value
+
+
+def to_decimal(value):
+    """Decimal of a fed value, None when it is missing"""
+    if value is None or value is False or value == '':
+        return None
+    if isinstance(value, Decimal):
+        return value
+    if isinstance(value, float):
+        return Decimal(repr(value))
+    return Decimal(value)
+
+
+def field_decimal(field):
+    return to_decimal(raw_value(field))
+
+
+def _sum(amounts):
+    return sum((amount for amount in amounts if amount is not None), ZERO)
+
+
+def _adjustments(model):
+    """
+    Sum of the amounts of a list of discounts or charges, either model
+    (GeneralSurcharges is a list of Discount), None when not created
+    """
+    if model is None:
+        return ZERO
+    items = model.charge if hasattr(model, 'charge') else model.discount
+    return _sum(field_decimal(getattr(item, 'chargeamount', None) or
+                              item.discountamount) for item in items)
+
+
+def _fed_amount(model, name):
+    """Value fed to the optional field name of model, None when missing"""
+    field = created(model, name)
+    return field_decimal(field) if field is not None else None
+
+
+def _items_amount(model, name, items, amount):
+    """
+    Sum of the amount fields of the items list of the optional sub-model
+    name of model
+    """
+    container = created(model, name)
+    if container is None:
+        return ZERO
+    return _sum(field_decimal(getattr(item, amount))
+                for item in getattr(container, items))
+
+
+def line_gross(line):
+    """
+    GrossAmount of an InvoiceLine, feeding it and TotalCost when missing
+
+    TotalCost defaults to Quantity by UnitPriceWithoutTax and GrossAmount to
+    TotalCost less the DiscountsAndRebates plus the Charges of the line.
+    """
+    gross = field_decimal(line.grossamount)
+    if gross is not None:
+        return gross
+
+    total_cost = field_decimal(line.totalcost)
+    if total_cost is None:
+        quantity = field_decimal(line.quantity)
+        price = field_decimal(line.unitpricewithouttax)
+        if quantity is None or price is None:
+            raise ValueError(
+                'InvoiceLine without GrossAmount, TotalCost or '
+                'Quantity and UnitPriceWithoutTax')
+        total_cost = line_amount(quantity * price)
+        line.feed({'totalcost': total_cost})
+
+    gross = line_amount(
+        total_cost - _adjustments(created(line, 'discountandrebates')) +
+        _adjustments(created(line, 'charges')))
+    line.feed({'grossamount': gross})
+    return gross
+
+
+def _group(groups, tax, gross):
+    rate = field_decimal(tax.taxrate)
+    if rate is None:
+        raise ValueError('Tax without TaxRate')
+    key = (raw_value(tax.taxtypecode) or DEFAULT_TAX_TYPE, rate)
+    taxable_base = created(tax, 'taxablebase')
+    base = (field_decimal(taxable_base.totalamount)
+            if taxable_base is not None else None)
+    groups[key] = groups.get(key, ZERO) + (gross if base is None else base)
+
+
+def _tax_totals(groups):
+    return [TaxTotal(type_code, rate, money(base),
+                     money(money(base) * rate / 100))
+            for (type_code, rate), base in groups.items()]
+
+
+def _tax_models(taxes):
+    models = []
+    for tax in taxes:
+        model = facturae.Tax()
+        model.feed({'taxtypecode': tax.type_code, 'taxrate': tax.rate})
+        model.taxablebase.feed({'totalamount': tax.base})
+        model.taxamount.feed({'totalamount': tax.amount})
+        models.append(model)
+    return models
+
+
+def compute_invoice(invoice, feed=True):
+    """
+    Totals of an Invoice from its lines, in a single pass over them
+
+    Lines without GrossAmount get it, and TotalCost, computed. Every line
+    tax adds its TaxableBase, or the line GrossAmount when it has none, to
+    the base of its type and rate. General discounts and surcharges are
+    applied to TotalGrossAmountBeforeTaxes only, the line taxes must carry
+    their TaxableBase when they change it.
+
+    TotalOutstandingAmount deducts the Subsidies and the payments on account
+    from InvoiceTotal, and TotalExecutableAmount deducts the AmountsWithheld
+    and adds the reimbursable and financial expenses. The payments on account
+    and the reimbursable expenses are summed from their lists when their
+    total isn't fed.
+
+    :param invoice: Invoice with its lines fed
+    :param feed: feed TaxesOutputs, TaxesWithhelds and InvoiceTotals of the
+                 invoice with the results
+    :return: InvoiceTotals
+    """
+    gross = ZERO
+    outputs = OrderedDict()
+    withheld = OrderedDict()
+    for line in invoice.items.invoiceline:
+        line_total = line_gross(line)
+        gross += line_total
+        for taxes, groups in ((created(line, 'taxesoutputs'), outputs),
+                              (created(line, 'taxeswithheld'), withheld)):
+            if taxes is not None:
+                for tax in taxes.tax:
+                    _group(groups, tax, line_total)
+
+    invoice_totals = invoice.invoicetotals
+    gross = money(gross)
+    general_discounts = money(_adjustments(
+        created(invoice_totals, 'generaldiscounts')))
+    general_surcharges = money(_adjustments(
+        created(invoice_totals, 'generalsurcharges')))
+    before_taxes = gross - general_discounts + general_surcharges
+
+    taxes_outputs = _tax_totals(outputs)
+    taxes_withheld = _tax_totals(withheld)
+    tax_outputs = _sum(tax.amount for tax in taxes_outputs)
+    tax_withheld = _sum(tax.amount for tax in taxes_withheld)
+    total = before_taxes + tax_outputs - tax_withheld
+
+    # TotalOutstandingAmount is InvoiceTotal - (subsidies +
+    # TotalPaymentsOnAccount) and TotalExecutableAmount is
+    # TotalOutstandingAmount - WithholdingAmount + TotalReinbursableExpenses
+    # + TotalFinancialExpenses
+    subsidies = money(_items_amount(invoice_totals, 'subsidies', 'subsidy',
+                                    'subsidyamount'))
+    payments = _fed_amount(invoice_totals, 'totalpaymentsonaccount')
+    if payments is None:
+        payments = _items_amount(invoice_totals, 'paymentsonaccount',
+                                 'paymentonaccount', 'paymentonaccountamount')
+    payments = money(payments)
+    withheld_amounts = created(invoice_totals, 'amountswithheld')
+    amounts_withheld = money(
+        field_decimal(withheld_amounts.withholdingamount) or ZERO
+        if withheld_amounts is not None else ZERO)
+    reimbursable = _fed_amount(invoice_totals, 'totalreinbursableexpenses')
+    if reimbursable is None:
+        reimbursable = _items_amount(
+            invoice_totals, 'reinbursableexpenses', 'reinbursableexpens',
+            'reinbursableexpensesamount')
+    reimbursable = money(reimbursable)
+    financial = money(_fed_amount(invoice_totals, 'totalfinancialexpenses')
+                      or ZERO)
+    outstanding = total - subsidies - payments
+    executable = outstanding - amounts_withheld + reimbursable + financial
+
+    totals = InvoiceTotals(gross, general_discounts, general_surcharges,
+                           before_taxes, taxes_outputs, taxes_withheld,
+                           tax_outputs, tax_withheld, total, outstanding,
+                           executable, subsidies, payments, amounts_withheld,
+                           reimbursable, financial)
+    if feed:
+        feed_invoice(invoice, totals)
+    return totals
+
+
+def feed_invoice(invoice, totals):
+    """Feed an Invoice with its InvoiceTotals"""
+    invoice.taxesoutputs.feed({'tax': _tax_models(totals.taxes_outputs)})
+    if totals.taxes_withheld:
+        invoice.taxeswithhelds.feed(
+            {'tax': _tax_models(totals.taxes_withheld)})
+
+    values = {
+        'totalgrossamount': totals.gross,
+        'totalgrossamountbeforetaxes': totals.before_taxes,
+        'totaltaxoutputs': totals.tax_outputs,
+        'totaltaxeswithheld': totals.tax_withheld,
+        'invoicetotal': totals.total,
+        'totaloutstandingamount': totals.outstanding,
+        'totalexecutableamount': totals.executable,
+    }
+    if totals.general_discounts:
+        values['totalgeneraldiscounts'] = totals.general_discounts
+    if totals.general_surcharges:
+        values['totalgeneralsurcharges'] = totals.general_surcharges
+    if totals.payments_on_account:
+        values['totalpaymentsonaccount'] = totals.payments_on_account
+    if totals.reimbursable_expenses:
+        values['totalreinbursableexpenses'] = totals.reimbursable_expenses
+    invoice.invoicetotals.feed(values)
+
+
+def compute_batch(fileheader, invoices, feed=True):
+    """
+    Totals of every invoice of a batch and of the batch
+
+    :param fileheader: FileHeader fed with the batch totals
+    :param invoices: iterable of Invoice
+    :param feed: feed the invoices with their totals too
+    :return: BatchTotals
+    """
+    batch = BatchTotals()
+    for invoice in invoices:
+        batch.add(compute_invoice(invoice, feed=feed))
+    batch.feed(fileheader)
+    return batch
+
+
+def compute_root(root):
+    """
+    Feed the totals of every Invoice of a FacturaeRoot and of its Batch
+
+    :return: BatchTotals
+    """
+    return compute_batch(root.fileheader, root.invoices.invoice)
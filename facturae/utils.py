@@ -1,7 +1,21 @@
 # -*- coding: utf-8 -*-
+import binascii
+import re
+import threading
+import time
+from collections import OrderedDict, deque
 
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.serialization import Encoding, pkcs12
 from OpenSSL import crypto
 
+PEM_BODY = re.compile(
+    br'-----BEGIN CERTIFICATE-----(.+?)-----END CERTIFICATE-----', re.S
+)
+
+_MISSING = object()
+
 class FacturaeUtils(object):
 
     @staticmethod
@@ -28,3 +42,105 @@ class FacturaeUtils(object):
 
         except Exception as e:
             pass
+
+    @staticmethod
+    def load_pkcs12(pk, passwd):
+        """
+        Return the private key, as a cryptography key object ready to sign,
+        the PEM certificate and its SHA-256 fingerprint from a PKCS12
+
+        :raises ValueError: when the PKCS12 can't be decrypted
+        """
+
+        assert pk, "PKCS12 must be provided"
+        assert passwd, "Passwd must be provided"
+
+        if not isinstance(passwd, bytes):
+            passwd = passwd.encode('utf-8')
+        key, cert, _ = pkcs12.load_key_and_certificates(
+            pk, passwd, default_backend()
+        )
+        if key is None or cert is None:
+            raise ValueError('PKCS12 without private key or certificate')
+
+        fingerprint = binascii.hexlify(cert.fingerprint(hashes.SHA256()))
+        return key, cert.public_bytes(Encoding.PEM), fingerprint.decode('ascii')
+
+    @staticmethod
+    def certificate_base64(cert):
+        """
+        Return the base64 body of a PEM certificate on a single line, as it
+        goes in the X509Certificate of a signature
+        """
+        if not isinstance(cert, bytes):
+            cert = cert.encode('ascii')
+        match = PEM_BODY.search(cert)
+        body = match.group(1) if match else cert
+        return b''.join(body.split()).decode('ascii')
+
+
+class LRUCache(object):
+    """
+    Thread-safe mapping keeping at most maxsize entries, evicting the least
+    recently used ones and, with a ttl, the ones older than ttl seconds
+    """
+
+    def __init__(self, maxsize=128, ttl=None, timer=time.time):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._data.pop(key)
+            except KeyError:
+                return default
+            if expires is not None and expires <= self.timer():
+                return default
+            self._data[key] = (expires, value)
+            return value
+
+    def set(self, key, value):
+        expires = None
+        if self.ttl is not None:
+            expires = self.timer() + self.ttl
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (expires, value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            expires, value = self._data.pop(key, (None, default))
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        return len(self._data)
+
+
+def bounded_imap(pool, func, iterable, max_pending):
+    """
+    Like pool.imap but reading iterable only as results are consumed, so
+    at most max_pending items are in flight
+
+    :param pool: multiprocessing Pool
+    :return: iterator of the results of func, in the order of iterable
+    """
+    pending = deque()
+    for item in iterable:
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+        pending.append(pool.apply_async(func, (item,)))
+    while pending:
+        yield pending.popleft().get()
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+XSD validation of Facturae documents
+
+The schemas are compiled on first use and kept for the life of the process,
+one per Facturae version, so validating many documents costs a single
+compilation. The XML Signature schema imported by Facturae is bundled and
+resolved locally.
+"""
+import os
+import threading
+from collections import namedtuple
+
+from libcomxml.core import XmlModel
+from lxml import etree
+
+from .serializer import to_element
+
+XSD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'xsd')
+
+DEFAULT_VERSION = '3.2.1'
+
+SCHEMAS = {
+    '3.2.1': 'Facturaev3_2_1.xsd',
+}
+
+#: Schemas imported from the network by the Facturae ones, by file name
+LOCAL_SCHEMAS = {
+    'xmldsig-core-schema.xsd': 'xmldsig-core-schema.xsd',
+}
+
+_schemas = {}
+_schemas_lock = threading.Lock()
+
+
+class ValidationError(namedtuple('ValidationError',
+                                 ['line', 'column', 'path', 'message'])):
+    """Schema violation found in a document"""
+
+    __slots__ = ()
+
+    @classmethod
+    def from_log_entry(cls, entry):
+        return cls(entry.line, entry.column, getattr(entry, 'path', None),
+                   entry.message)
+
+    def __str__(self):
+        return '{0}:{1}: {2}'.format(self.line, self.column, self.message)
+
+
+class InvalidDocument(ValueError):
+    """Document not valid against the Facturae schema"""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super(InvalidDocument, self).__init__(
+            '{0} schema errors, first: {1}'.format(len(errors), errors[0])
+            if errors else 'Invalid document'
+        )
+
+
+class LocalSchemaResolver(etree.Resolver):
+    """Resolve the schemas imported by Facturae to the bundled copies"""
+
+    def resolve(self, url, pubid, context):
+        name = LOCAL_SCHEMAS.get(url.rsplit('/', 1)[-1])
+        if name is not None:
+            return self.resolve_filename(os.path.join(XSD_DIR, name), context)
+        return None
+
+
+def get_schema(version=DEFAULT_VERSION):
+    """
+    Compiled XMLSchema of a Facturae version, compiled once per process
+
+    :raises ValueError: for an unknown version
+    """
+    schema = _schemas.get(version)
+    if schema is not None:
+        return schema
+
+    if version not in SCHEMAS:
+        raise ValueError('Unknown Facturae version {0}'.format(version))
+
+    with _schemas_lock:
+        schema = _schemas.get(version)
+        if schema is None:
+            parser = etree.XMLParser(no_network=True)
+            parser.resolvers.add(LocalSchemaResolver())
+            schema = etree.XMLSchema(etree.parse(
+                os.path.join(XSD_DIR, SCHEMAS[version]), parser
+            ))
+            _schemas[version] = schema
+    return schema
+
+
+def validate(document, version=DEFAULT_VERSION):
+    """
+    Validate a document against the Facturae schema
+
+    :param document: fed FacturaeRoot, lxml element or tree, or encoded
+                     document
+    :return: list of ValidationError, empty when the document is valid
+    """
+    if isinstance(document, XmlModel):
+        document = to_element(document)
+    elif isinstance(document, bytes):
+        document = etree.fromstring(
+            document, etree.XMLParser(resolve_entities=False, huge_tree=True)
+        )
+
+    schema = get_schema(version)
+    if schema.validate(document):
+        return []
+    return [ValidationError.from_log_entry(entry)
+            for entry in schema.error_log]
+
+
+def assert_valid(document, version=DEFAULT_VERSION):
+    """
+    Validate a document against the Facturae schema
+
+    :raises InvalidDocument: with the errors found
+    """
+    errors = validate(document, version)
+    if errors:
+        raise InvalidDocument(errors)
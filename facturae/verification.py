@@ -0,0 +1,381 @@
+# -*- coding: utf-8 -*-
+"""
+Bulk verification of signed Facturae documents
+
+    store = TrustStore(cafiles=['ca.pem'], crlfiles=['ca.crl'])
+    verifier = FacturaeVerifier(store)
+    for result in verifier.verify_many(documents, workers=4):
+        if not result.valid:
+            print(result.error)
+
+The digests and signature value are checked in the workers with the
+certificate carried by each document. Whether that certificate is trusted is
+decided in the calling process against the local trust store and CRLs, and
+remembered by the fingerprints of the certificates, so the few certificates
+of a batch are validated only once.
+"""
+import base64
+import hashlib
+from collections import namedtuple
+from functools import partial
+from multiprocessing import Pool, cpu_count
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from lxml import etree
+from OpenSSL import crypto
+from signxml import XMLVerifier
+from signxml.exceptions import InvalidInput
+
+try:
+    from signxml import SignatureConfiguration
+except ImportError:
+    # signxml < 3 doesn't check the validity period of the certificate
+    SignatureConfiguration = None
+
+from . import xmldsig
+from .utils import PEM_BODY, LRUCache, bounded_imap
+
+DS = 'http://www.w3.org/2000/09/xmldsig#'
+ENVELOPED = DS + 'enveloped-signature'
+X509_CERTIFICATE_PATH = (
+    './/{{{0}}}Signature/{{{0}}}KeyInfo/{{{0}}}X509Data/{{{0}}}X509Certificate'
+).format(DS)
+
+
+class VerifyResult(namedtuple('VerifyResult', ['fingerprint', 'error'])):
+    """
+    Verification of a document
+
+    :ivar fingerprint: SHA-256 of the signing certificate, None when the
+                       document carries no certificate
+    :ivar error: why the document isn't valid, None when it is
+    """
+
+    __slots__ = ()
+
+    @property
+    def valid(self):
+        return self.error is None
+
+
+def _error(e):
+    return '{0}: {1}'.format(type(e).__name__, e)
+
+
+def _certificate_error(e):
+    detail = e.args[0] if e.args else e
+    if isinstance(detail, (list, tuple)):
+        detail = detail[-1]
+    return 'InvalidCertificate: {0}'.format(detail)
+
+
+def certificate_der(certificate):
+    """DER bytes of the base64 text of an X509Certificate"""
+    if not isinstance(certificate, bytes):
+        certificate = certificate.encode('ascii')
+    return base64.b64decode(b''.join(certificate.split()))
+
+
+def certificate_fingerprint(certificate):
+    """SHA-256 fingerprint of the base64 text of an X509Certificate"""
+    return hashlib.sha256(certificate_der(certificate)).hexdigest()
+
+
+def certificate_pem(certificate):
+    """PEM of the base64 text of an X509Certificate"""
+    body = base64.b64encode(certificate_der(certificate)).decode('ascii')
+    lines = [body[pos:pos + 64] for pos in range(0, len(body), 64)]
+    return '-----BEGIN CERTIFICATE-----\n{0}\n-----END CERTIFICATE-----\n'.format(
+        '\n'.join(lines))
+
+
+def enveloped_signature(root):
+    """
+    Signature of a document, checking it is its only one, a child of the
+    root element with a single Reference to the whole document through the
+    enveloped-signature transform
+
+    signxml accepts any valid signature found in the document, whatever it
+    covers, so one over another element would pass for the document's.
+
+    :raises InvalidInput: when the signature doesn't cover the document
+    """
+    signatures = list(root.iter('{{{0}}}Signature'.format(DS)))
+    if len(signatures) != 1 or signatures[0].getparent() is not root:
+        raise InvalidInput('Expected a single Signature child of the root')
+    signature = signatures[0]
+    references = signature.findall(
+        '{{{0}}}SignedInfo/{{{0}}}Reference'.format(DS))
+    if len(references) != 1 or references[0].get('URI') != '':
+        raise InvalidInput('Expected a single Reference to the document')
+    transforms = [transform.get('Algorithm') for transform in
+                  references[0].iterfind(
+                      '{{{0}}}Transforms/{{{0}}}Transform'.format(DS))]
+    if ENVELOPED not in transforms:
+        raise InvalidInput('Expected an enveloped-signature Transform')
+    return signature
+
+
+def _verify_options(x509_cert):
+    """
+    XMLVerifier.verify options leaving the validity period of the certificate
+    to the trust store, signxml 3 and later check it against the current time
+    """
+    if not hasattr(SignatureConfiguration, 'verification_time'):
+        return {}
+    cert = x509.load_pem_x509_certificate(x509_cert.encode('ascii'),
+                                          default_backend())
+    valid_time = getattr(cert, 'not_valid_before_utc', None)
+    if valid_time is None:
+        valid_time = cert.not_valid_before
+    return {'expect_config': SignatureConfiguration(
+        verification_time=valid_time)}
+
+
+def check_signature(data, streaming=False):
+    """
+    Check the digests and signature value of a signed document against the
+    certificate it carries, without deciding whether it is trusted
+
+    Only an enveloped signature over the whole document is accepted, see
+    enveloped_signature.
+
+    :param data: signed document
+    :param streaming: compute the digest with facturae.xmldsig, streaming the
+                      canonical form of the document, when the signature is
+                      an enveloped one over the whole document
+    :return: tuple (certificates, error) with the base64 X509Certificate
+             texts of the signature, signing certificate first, and the
+             error found or None
+    """
+    if streaming:
+        xmldsig.warn_in_memory()
+    try:
+        parser = etree.XMLParser(resolve_entities=False, no_network=True,
+                                 huge_tree=True)
+        root = etree.fromstring(data, parser=parser)
+        enveloped_signature(root)
+        certificates = [element.text for element in
+                        root.iterfind(X509_CERTIFICATE_PATH)]
+        if not certificates:
+            return [], 'InvalidInput: No X509Certificate in the signature'
+        x509_cert = certificate_pem(certificates[0])
+        if streaming:
+            try:
+                xmldsig.verify(root, x509_cert=x509_cert)
+                return certificates, None
+            except xmldsig.UnsupportedSignature:
+                pass
+        XMLVerifier().verify(root, x509_cert=x509_cert,
+                             **_verify_options(x509_cert))
+        return certificates, None
+    except Exception as e:
+        return [], _error(e)
+
+
+class TrustStore(object):
+    """
+    Local trust anchors and certificate revocation lists
+
+    Validation runs entirely offline against the given files.
+    """
+
+    def __init__(self, cafiles=(), crlfiles=(), verification_time=None,
+                 check_all_crls=False):
+        """
+        :param cafiles: PEM files with the trusted CA certificates
+        :param crlfiles: PEM or DER files with certificate revocation lists.
+                         When given, the signing certificates are checked
+                         against them
+        :param verification_time: datetime used to check the validity
+                                  periods instead of the current time
+        :param check_all_crls: check the revocation of the whole chain, which
+                               needs a CRL for every CA
+        """
+        self.certificates = []
+        for path in cafiles:
+            with open(path, 'rb') as f:
+                data = f.read()
+            for body in PEM_BODY.findall(data) or [base64.b64encode(data)]:
+                self.certificates.append(self._load(body))
+
+        self.crls = []
+        for path in crlfiles:
+            with open(path, 'rb') as f:
+                self.crls.append(self._load_crl(f.read()))
+
+        self.flags = 0
+        if crlfiles:
+            self.flags |= crypto.X509StoreFlags.CRL_CHECK
+        if check_all_crls:
+            self.flags |= crypto.X509StoreFlags.CRL_CHECK_ALL
+
+        self.verification_time = verification_time
+        self.store = self._store()
+
+    def _store(self, chain=()):
+        """
+        X509Store with the trust anchors, CRLs and the given intermediates
+
+        pyOpenSSL before 20 takes no untrusted chain in X509StoreContext, so
+        the intermediates go to a store of their own. The chain built must
+        still end in one of the trust anchors, which are self-signed.
+        """
+        store = crypto.X509Store()
+        for certificate in self.certificates:
+            store.add_cert(certificate)
+        for certificate in chain:
+            store.add_cert(certificate)
+        for crl in self.crls:
+            store.add_crl(crl)
+        if self.flags:
+            store.set_flags(self.flags)
+        if self.verification_time is not None:
+            store.set_time(self.verification_time)
+        return store
+
+    @staticmethod
+    def _load(text):
+        return crypto.load_certificate(crypto.FILETYPE_ASN1,
+                                       certificate_der(text))
+
+    @staticmethod
+    def _load_crl(data):
+        if data.lstrip().startswith(b'-----BEGIN'):
+            crl = x509.load_pem_x509_crl(data, default_backend())
+        else:
+            crl = x509.load_der_x509_crl(data, default_backend())
+        # Older pyOpenSSL releases only take their own CRL objects
+        if hasattr(crypto, 'CRL'):
+            crl = crypto.CRL.from_cryptography(crl)
+        return crl
+
+    def check(self, certificate, chain=()):
+        """
+        Validate a certificate
+
+        :param certificate: base64 text of the X509Certificate
+        :param chain: base64 texts of untrusted intermediate certificates
+        :raises crypto.X509StoreContextError: when it isn't trusted
+        """
+        store = self.store
+        if chain:
+            store = self._store([self._load(text) for text in chain])
+        crypto.X509StoreContext(
+            store, self._load(certificate)).verify_certificate()
+
+    def verify(self, certificate, chain=()):
+        """
+        Validate a certificate
+
+        :param certificate: base64 text of the X509Certificate
+        :param chain: base64 texts of untrusted intermediate certificates
+        :return: None when it is trusted, the error found otherwise
+        """
+        try:
+            self.check(certificate, chain)
+        except crypto.X509StoreContextError as e:
+            return _certificate_error(e)
+        except Exception as e:
+            return _error(e)
+        return None
+
+
+class FacturaeVerifier(object):
+    """
+    Verifier of signed documents with a cache of certificate decisions
+    """
+
+    def __init__(self, trust_store, cache=None, streaming=False):
+        """
+        :param trust_store: TrustStore the signing certificates are validated
+                            against
+        :param cache: LRUCache with the decisions by certificate fingerprints,
+                      defaults to 1024 certificates for an hour
+        :param streaming: stream the digest computation, see check_signature
+        """
+        self.trust_store = trust_store
+        self.streaming = streaming
+        if cache is None:
+            cache = LRUCache(maxsize=1024, ttl=3600)
+        self.cache = cache
+
+    def certificate_error(self, certificates):
+        """
+        Validate the certificates of a signature, signing certificate first,
+        reusing the cached decision of their fingerprints. The intermediate
+        certificates are part of the key, as the chain built depends on them.
+        Only the decisions of the trust store are cached, any other error is
+        returned as is and the certificates checked again next time
+
+        :return: None when it is trusted, the error found otherwise
+        """
+        key = ':'.join(certificate_fingerprint(certificate)
+                       for certificate in certificates)
+        error = self.cache.get(key)
+        if error is None:
+            try:
+                self.trust_store.check(certificates[0], certificates[1:])
+                error = ''
+            except crypto.X509StoreContextError as e:
+                error = _certificate_error(e)
+            except Exception as e:
+                # Not a decision on the certificates, tried again next time
+                return _error(e)
+            self.cache.set(key, error)
+        return error or None
+
+    def result(self, checked):
+        """
+        Result of a document from its check_signature output, validating
+        the certificates of the signature against the trust store
+
+        :param checked: tuple (certificates, error) of check_signature
+        :return: VerifyResult
+        """
+        certificates, error = checked
+        if error is not None:
+            return VerifyResult(None, error)
+        return VerifyResult(certificate_fingerprint(certificates[0]),
+                            self.certificate_error(certificates))
+
+    def verify(self, document):
+        """
+        Verify a signed document in the current process
+
+        :return: VerifyResult
+        """
+        return self.result(check_signature(document,
+                                            streaming=self.streaming))
+
+    def verify_many(self, documents, workers=None, max_pending=None):
+        """
+        Verify many signed documents using a pool of processes
+
+        :param documents: iterable of signed documents
+        :param workers: number of processes, defaults to the number of CPUs.
+                        With 1 the documents are verified in the current
+                        process
+        :param max_pending: documents sent to the workers and not yet
+                            yielded, defaults to twice the number of workers
+        :return: iterator of VerifyResult, in the order of documents
+        """
+        if workers == 1:
+            for document in documents:
+                yield self.verify(document)
+            return
+
+        if self.streaming:
+            xmldsig.warn_in_memory()
+        workers = workers or cpu_count()
+        pool = Pool(workers, xmldsig.ignore_in_memory)
+        try:
+            check = partial(check_signature, streaming=self.streaming)
+            for checked in bounded_imap(pool, check, documents,
+                                        max_pending or 2 * workers):
+                yield self.result(checked)
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
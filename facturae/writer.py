@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming writer of Facturae batches
+
+    with FacturaeWriter('batch.xml', fileheader, parties) as writer:
+        for invoice in invoices:
+            writer.write(invoice)
+
+Every invoice is serialized and flushed as soon as it is written, so only the
+invoice being written is kept in memory. Its AttachmentSource values are
+encoded into the output in chunks.
+"""
+import shutil
+import tempfile
+
+from lxml import etree
+
+from . import facturae
+from .serializer import to_element, write_streamed
+from .totals import BatchTotals, compute_invoice
+
+
+class FacturaeWriter(object):
+    """
+    Write a FileHeader, Parties and a stream of Invoices as a document
+
+    When the Batch of the FileHeader already has its InvoicesCount, the
+    header is written as it is and the invoices go straight to the output.
+    Otherwise the invoices are spooled to a temporary file and, on close,
+    InvoicesCount, the batch totals and the Modality (if missing) are
+    computed from the written invoices and fed to the FileHeader before it
+    is written.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, target, fileheader, parties, compute_totals=False):
+        """
+        :param target: file name or binary file-like object
+        :param fileheader: fed FileHeader
+        :param parties: fed Parties
+        :param compute_totals: feed every invoice with the taxes and totals
+                               computed from its lines before writing it
+        """
+        self.target = target
+        self.fileheader = fileheader
+        self.parties = parties
+        self.compute_totals = compute_totals
+        self.spooled = fileheader.batch.invoicescount.value is None
+        self.totals = BatchTotals()
+
+        self._file = None
+        self._own_file = False
+        self._contexts = []
+        self._xf = None
+        self._spool = None
+        self.closed = False
+
+        if hasattr(target, 'write'):
+            self._file = target
+        else:
+            self._file = open(target, 'wb')
+            self._own_file = True
+
+        if self.spooled:
+            self._spool = tempfile.TemporaryFile()
+        else:
+            self._start()
+
+    def _enter(self, context):
+        res = context.__enter__()
+        self._contexts.append(context)
+        return res
+
+    def _start(self):
+        """Write everything up to the Invoices start tag"""
+        root = facturae.FacturaeRoot().root.element()
+
+        self._xf = self._enter(etree.xmlfile(self._file, encoding='UTF-8'))
+        self._xf.write_declaration()
+        self._enter(self._xf.element(root.tag, nsmap=root.nsmap))
+        self._xf.write(to_element(self.fileheader))
+        self._xf.write(to_element(self.parties))
+        self._enter(self._xf.element('Invoices'))
+        self._xf.flush()
+
+    def write(self, invoice):
+        """
+        Serialize an Invoice and write it to the output
+
+        :param invoice: fed Invoice, it can be discarded afterwards
+        """
+        if self.closed:
+            raise ValueError('Write to a closed FacturaeWriter')
+
+        if self.compute_totals:
+            self.totals.add(compute_invoice(invoice))
+        else:
+            self.totals.add_invoice(invoice)
+
+        sources = {}
+        element = to_element(invoice, sources)
+        if self.spooled:
+            with etree.xmlfile(self._spool, encoding='UTF-8') as xf:
+                write_streamed(xf, element, sources)
+        else:
+            write_streamed(self._xf, element, sources)
+            self._xf.flush()
+
+    def close(self):
+        """
+        Write the end of the document
+
+        :raises ValueError: when the InvoicesCount of a header written up
+                            front doesn't match the invoices written
+        """
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            if self.spooled:
+                self.totals.feed(self.fileheader)
+                self._start()
+                self._spool.seek(0)
+                shutil.copyfileobj(self._spool, self._file, self.CHUNK_SIZE)
+            elif int(self.fileheader.batch.invoicescount.value) != \
+                    self.totals.count:
+                raise ValueError(
+                    'InvoicesCount is {0} but {1} invoices were written'.format(
+                        self.fileheader.batch.invoicescount.value,
+                        self.totals.count))
+            while self._contexts:
+                self._contexts.pop().__exit__(None, None, None)
+        finally:
+            self._release()
+
+    def _release(self):
+        self.closed = True
+        self._contexts = []
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+        if self._own_file:
+            self._file.close()
+            self._own_file = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._release()
@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*-
+"""
+Enveloped XML signatures with streamed digests
+
+Signs and verifies the same signatures signxml does for Facturae documents
+(enveloped signature over the whole document, inclusive C14N, RSA) but the
+reference digest is computed by writing the canonical form of the document
+into the hash in chunks, instead of building it as a single string next to
+two private copies of the document.
+"""
+import base64
+import hashlib
+import os
+import sys
+import warnings
+
+from cryptography.exceptions import InvalidSignature as CryptoInvalidSignature
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.x509 import load_pem_x509_certificate
+from lxml import etree
+from signxml.exceptions import InvalidDigest, InvalidInput, InvalidSignature
+
+DS = 'http://www.w3.org/2000/09/xmldsig#'
+NSMAP = {'ds': DS}
+
+C14N = 'http://www.w3.org/TR/2001/REC-xml-c14n-20010315'
+C14N11 = 'http://www.w3.org/2006/12/xml-c14n11'
+ENVELOPED = DS + 'enveloped-signature'
+SHA256 = 'http://www.w3.org/2001/04/xmlenc#sha256'
+RSA_SHA256 = 'http://www.w3.org/2001/04/xmldsig-more#rsa-sha256'
+
+DIGESTS = {
+    DS + 'sha1': hashlib.sha1,
+    SHA256: hashlib.sha256,
+    'http://www.w3.org/2001/04/xmlenc#sha512': hashlib.sha512,
+}
+
+SIGNATURES = {
+    DS + 'rsa-sha1': hashes.SHA1,
+    RSA_SHA256: hashes.SHA256,
+    'http://www.w3.org/2001/04/xmldsig-more#rsa-sha512': hashes.SHA512,
+}
+
+#: Directory of the package, its frames are skipped by warn_in_memory
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__)) + os.sep
+
+# signxml drops these declarations from its inclusive C14N output
+EMPTY_DEFAULT_NS = b' xmlns=""'
+
+
+class UnsupportedSignature(InvalidInput):
+    """Signature using features this module doesn't implement"""
+
+
+class InMemoryC14NWarning(RuntimeWarning):
+    """The digest asked to be streamed is computed over an in-memory C14N"""
+
+
+def ds(tag):
+    return '{{{0}}}{1}'.format(DS, tag)
+
+
+class C14NDigest(object):
+    """
+    File-like target of a C14N serialization hashing what is written
+
+    EMPTY_DEFAULT_NS declarations are removed on the fly, also when they are
+    split across writes. The written data is hashed through memoryview
+    slices, only the last KEEP bytes of a write are copied and held back.
+    """
+
+    #: Bytes held back between writes, a split EMPTY_DEFAULT_NS is shorter
+    KEEP = len(EMPTY_DEFAULT_NS) - 1
+
+    def __init__(self, digest, skip=0, trim=0):
+        """
+        :param digest: hashlib object
+        :param skip: bytes dropped from the start of the output
+        :param trim: bytes dropped from the end of the output
+        """
+        self.digest = digest
+        self.skip = skip
+        self.trim = trim
+        self._pending = b''
+        self._held = b''
+
+    def write(self, data):
+        start, end = 0, len(data)
+        if self.skip:
+            start = min(self.skip, end)
+            self.skip -= start
+        if self.trim:
+            if end - start >= self.trim:
+                self._hash(self._held, 0, len(self._held))
+                self._held = data[end - self.trim:end]
+                end -= self.trim
+            else:
+                data = self._held + data[start:end]
+                start, end = 0, max(0, len(data) - self.trim)
+                self._held = data[end:]
+        self._hash(data, start, end)
+
+    def _hash(self, data, start, end):
+        if start >= end:
+            return
+        if self._pending:
+            pending = self._pending
+            self._pending = b''
+            if end - start <= self.KEEP:
+                data = pending + data[start:end]
+                start, end = 0, len(data)
+            else:
+                head = pending + data[start:start + self.KEEP]
+                pos = head.find(EMPTY_DEFAULT_NS)
+                if pos != -1 and pos < len(pending):
+                    self.digest.update(head[:pos])
+                    start += pos + len(EMPTY_DEFAULT_NS) - len(pending)
+                else:
+                    self.digest.update(pending)
+        view = memoryview(data)
+        while True:
+            pos = data.find(EMPTY_DEFAULT_NS, start, end)
+            if pos == -1:
+                break
+            self.digest.update(view[start:pos])
+            start = pos + len(EMPTY_DEFAULT_NS)
+        keep = max(start, end - self.KEEP)
+        self.digest.update(view[start:keep])
+        self._pending = data[keep:end]
+
+    def finish(self):
+        self.digest.update(self._pending)
+        self._pending = self._held = b''
+        return self.digest.digest()
+
+
+def c14n(element):
+    """
+    Inclusive C14N of an element, as signxml computes it: without comments,
+    as the same-document reference URI="" leaves them out
+    """
+    return etree.tostring(element, method='c14n',
+                          with_comments=False).replace(EMPTY_DEFAULT_NS, b'')
+
+
+_chunks_text = None
+
+
+def chunks_text():
+    """
+    Whether libxml2 writes the C14N of large text nodes in chunks, recent
+    releases write every text node, as an attachment, at once
+    """
+    global _chunks_text
+    if _chunks_text is None:
+        sizes = []
+
+        class Sink(object):
+            def write(self, data):
+                sizes.append(len(data))
+
+        root = etree.Element('Probe')
+        root.text = 'x' * 256 * 1024
+        etree.ElementTree(root).write_c14n(Sink())
+        _chunks_text = max(sizes) < len(root.text)
+    return _chunks_text
+
+
+def warn_in_memory():
+    """
+    Issue an InMemoryC14NWarning when the digests can't be streamed, see
+    chunks_text, attributed to the first caller outside this package
+    """
+    if chunks_text():
+        return
+    level, frame = 2, sys._getframe(1)
+    while frame is not None and os.path.abspath(
+            frame.f_code.co_filename).startswith(PACKAGE_DIR):
+        level, frame = level + 1, frame.f_back
+    warnings.warn(
+        'This libxml2 writes the C14N of a text node at once (lxml 6 and '
+        'later), the digest is computed over the canonical document built '
+        'in memory', InMemoryC14NWarning, stacklevel=level)
+
+
+def ignore_in_memory():
+    """
+    Ignore the InMemoryC14NWarning, as the initializer of the worker
+    processes whose callers were already warned
+    """
+    warnings.simplefilter('ignore', InMemoryC14NWarning)
+
+
+def _siblings_length(element, direction):
+    """
+    Bytes the processing instructions before or after the root element add
+    to the document C14N, each one and a line break
+    """
+    length = 0
+    node = getattr(element, direction)()
+    while node is not None:
+        if isinstance(node, etree._ProcessingInstruction):
+            length += len(etree.tostring(node, with_tail=False)) + 1
+        node = getattr(node, direction)()
+    return length
+
+
+def c14n_digest(element, digest=hashlib.sha256):
+    """
+    Digest of the inclusive C14N of a document element, streamed
+
+    When libxml2 doesn't write large text nodes in chunks, see chunks_text,
+    the canonical document is built in memory. The public entry points warn
+    their callers about it with warn_in_memory.
+
+    :param element: root element of its document
+    :param digest: hashlib constructor
+    """
+    # Processing instructions around the root element are part of the
+    # document C14N but not of the element one signxml digests
+    sink = C14NDigest(digest(), _siblings_length(element, 'getprevious'),
+                      _siblings_length(element, 'getnext'))
+    tree = etree.ElementTree(element)
+    if chunks_text():
+        tree.write_c14n(sink, with_comments=False)
+    else:
+        # The whole text nodes written would add to libxml2's own buffers
+        sink.write(etree.tostring(tree, method='c14n', with_comments=False))
+    return sink.finish()
+
+
+def _b64(data):
+    return base64.b64encode(data).decode('ascii')
+
+
+def sign(element, key, certificates):
+    """
+    Append an enveloped RSA-SHA256 signature to a document element
+
+    The Signature is the same signxml's XMLSigner builds with its defaults.
+
+    :param element: root element of the document, modified in place
+    :param key: cryptography RSA private key
+    :param certificates: base64 texts of the X509Certificate elements
+    :return: the signed element
+    """
+    digest_value = c14n_digest(element, hashlib.sha256)
+
+    signature = etree.Element(ds('Signature'), nsmap=NSMAP)
+    element.append(signature)
+    signed_info = etree.SubElement(signature, ds('SignedInfo'), nsmap=NSMAP)
+    etree.SubElement(signed_info, ds('CanonicalizationMethod'),
+                     Algorithm=C14N11)
+    etree.SubElement(signed_info, ds('SignatureMethod'), Algorithm=RSA_SHA256)
+    reference = etree.SubElement(signed_info, ds('Reference'), URI='')
+    transforms = etree.SubElement(reference, ds('Transforms'))
+    etree.SubElement(transforms, ds('Transform'), Algorithm=ENVELOPED)
+    etree.SubElement(transforms, ds('Transform'), Algorithm=C14N11)
+    etree.SubElement(reference, ds('DigestMethod'), Algorithm=SHA256)
+    etree.SubElement(reference, ds('DigestValue')).text = _b64(digest_value)
+
+    signature_value = etree.SubElement(signature, ds('SignatureValue'))
+    signature_value.text = _b64(key.sign(
+        c14n(signed_info), padding.PKCS1v15(), hashes.SHA256()
+    ))
+
+    key_info = etree.SubElement(signature, ds('KeyInfo'))
+    x509_data = etree.SubElement(key_info, ds('X509Data'))
+    for certificate in certificates:
+        etree.SubElement(x509_data, ds('X509Certificate')).text = certificate
+    return element
+
+
+def _remove(node):
+    """Remove a node from its parent keeping its tail text"""
+    parent = node.getparent()
+    if node.tail:
+        previous = node.getprevious()
+        if previous is not None:
+            previous.tail = (previous.tail or '') + node.tail
+        else:
+            parent.text = (parent.text or '') + node.tail
+    parent.remove(node)
+
+
+def _algorithm(node):
+    return node.get('Algorithm') if node is not None else None
+
+
+def verify(document, x509_cert=None):
+    """
+    Verify the enveloped signature of a document
+
+    Only checks the signature, not whether its certificate is trusted.
+
+    :param document: root element, file name or file-like object. Elements
+                     lose their Signature
+    :param x509_cert: PEM certificate to check the signature with, by
+                      default the first X509Certificate of the signature
+    :raises UnsupportedSignature: when the signature isn't an enveloped one
+                                  over the whole document with inclusive C14N
+    :raises InvalidSignature: when the SignatureValue doesn't match
+    :raises InvalidDigest: when the document doesn't match its digest
+    :return: the signed element, without its Signature
+    """
+    if etree.iselement(document):
+        root = document
+    else:
+        parser = etree.XMLParser(resolve_entities=False, no_network=True,
+                                 huge_tree=True)
+        root = etree.parse(document, parser).getroot()
+
+    signature = root.find(ds('Signature'))
+    if signature is None:
+        raise InvalidInput('Expected to find a Signature element')
+    signed_info = signature.find(ds('SignedInfo'))
+    references = signed_info.findall(ds('Reference'))
+    if len(references) != 1 or references[0].get('URI') != '':
+        raise UnsupportedSignature('Expected a single Reference to ""')
+    reference = references[0]
+    transforms = [_algorithm(transform) for transform in
+                  reference.iterfind('{0}/{1}'.format(ds('Transforms'),
+                                                      ds('Transform')))]
+    if (_algorithm(signed_info.find(ds('CanonicalizationMethod')))
+            not in (C14N, C14N11) or
+            not transforms or transforms[0] != ENVELOPED or
+            not set(transforms[1:]) <= set([C14N, C14N11])):
+        raise UnsupportedSignature('Unsupported transforms {0}'.format(
+            transforms))
+    digest = DIGESTS.get(_algorithm(reference.find(ds('DigestMethod'))))
+    signature_hash = SIGNATURES.get(
+        _algorithm(signed_info.find(ds('SignatureMethod'))))
+    if digest is None or signature_hash is None:
+        raise UnsupportedSignature('Unsupported digest or signature method')
+
+    if x509_cert is None:
+        certificate = signature.find('{0}/{1}/{2}'.format(
+            ds('KeyInfo'), ds('X509Data'), ds('X509Certificate')))
+        if certificate is None:
+            raise InvalidInput('Expected to find an X509Certificate')
+        body = ''.join(certificate.text.split())
+        x509_cert = '-----BEGIN CERTIFICATE-----\n{0}\n' \
+                    '-----END CERTIFICATE-----\n'.format(
+            '\n'.join(body[pos:pos + 64] for pos in range(0, len(body), 64)))
+    if not isinstance(x509_cert, bytes):
+        x509_cert = x509_cert.encode('ascii')
+    public_key = load_pem_x509_certificate(
+        x509_cert, default_backend()).public_key()
+
+    try:
+        public_key.verify(
+            base64.b64decode(signature.find(ds('SignatureValue')).text),
+            c14n(signed_info), padding.PKCS1v15(), signature_hash()
+        )
+    except CryptoInvalidSignature:
+        raise InvalidSignature('Signature verification failed')
+
+    expected = base64.b64decode(reference.find(ds('DigestValue')).text)
+    _remove(signature)
+    if c14n_digest(root, digest) != expected:
+        raise InvalidDigest('Digest mismatch for reference 0')
+    return root
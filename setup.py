@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 
+import sys
+
 from setuptools import setup, find_packages
+from setuptools.command.build_py import build_py
 from facturae import __version__
 
 with open('requirements.txt', 'r') as f:
@@ -9,6 +12,21 @@ with open('requirements.txt', 'r') as f:
 with open('requirements-dev.txt', 'r') as f:
     TESTS_REQUIRES = f.readlines()
 
+#: Modules using the syntax of a later Python, left out of older installs
+PY3_MODULES = {('facturae', 'aio'): (3, 7)}
+
+
+class BuildPy(build_py):
+    """Leaves out the modules the running Python can't compile"""
+
+    def find_package_modules(self, package, package_dir):
+        modules = build_py.find_package_modules(self, package, package_dir)
+        return [
+            (pkg, module, path) for pkg, module, path in modules
+            if sys.version_info >= PY3_MODULES.get((pkg, module), (0,))
+        ]
+
+
 setup(
     name='facturae',
     version=__version__,
@@ -17,14 +35,19 @@ setup(
     author_email='devel@gisce.net',
     original_author='Electrica Sollerense, S.A.U.',
     original_author_email='informatica@el-gas.es',
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*']),
+    cmdclass={'build_py': BuildPy},
+    package_data={'facturae': ['xsd/*.xsd']},
     install_requires=INSTALL_REQUIRES,
     tests_require=TESTS_REQUIRES,
+    extras_require={'parquet': ['pyarrow']},
     license='GPLv3',
     description='Facturae',
     long_description=open('README.md').read(),
     classifiers = [
         "Programming Language :: Python",
         "Programming Language :: Python :: 2.7",
+        "Programming Language :: Python :: 3",
+        "Programming Language :: Python :: 3.7",
     ]
 )
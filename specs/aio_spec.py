@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+import sys
+from datetime import datetime
+
+from expects import *
+
+import specs as test_data
+
+# facturae.aio needs Python 3.7
+if sys.version_info >= (3, 7):
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+    from facturae.aio import PARSE, VERIFY, Pipeline
+    from facturae.generator import FacturaeGenerator
+    from facturae.signing import FacturaeSigner
+    from facturae.verification import FacturaeVerifier, TrustStore
+
+    def collect(results, loop):
+        """Consume an async iterator without the async syntax of Python 3"""
+        res = []
+        try:
+            while True:
+                res.append(loop.run_until_complete(results.__anext__()))
+        except StopAsyncIteration:
+            return res
+
+    with description('Asyncio pipeline'):
+        with before.each:
+            with open('./specs/assets/facturae.xsig', 'rb') as f:
+                self.data = f.read()
+
+        with it('runs the documents through the stages with backpressure'):
+            documents = [self.data] * 6
+            documents[2] = b'<Facturae>'
+            read = []
+
+            def source():
+                for index, document in enumerate(documents):
+                    read.append(index)
+                    yield document
+
+            with Pipeline(executor=ThreadPoolExecutor(2), validate=True,
+                          fields=['InvoiceTotal'], max_pending=2,
+                          ordered=True) as pipeline:
+                results = pipeline.results(source())
+                loop = asyncio.new_event_loop()
+                try:
+                    first = loop.run_until_complete(results.__anext__())
+                    # max_pending documents, the one waiting for a slot and
+                    # the one read after the first result
+                    expect(len(read)).to(be_below_or_equal(4))
+                    results = [first] + collect(results, loop)
+                finally:
+                    loop.close()
+            expect([result.key for result in results]).to(
+                equal(list(range(6))))
+            expect(results[0].error).to(be_none)
+            expect(results[0].validation).to(equal([]))
+            expect(results[0].result['Invoices']).to(
+                equal([{'InvoiceTotal': '92.83'}]))
+            expect(results[2].error).to(contain('XMLSyntaxError'))
+            expect(results[2].result).to(be_none)
+
+        with it('verifies the signatures keeping the decisions here'):
+            with open(test_data.CERTIFICATE, 'rb') as f:
+                signer = FacturaeSigner.cached(f.read(),
+                                               test_data.CERTIFICATE_PASSWD)
+            generator = FacturaeGenerator(seed=1)
+            signed = [signer.sign(generator.root(1, start=index))
+                      for index in range(3)]
+            signed[1] = signed[1].replace(b'F000000001', b'F000000009')
+            verifier = FacturaeVerifier(TrustStore(
+                cafiles=[test_data.CERTIFICATE_PUBLIC],
+                verification_time=datetime(2018, 3, 20)))
+
+            with Pipeline(executor=ThreadPoolExecutor(2), verifier=verifier,
+                          fields=['InvoiceNumber'],
+                          ordered=True) as pipeline:
+                loop = asyncio.new_event_loop()
+                try:
+                    results = collect(pipeline.results(signed), loop)
+                finally:
+                    loop.close()
+
+            expect([result.error for result in results]).to(
+                equal([None, results[1].error, None]))
+            expect(results[1].error).to(contain('InvalidDigest'))
+            expect(results[1].result).to(be_none)
+            expect(results[0].verification.fingerprint).to(have_length(64))
+            expect(results[2].result['Invoices']).to(
+                equal([{'InvoiceNumber': 'F000000002'}]))
+            expect(len(verifier.cache)).to(equal(1))
+
+        with it('runs every stage in its own pool of processes by default'):
+            with Pipeline(concurrency={VERIFY: 1, PARSE: 2},
+                          fields=['InvoiceTotal']) as pipeline:
+                expect(sorted(set(type(executor).__name__ for executor
+                                  in pipeline._executors.values()))).to(
+                    equal(['ProcessPoolExecutor']))
+                loop = asyncio.new_event_loop()
+                try:
+                    results = collect(pipeline.results(
+                        [(name, self.data) for name in 'abc']), loop)
+                finally:
+                    loop.close()
+
+            expect(sorted(result.key for result in results)).to(
+                equal(['a', 'b', 'c']))
+            expect([result.result['Invoices'] for result in results]).to(
+                equal([[{'InvoiceTotal': '92.83'}]] * 3))
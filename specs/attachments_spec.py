@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import os
+
+from expects import *
+
+from facturae import attachments
+from facturae.attachments import (AttachmentPayload, decode_attachment,
+                                  encode_attachment)
+
+with description('Attachments'):
+    with before.each:
+        self.data = os.urandom(1024) * 64
+        self.spool_size = attachments.SPOOL_SIZE
+
+    with after.each:
+        attachments.SPOOL_SIZE = self.spool_size
+
+    with it('decodes the attachments it encodes'):
+        for compression in ('ZIP', 'GZIP', 'NONE'):
+            text = encode_attachment(self.data, compression=compression)
+
+            expect(decode_attachment(text, compression=compression)).to(
+                equal(self.data))
+
+    with it('spills the ZIP archives past SPOOL_SIZE to a file'):
+        attachments.SPOOL_SIZE = 1024
+        text = encode_attachment(os.urandom(64 * 1024), compression='ZIP')
+        expect(len(text)).to(be_above(attachments.SPOOL_SIZE))
+
+        spool = attachments._spool(attachments.decode_base64([text]))
+        expect(spool).not_to(be_a(attachments.BytesIO))
+        spool.close()
+
+        expect(len(decode_attachment(text, compression='ZIP'))).to(
+            equal(64 * 1024))
+
+    with it('sizes the documents without decompressing them'):
+        for compression in ('ZIP', 'GZIP', 'NONE'):
+            text = encode_attachment(self.data, compression=compression)
+            payload = AttachmentPayload(0, len(text), buf=text,
+                                        compression=compression,
+                                        encoding='BASE64')
+
+            expect(payload.document_size(chunk_size=1000)).to(
+                equal(len(self.data)))
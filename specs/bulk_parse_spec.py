@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+from multiprocessing import Process, Queue
+
+from expects import *
+from facturae.parse import get_cache, parse_many
+from specs.helpers import forking, open_cache
+
+with description('Bulk parse'):
+    with before.each:
+        self.tmpdir = tempfile.mkdtemp()
+        self.broken = os.path.join(self.tmpdir, 'broken.xsig')
+        with open(self.broken, 'w') as f:
+            f.write('<Facturae>')
+
+    with after.each:
+        shutil.rmtree(self.tmpdir)
+
+    with context('parse_many'):
+        with it('keeps the order and reports errors without aborting'):
+            sample = './specs/assets/facturae.xsig'
+            paths = [sample, self.broken, sample]
+
+            results = list(parse_many(paths, workers=2))
+
+            expect([r.path for r in results]).to(equal(paths))
+            expect(results[1].result).to(be_none)
+            expect(results[1].error).to(contain('XMLSyntaxError'))
+            for result in (results[0], results[2]):
+                expect(result.error).to(be_none)
+                expect(result.result['BatchIdentifier']).to(
+                    equal('F19001666A29446424'))
+                expect(result.result['Invoices'][0]['InvoiceNumber']).to(
+                    equal('F19001666'))
+
+    with context('get_cache'):
+        with it('opens a connection per process'):
+            cache = get_cache(self.tmpdir)
+            queue = Queue()
+            inherited = cache if forking() else None
+            worker = Process(target=open_cache,
+                             args=(self.tmpdir, queue, inherited))
+            worker.start()
+            worker.join()
+
+            expect(worker.exitcode).to(equal(0))
+            expect(queue.get()).to(equal((False, 0)))
+            expect(get_cache(self.tmpdir)).to(be(cache))
+            cache.close()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+import base64
+import csv
+import os
+import shutil
+import tempfile
+from datetime import date
+from decimal import Decimal
+
+from expects import *
+from facturae.export import CSVWriter, Exporter, ParquetWriter, export
+from facturae.facturae_parser import FacturaeParser
+from facturae.parse import parse_many
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+
+class MemoryWriter(object):
+
+    def __init__(self):
+        self.tables = {}
+        self.writes = 0
+
+    def write(self, table, rows):
+        self.tables.setdefault(table, []).extend(rows)
+        self.writes += 1
+
+
+with description('Columnar export'):
+    with before.each:
+        self.tmpdir = tempfile.mkdtemp()
+        self.paths = ['./specs/assets/facturae.xsig',
+                      os.path.join(self.tmpdir, 'copy.xsig')]
+        shutil.copy(self.paths[0], self.paths[1])
+
+    with after.each:
+        shutil.rmtree(self.tmpdir)
+
+    with it('flattens the results into typed rows written in chunks'):
+        writer = MemoryWriter()
+        exporter = Exporter(writer, chunk_size=4)
+        for result in parse_many(self.paths, workers=1):
+            exporter.add(result)
+        exporter.close()
+
+        tables = writer.tables
+        expect(len(tables['batches'])).to(equal(2))
+        expect(tables['batches'][1][:2]).to(
+            equal((self.paths[1], self.paths[1])))
+        invoice = tables['invoices'][0]
+        expect(invoice[2]).to(equal('F19001666'))
+        expect(invoice[6]).to(equal(date(2019, 3, 11)))
+        expect(invoice[14]).to(equal(Decimal('92.83')))
+        expect(len(tables['lines'])).to(equal(6))
+        expect(tables['taxes'][0][:4]).to(
+            equal((self.paths[0], 0, None, 0)))
+        expect(writer.writes).to(be_above(len(tables)))
+
+    with it('sizes the attachments by their decoded documents'):
+        with open(self.paths[0], 'rb') as f:
+            invoices = FacturaeParser(f.read()).factures
+        text = invoices[0]['Attachments'][0]['AttachmentData']
+        expected = len(base64.b64decode(text))
+
+        for options in ({}, {'lazy_attachments': True},
+                        {'decompress_attachments': True}):
+            writer = MemoryWriter()
+            exporter = Exporter(writer, decompressed_attachments=options.get(
+                'decompress_attachments', False))
+            for result in parse_many(self.paths[:1], workers=1, **options):
+                exporter.add(result)
+            exporter.close()
+
+            expect(expected).to(be_below(len(text)))
+            expect(writer.tables['attachments'][0][-1]).to(equal(expected))
+
+    with it('keys the batches by their BatchIdentifier without source'):
+        with open(self.paths[0], 'rb') as f:
+            result = FacturaeParser(f.read()).xml_dict
+        exporter = Exporter(MemoryWriter())
+
+        expect(exporter.add(result)).to(equal('F19001666A29446424'))
+        expect(exporter.add(result, source='inbox/1.xsig')).to(
+            equal('inbox/1.xsig'))
+        expect(lambda: exporter.add(dict(result, BatchIdentifier=None))).to(
+            raise_error(ValueError))
+
+    with it('writes a CSV file per table'):
+        batches = export(parse_many(self.paths, workers=1, typed=True),
+                         CSVWriter(self.tmpdir))
+
+        expect(batches).to(equal(2))
+        with open(os.path.join(self.tmpdir, 'lines.csv')) as f:
+            rows = list(csv.reader(f))
+        expect(rows[0][:3]).to(equal(['batch', 'invoice', 'line']))
+        expect(len(rows)).to(equal(7))
+        expect(rows[2][-1]).to(equal('61.43000000'))
+
+    if pq is not None:
+        with it('writes a Parquet file per table'):
+            batches = export(parse_many(self.paths, workers=1, typed=True),
+                             ParquetWriter(self.tmpdir))
+
+            expect(batches).to(equal(2))
+            table = pq.read_table(os.path.join(self.tmpdir, 'lines.parquet'))
+            expect(table.column_names[:3]).to(
+                equal(['batch', 'invoice', 'line']))
+            expect(table.num_rows).to(equal(6))
+            rows = table.to_pydict()
+            expect(rows['batch'][5]).to(equal(self.paths[1]))
+            expect(rows['TotalCost'][1]).to(equal(Decimal('61.43')))
+            table = pq.read_table(os.path.join(self.tmpdir,
+                                               'invoices.parquet'))
+            expect(table.to_pydict()['IssueDate'][0]).to(
+                equal(date(2019, 3, 11)))
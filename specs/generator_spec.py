@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+from io import BytesIO
+
+from expects import *
+from lxml import etree
+from facturae import writer
+from facturae.facturae_parser import FacturaeParser
+from facturae.generator import FacturaeGenerator
+
+with description('Generator'):
+    with context('write_batch'):
+        with it('writes the same documents for the same seed'):
+            first, second, other = BytesIO(), BytesIO(), BytesIO()
+
+            FacturaeGenerator(seed=1).write_batch(first, 3)
+            FacturaeGenerator(seed=1).write_batch(second, 3)
+            FacturaeGenerator(seed=2).write_batch(other, 3)
+
+            expect(first.getvalue()).to(equal(second.getvalue()))
+            expect(first.getvalue()).not_to(equal(other.getvalue()))
+
+        with it('writes the same document as the fed FacturaeRoot'):
+            generator = FacturaeGenerator(seed=1, attachment_size=1024)
+            root = generator.root(2)
+            root.build_tree()
+            output = BytesIO()
+
+            generator.write_batch(output, 2)
+
+            expect(output.getvalue()).to(equal(etree.tostring(
+                root.doc_root, encoding='UTF-8', xml_declaration=True)))
+
+        with it('writes totals matching the invoices'):
+            output = BytesIO()
+            FacturaeGenerator(seed=1).write_batch(output, 4)
+
+            parser = FacturaeParser(output.getvalue(), typed=True)
+
+            expect(parser.xml_dict['InvoicesCount']).to(equal(4))
+            expect(parser.xml_dict['TotalInvoicesAmount']).to(equal(
+                sum(invoice['InvoiceTotal'] for invoice in parser.factures)))
+            for invoice in parser.factures:
+                expect(invoice['TotalGrossAmount']).to(equal(
+                    sum(line['GrossAmount'] for line in invoice['InvoiceLines'])))
+                expect(invoice['InvoiceTotal']).to(equal(
+                    invoice['TotalGrossAmount'] + invoice['TotalTaxOutputs']))
+
+        with it('streams every invoice, generated once, to the target'):
+            generator = FacturaeGenerator(seed=1)
+            invoice_data = generator.invoice_data
+            generated = []
+
+            def counted(index):
+                generated.append(index)
+                return invoice_data(index)
+            generator.invoice_data = counted
+
+            def unspooled():
+                raise AssertionError('The invoices were spooled')
+            temporary_file = writer.tempfile.TemporaryFile
+            writer.tempfile.TemporaryFile = unspooled
+            try:
+                generator.write_batch(BytesIO(), 3, start=5)
+            finally:
+                writer.tempfile.TemporaryFile = temporary_file
+
+            expect(generated).to(equal([5, 6, 7]))
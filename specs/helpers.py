@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""
+Targets of the processes started by the specs
+
+mamba loads the spec files under names that can't be imported, these live
+in an importable module so they can be pickled with the spawn and
+forkserver start methods.
+"""
+import multiprocessing
+
+from facturae.parse import get_cache
+
+
+def forking():
+    """Whether the processes started inherit the memory of the parent"""
+    get_start_method = getattr(multiprocessing, 'get_start_method', None)
+    return get_start_method is None or get_start_method() == 'fork'
+
+
+def open_cache(directory, queue, inherited=None):
+    """
+    Report if the ParseCache of directory is inherited and its size
+
+    The check only proves something with the fork start method, where the
+    inherited argument is the very ParseCache the parent got from
+    get_cache. Under spawn and forkserver nothing is inherited, pass None.
+    """
+    cache = get_cache(directory)
+    queue.put((inherited is not None and cache is inherited, len(cache)))
+    cache.close()
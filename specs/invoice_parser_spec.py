@@ -1,6 +1,17 @@
 # -*- coding: utf-8 -*-
+import base64
+from copy import deepcopy
+from datetime import date
+from decimal import Decimal
+from io import BytesIO
+
 from expects import *
-from facturae.facturae_parser import FacturaeParser
+from lxml import etree
+from facturae import facturae
+from facturae.facturae_parser import FacturaeParser, peek_header
+from facturae.generator import FacturaeGenerator
+from facturae.records import _CODES, to_code
+from facturae.serializer import to_bytes
 
 with description('Facturae Invoice'):
     with before.each:
@@ -17,3 +28,188 @@ with description('Facturae Invoice'):
             expect(self.facturae.total_factures).to(equal('92.83'))
             expect(self.facturae.factures[0]['InvoiceNumber']).to(equal('F19001666'))
 
+    with context('iter_invoices'):
+        with it('yields the same invoices as the full parser'):
+            stream = FacturaeParser.iter_invoices('./specs/assets/facturae.xsig',
+                                                  chunk_size=4096)
+            expect(stream.sollicitud).to(equal('F19001666A29446424'))
+            expect(stream.vat_source).to(equal('A29446424'))
+            expect(stream.vat_destination).to(equal('B51065928'))
+            expect(stream.num_factures).to(equal('1'))
+            expect(stream.total_factures).to(equal('92.83'))
+
+            invoices = list(stream)
+            expect(invoices).to(equal(self.facturae.factures))
+            expect(stream._file.closed).to(be_true)
+
+        with it('streams a batch with many invoices'):
+            root = etree.parse('./specs/assets/facturae.xsig').getroot()
+            invoices = root.find('Invoices')
+            for number in ('F19001667', 'F19001668'):
+                invoice = deepcopy(invoices[0])
+                invoice.find('InvoiceHeader/InvoiceNumber').text = number
+                invoices.append(invoice)
+            data = etree.tostring(root)
+
+            stream = FacturaeParser.iter_invoices(BytesIO(data),
+                                                  chunk_size=512)
+            invoices = list(stream)
+
+            expect([invoice['InvoiceNumber'] for invoice in invoices]).to(
+                equal(['F19001666', 'F19001667', 'F19001668']))
+            expect(invoices).to(equal(FacturaeParser(data).factures))
+
+    with context('lazy attachments'):
+        with it('decodes the AttachmentData on demand'):
+            expected = base64.b64decode(
+                self.facturae.factures[0]['Attachments'][0]['AttachmentData'])
+
+            with open('./specs/assets/facturae.xsig', 'rb') as f:
+                parser = FacturaeParser(f.read(), lazy_attachments=True)
+            payload = parser.factures[0]['Attachments'][0]['AttachmentData']
+            expect(payload.format).to(equal('pdf'))
+            expect(payload.read()).to(equal(expected))
+
+            stream = FacturaeParser.iter_invoices(
+                './specs/assets/facturae.xsig', lazy_attachments=True)
+            payload = list(stream)[0]['Attachments'][0]['AttachmentData']
+            expect(payload.path).not_to(be_none)
+            expect(b''.join(payload.iter_chunks(1001))).to(equal(expected))
+
+        with it('decompresses the attachments built compressed'):
+            document = b'%PDF-1.4\n' + b'0123456789' * 10000
+            root = FacturaeGenerator(seed=1).root(1)
+            for compression in ('ZIP', 'GZIP'):
+                attachment = facturae.Attachment()
+                attachment.feed_data(data=document, attachmentformat='pdf',
+                                     compression=compression)
+                root.invoices.invoice[0].additionaldata.relateddocuments.feed(
+                    {'attachment': [attachment]})
+
+                parser = FacturaeParser(to_bytes(root), lazy_attachments=True)
+                attachment = parser.factures[0]['Attachments'][0]
+                payload = attachment['AttachmentData']
+
+                expect(attachment['AttachmentCompressionAlgorithm']).to(
+                    equal(compression))
+                expect(payload.size).to(be_below(len(document) // 10))
+                expect(payload.read()).to(equal(document))
+
+        with it('decompresses the attachments when parsing'):
+            document = b'%PDF-1.4\n' + b'0123456789' * 10000
+            root = FacturaeGenerator(seed=1).root(1)
+            for compression in ('GZIP', 'ZIP'):
+                attachment = facturae.Attachment()
+                attachment.feed_data(data=document, attachmentformat='pdf',
+                                     compression=compression)
+                root.invoices.invoice[0].additionaldata.relateddocuments.feed(
+                    {'attachment': [attachment]})
+                data = to_bytes(root)
+
+                parser = FacturaeParser(data, decompress_attachments=True)
+                attachment = parser.factures[0]['Attachments'][0]
+                expect(attachment['AttachmentCompressionAlgorithm']).to(
+                    equal(compression))
+                expect(attachment['AttachmentData']).to(equal(document))
+
+                stream = FacturaeParser.iter_invoices(
+                    BytesIO(data), decompress_attachments=True,
+                    fields=['AttachmentData'])
+                attachment = list(stream)[0]['Attachments'][0]
+                expect(attachment['AttachmentData']).to(equal(document))
+
+                parser = FacturaeParser(data)
+                attachment = parser.factures[0]['Attachments'][0]
+                expect(attachment['AttachmentData']).not_to(equal(document))
+
+    with context('typed'):
+        with it('returns records with converted values'):
+            with open('./specs/assets/facturae.xsig', 'rb') as f:
+                parser = FacturaeParser(f.read(), typed=True)
+
+            expect(parser.num_factures).to(equal(1))
+            expect(parser.total_factures).to(equal(Decimal('92.83')))
+            expect(parser.vat_source).to(equal('A29446424'))
+
+            invoice = parser.factures[0]
+            expect(invoice.invoicenumber).to(equal('F19001666'))
+            expect(invoice['InvoiceNumber']).to(equal('F19001666'))
+            expect(invoice.invoiceseriescode).to(be_none)
+            expect(invoice.issuedate).to(equal(date(2019, 3, 11)))
+            expect(invoice.invoicetotal).to(equal(Decimal('92.83')))
+            expect(invoice.taxes[1].taxrate).to(equal(Decimal('21')))
+            expect(invoice.invoicelines[0].taxesoutputs[0].taxamount).to(
+                be_none)
+            expect(invoice.taxes[1].taxtypecode).to(
+                be(invoice.invoicelines[0].taxesoutputs[0].taxtypecode))
+
+        with it('shares the code values keeping a bounded number'):
+            codes = [to_code('C{0}'.format(number))
+                     for number in range(2 * _CODES.maxsize)]
+
+            expect(len(_CODES)).to(equal(_CODES.maxsize))
+            last = 'C{0}'.format(2 * _CODES.maxsize - 1)
+            expect(to_code(last)).to(be(codes[-1]))
+
+    with context('fields'):
+        with it('extracts only the requested fields'):
+            fields = ['BatchIdentifier', 'TaxIdentificationNumber',
+                      'InvoiceTotal', 'GrossAmount']
+            with open('./specs/assets/facturae.xsig', 'rb') as f:
+                parser = FacturaeParser(f.read(), fields=fields)
+
+            expect(parser.sollicitud).to(equal('F19001666A29446424'))
+            expect(parser.vat_source).to(equal('A29446424'))
+            expect(parser.num_factures).to(be_false)
+            invoice = parser.factures[0]
+            expect(sorted(invoice.keys())).to(equal(
+                ['InvoiceLines', 'InvoiceTotal']))
+            expect(invoice['InvoiceLines'][1]).to(
+                equal({'GrossAmount': '61.43000000'}))
+
+            stream = FacturaeParser.iter_invoices(
+                './specs/assets/facturae.xsig', typed=True, fields=fields)
+            invoice = list(stream)[0]
+            expect(invoice.invoicetotal).to(equal(Decimal('92.83')))
+            expect(invoice.invoicenumber).to(be_none)
+            expect(invoice.attachments).to(be_none)
+
+        with it('decodes the lazy attachments of a projection'):
+            with open('./specs/assets/facturae.xsig', 'rb') as f:
+                data = f.read()
+            expected = FacturaeParser(data, lazy_attachments=True).factures[
+                0]['Attachments'][0]['AttachmentData'].read()
+
+            parser = FacturaeParser(data, lazy_attachments=True,
+                                    fields=['AttachmentData'])
+            attachment = parser.factures[0]['Attachments'][0]
+            expect(attachment).to(have_keys('AttachmentData'))
+            expect(attachment).not_to(have_key('AttachmentEncoding'))
+            expect(attachment['AttachmentData'].read()).to(equal(expected))
+
+            stream = FacturaeParser.iter_invoices(
+                './specs/assets/facturae.xsig', lazy_attachments=True,
+                fields=['AttachmentData'])
+            payload = list(stream)[0]['Attachments'][0]['AttachmentData']
+            expect(payload.format).to(equal('pdf'))
+            expect(payload.read()).to(equal(expected))
+
+        with it('rejects unknown fields'):
+            expect(lambda: FacturaeParser(b'', fields=['Unknown'])).to(
+                raise_error(ValueError))
+
+    with context('peek_header'):
+        with it('reads the header values from the start of the document'):
+            with open('./specs/assets/facturae.xsig', 'rb') as f:
+                header = peek_header(f, chunk_size=4096)
+                expect(f.tell()).to(be_below(16 * 1024))
+
+            expect(header.sollicitud).to(equal(self.facturae.sollicitud))
+            expect(header.num_factures).to(equal(self.facturae.num_factures))
+            expect(header.total_factures).to(
+                equal(self.facturae.total_factures))
+            expect(header.vat_source).to(equal(self.facturae.vat_source))
+            expect(header.vat_destination).to(
+                equal(self.facturae.vat_destination))
+            expect(peek_header('./specs/assets/facturae.xsig')).to(
+                equal(header))
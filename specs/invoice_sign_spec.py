@@ -1,9 +1,20 @@
 # -*- coding: utf-8 -*-
 
+import hashlib
+import hmac
 import sys
 sys.path.insert(0, '.')
 
+from io import BytesIO
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.serialization import pkcs12
+
 from facturae import facturae
+from facturae.generator import FacturaeGenerator
+from facturae.signing import FacturaeSigner, sign_many
 import signxml
 import specs as test_data
 
@@ -61,3 +72,75 @@ with description('Invoice'):
                 works = False
 
             assert works, "Sign verification must be accomplished"
+
+        with it('must sign a fed document so that its signature verifies'):
+            root = FacturaeGenerator(seed=1).root(2)
+            public = open(test_data.CERTIFICATE_PUBLIC).read()
+
+            signed = root.sign(self.certificate, self.password)
+
+            # Pin the self-signed cert so the digest and signature are checked
+            verified = signxml.XMLVerifier().verify(signed, x509_cert=public)
+            assert verified.signed_xml is not None
+
+            output = BytesIO()
+            assert root.sign(self.certificate, self.password,
+                             target=output) is None
+            assert output.getvalue() == signed
+
+    with context('FacturaeSigner'):
+        with it('must sign as FacturaeRoot.sign reusing the key material'):
+            root = FacturaeGenerator(seed=1).root(1)
+
+            signer = FacturaeSigner.cached(self.certificate, self.password)
+
+            assert FacturaeSigner.cached(
+                self.certificate, self.password) is signer
+            assert len(signer.fingerprint) == 64
+            for _ in range(2):
+                assert signer.sign(root) == root.sign(
+                    self.certificate, self.password)
+
+        with it('must share the signer of a certificate between exports'):
+            signer = FacturaeSigner.cached(self.certificate, self.password)
+            cert = x509.load_pem_x509_certificate(signer.cert,
+                                                  default_backend())
+            exported = pkcs12.serialize_key_and_certificates(
+                b'other', signer.key, cert, None,
+                serialization.BestAvailableEncryption(b'other'))
+
+            assert FacturaeSigner.cached(exported, 'other') is signer
+            assert FacturaeSigner.cache.get(signer.fingerprint) is signer
+
+        with it('must not index the signers by a plain hash of the password'):
+            FacturaeSigner.cached(self.certificate, self.password)
+            password = self.password
+            if not isinstance(password, bytes):
+                password = password.encode('utf-8')
+
+            assert FacturaeSigner.fingerprints.get(hashlib.sha256(
+                self.certificate + b'\0' + password).hexdigest()) is None
+            assert FacturaeSigner.fingerprints.get(hmac.new(
+                FacturaeSigner.index_key, self.certificate + b'\0' + password,
+                hashlib.sha256).hexdigest()) is not None
+
+    with context('sign_many'):
+        with it('must sign every document keeping their order'):
+            generator = FacturaeGenerator(seed=1)
+            roots = [generator.root(1, start=index) for index in range(4)]
+            signer = FacturaeSigner.cached(self.certificate, self.password)
+
+            signed = list(sign_many(iter(roots), self.certificate,
+                                    self.password, workers=2, max_pending=2))
+
+            assert signed == [signer.sign(root) for root in roots]
+
+        with it('must reject a wrong password when called'):
+            for password, workers in (('wrong', None), (self.password, 0)):
+                try:
+                    sign_many(iter([]), self.certificate, password,
+                              workers=workers)
+                except ValueError:
+                    pass
+                else:
+                    raise AssertionError('sign_many did not raise')
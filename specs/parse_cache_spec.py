@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import json
+import shutil
+import tempfile
+from datetime import date
+from decimal import Decimal
+
+from expects import *
+from facturae.facturae_parser import FacturaeParser
+from facturae.parse_cache import ParseCache, loads
+
+with description('Parse cache'):
+    with before.each:
+        self.tmpdir = tempfile.mkdtemp()
+        with open('./specs/assets/facturae.xsig', 'rb') as f:
+            self.data = f.read()
+
+    with after.each:
+        shutil.rmtree(self.tmpdir)
+
+    with it('serves the stored results by document and options'):
+        with ParseCache(self.tmpdir) as cache:
+            result = cache.parse(self.data)
+            expect(result).to(equal(FacturaeParser(self.data).xml_dict))
+            typed = cache.parse(self.data, typed=True)
+            expect(len(cache)).to(equal(2))
+
+        with ParseCache(self.tmpdir) as cache:
+            expect(cache.get(self.data)).to(equal(result))
+            expect(cache.get(self.data, typed=True)).to(equal(typed))
+            expect(cache.get(self.data, fields=['InvoiceTotal'])).to(be_none)
+
+    with it('evicts the least recently used results'):
+        with ParseCache(self.tmpdir) as cache:
+            cache.parse(self.data)
+            cache.max_size = 1024
+            cache.set(b'<Facturae/>', {'Invoices': []})
+            expect(len(cache)).to(equal(1))
+            expect(cache.get(b'<Facturae/>')).to(equal({'Invoices': []}))
+
+    with it('keeps the results of other extraction tables'):
+        with ParseCache(self.tmpdir) as cache:
+            cache.parse(self.data)
+            cache.version = cache.version.replace(cache.fingerprint, 'old')
+
+            expect(cache.get(self.data)).to(be_none)
+
+        with ParseCache(self.tmpdir) as cache:
+            expect(len(cache)).to(equal(1))
+            expect(cache.get(self.data)).not_to(be_none)
+
+    with it('stores the results as JSON rebuilding their types'):
+        with ParseCache(self.tmpdir) as cache:
+            typed = cache.parse(self.data, typed=True)
+            value = cache.connection.execute(
+                'SELECT value FROM results').fetchone()[0]
+            result = {'Invoices': [], 'Amount': Decimal('1.50'),
+                      'IssueDate': date(2019, 3, 11), 'Data': b'\x00\xff'}
+            cache.set(b'<Facturae/>', result)
+
+            expect(json.loads(bytes(value).decode('utf-8'))).to(
+                have_key('Invoices'))
+            expect(loads(bytes(value))).to(equal(typed))
+            expect(cache.get(b'<Facturae/>')).to(equal(result))
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+from decimal import Decimal
+from io import BytesIO
+
+from expects import *
+from lxml import etree
+
+from facturae import facturae
+from facturae.facturae_parser import FacturaeParser
+from facturae.generator import FacturaeGenerator
+from facturae.serializer import to_bytes, to_element, write_model
+from facturae.utils import LRUCache
+
+with description('Serializer'):
+    with context('to_bytes'):
+        with it('renders the same document as build_tree'):
+            root = FacturaeGenerator(seed=1, attachment_size=512).root(2)
+
+            serialized = to_bytes(root)
+
+            root.build_tree()
+            expect(serialized).to(equal(etree.tostring(
+                root.doc_root, xml_declaration=True, encoding='UTF-8')))
+
+        with it('reflects the models fed after a previous serialization'):
+            header = facturae.FileHeader()
+            header.feed({'schemaversion': '3.2.1'})
+            to_bytes(header)
+
+            header.feed({'modality': 'I'})
+
+            expect(to_bytes(header, xml_declaration=False)).to(equal(
+                b'<FileHeader><SchemaVersion>3.2.1</SchemaVersion>'
+                b'<Modality>I</Modality></FileHeader>'))
+
+        with it('leaves out the lazy members never used'):
+            line = facturae.InvoiceLine()
+            line.feed({'itemdescription': 'Item', 'articlecode': 'A1'})
+
+            serialized = to_bytes(line, xml_declaration=False)
+
+            expect(serialized).to(equal(
+                b'<InvoiceLine><ItemDescription>Item</ItemDescription>'
+                b'<ArticleCode>A1</ArticleCode></InvoiceLine>'))
+            expect(line.created('taxesoutputs')).to(be_none)
+            line.build_tree()
+            expect(etree.tostring(line.doc_root)).to(equal(serialized))
+
+    with context('fragment cache'):
+        with it('reuses the rendered parties while their content is the same'):
+            cache = LRUCache(maxsize=4)
+            _, parties = FacturaeGenerator(seed=1).header(1)
+            seller = parties.sellerparty
+            expected = to_bytes(seller)
+
+            first = to_element(seller, cache=cache)
+            second = to_element(seller, cache=cache)
+            seller.legalentity.feed({'corporatename': 'Other S.L.'})
+            changed = to_element(seller, cache=cache)
+
+            expect(len(cache)).to(equal(2))
+            expect(first).not_to(be(second))
+            expect(etree.tostring(second)).to(equal(etree.tostring(first)))
+            expect(etree.tostring(first)).to(equal(expected.split(b'>', 1)[1]
+                                                   .lstrip()))
+            expect(etree.tostring(changed)).to(contain(b'Other S.L.'))
+
+        with it('tells apart equal values rendered differently'):
+            cache = LRUCache(maxsize=8)
+            _, parties = FacturaeGenerator(seed=1).header(1)
+            address = parties.sellerparty.legalentity.addressinspain
+            rendered = []
+            for postcode in (8001, 8001.0, True, 1,
+                             Decimal('8001'), Decimal('8001.0')):
+                address.feed({'postcode': postcode})
+                rendered.append(etree.tostring(
+                    to_element(parties.sellerparty, cache=cache)))
+
+            expect([text.count(b'<PostCode>8001</PostCode>')
+                    for text in rendered]).to(equal([1, 0, 0, 0, 1, 0]))
+            expect(rendered[1]).to(contain(b'<PostCode>8001.0</PostCode>'))
+            expect(rendered[2]).to(contain(b'<PostCode>True</PostCode>'))
+            expect(rendered[3]).to(contain(b'<PostCode>1</PostCode>'))
+            expect(rendered[5]).to(contain(b'<PostCode>8001.0</PostCode>'))
+
+    with context('write_model'):
+        with it('encodes attachment sources into the output'):
+            document = b'%PDF-1.4\n' + b'0123456789' * 10000
+            root = FacturaeGenerator(seed=1).root(1)
+            attachment = facturae.Attachment()
+            attachment.feed_data(data=document, attachmentformat='pdf',
+                                 stream=True)
+            root.invoices.invoice[0].additionaldata.relateddocuments.feed(
+                {'attachment': [attachment]})
+            output = BytesIO()
+
+            write_model(root, output)
+
+            expect(output.getvalue()).to(equal(to_bytes(root)))
+            parser = FacturaeParser(output.getvalue(), lazy_attachments=True)
+            payload = parser.factures[0]['Attachments'][0]['AttachmentData']
+            expect(payload.read()).to(equal(document))
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+from decimal import Decimal
+
+from expects import *
+
+from facturae import facturae
+from facturae.generator import FacturaeGenerator
+from facturae.serializer import to_bytes
+from facturae.totals import compute_invoice
+
+INVOICE_TOTALS = ('totalgrossamount', 'totalgrossamountbeforetaxes',
+                  'totaltaxoutputs', 'invoicetotal', 'totaloutstandingamount',
+                  'totalexecutableamount')
+
+with description('Totals'):
+    with it('derives the taxes and totals of a batch from its lines'):
+        root = FacturaeGenerator(seed=3, lines=(1, 40)).root(5)
+        expected = to_bytes(root)
+        for invoice in root.invoices.invoice:
+            invoice.taxesoutputs.feed({'tax': []})
+            invoice.invoicetotals.feed(dict.fromkeys(INVOICE_TOTALS))
+            for line in invoice.items.invoiceline:
+                line.feed({'grossamount': None})
+        root.fileheader.batch.feed({'invoicescount': None})
+
+        batch = root.compute_totals()
+
+        expect(batch.count).to(equal(5))
+        expect(to_bytes(root)).to(equal(expected))
+
+    with it('computes the line amounts and rounds half up'):
+        line = facturae.InvoiceLine()
+        line.feed({'itemdescription': 'Item', 'quantity': Decimal('3'),
+                   'unitpricewithouttax': Decimal('0.845')})
+        discount = facturae.Discount()
+        discount.feed({'discountamount': Decimal('0.5')})
+        line.discountandrebates.feed({'discount': [discount]})
+        for rate in ('21', '21', '10'):
+            tax = facturae.Tax()
+            tax.feed({'taxrate': Decimal(rate)})
+            line.taxesoutputs.feed({'tax': line.taxesoutputs.tax + [tax]})
+        invoice = facturae.Invoice()
+        invoice.items.feed({'invoiceline': [line]})
+
+        totals = compute_invoice(invoice)
+
+        expect(line.totalcost.value).to(equal('2.53500000'))
+        expect(totals.gross).to(equal(Decimal('2.04')))
+        expect([(tax.rate, tax.base, tax.amount)
+                for tax in totals.taxes_outputs]).to(equal([
+            (Decimal('21'), Decimal('4.07'), Decimal('0.85')),
+            (Decimal('10'), Decimal('2.04'), Decimal('0.20'))]))
+        expect(totals.total).to(equal(Decimal('3.09')))
+        expect(invoice.invoicetotals.invoicetotal.value).to(equal('3.09'))
+
+    with it('deducts subsidies and adds expenses as the schema defines'):
+        root = FacturaeGenerator(seed=3).root(1)
+        invoice = root.invoices.invoice[0]
+        invoice_totals = invoice.invoicetotals
+        subsidy = facturae.Subsidy()
+        subsidy.feed({'subsidydescription': 'Plan',
+                      'subsidyamount': Decimal('10.00')})
+        invoice_totals.subsidies.feed({'subsidy': [subsidy]})
+        payment = facturae.PaymentOnAccount()
+        payment.feed({'paymentonaccountdate': '2019-03-11',
+                      'paymentonaccountamount': Decimal('5.00')})
+        invoice_totals.paymentsonaccount.feed({'paymentonaccount': [payment]})
+        invoice_totals.amountswithheld.feed({
+            'withholdingreason': 'Guarantee',
+            'withholdingamount': Decimal('2.00')})
+        expense = facturae.ReinbursableExpens()
+        expense.feed({'reinbursableexpensesamount': Decimal('3.50')})
+        invoice_totals.reinbursableexpenses.feed(
+            {'reinbursableexpens': [expense]})
+        invoice_totals.feed({'totalfinancialexpenses': Decimal('1.25')})
+
+        totals = compute_invoice(invoice)
+
+        expect(totals.outstanding).to(equal(totals.total - Decimal('15.00')))
+        expect(totals.executable).to(
+            equal(totals.outstanding - Decimal('2.00') + Decimal('4.75')))
+        expect(invoice_totals.totaloutstandingamount.value).to(
+            equal('%.2f' % totals.outstanding))
+        expect(invoice_totals.totalpaymentsonaccount.value).to(
+            equal(Decimal('5.00')))
+        expect(invoice_totals.totalreinbursableexpenses.value).to(
+            equal(Decimal('3.50')))
+        expect(root.validate()).to(equal([]))
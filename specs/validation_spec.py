@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+from io import BytesIO
+
+from expects import *
+
+import specs as test_data
+from facturae.facturae_parser import FacturaeParser
+from facturae.generator import FacturaeGenerator
+from facturae.serializer import to_bytes
+from facturae.validation import InvalidDocument, get_schema, validate
+
+with description('Validation'):
+    with before.each:
+        self.root = FacturaeGenerator(seed=1).root(2)
+
+    with it('compiles each schema version once'):
+        expect(get_schema('3.2.1')).to(be(get_schema()))
+        expect(lambda: get_schema('0.1')).to(raise_error(ValueError))
+
+    with it('accepts the generated and the signed sample documents'):
+        expect(self.root.validate()).to(equal([]))
+        with open('specs/assets/facturae.xsig', 'rb') as f:
+            expect(validate(f.read())).to(equal([]))
+
+    with it('returns the violations with their location'):
+        self.root.fileheader.feed({'modality': 'X'})
+
+        errors = self.root.validate()
+
+        expect(errors).to(have_length(1))
+        expect(errors[0].path).to(equal('/fe:Facturae/FileHeader/Modality'))
+        expect(errors[0].message).to(contain('Modality'))
+        parsed_errors = FacturaeParser(to_bytes(self.root)).validate()
+        expect([(e.path, e.message) for e in parsed_errors]).to(
+            equal([(e.path, e.message) for e in errors]))
+
+    with it('refuses to sign invalid documents when asked to'):
+        self.root.fileheader.feed({'modality': 'X'})
+        with open(test_data.CERTIFICATE, 'rb') as f:
+            certificate = f.read()
+
+        expect(lambda: self.root.sign(
+            certificate, test_data.CERTIFICATE_PASSWD, validate=True)
+        ).to(raise_error(InvalidDocument))
+
+    with it('validates while streaming'):
+        self.root.fileheader.feed({'modality': 'X'})
+        source = BytesIO(to_bytes(self.root))
+
+        def parse():
+            with FacturaeParser.iter_invoices(source, validate=True) as stream:
+                list(stream)
+
+        expect(parse).to(raise_error(InvalidDocument))
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+import base64
+import os
+import shutil
+import tempfile
+from copy import deepcopy
+from datetime import datetime
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.serialization import pkcs12
+from cryptography.x509.oid import NameOID
+from expects import *
+from lxml import etree
+from signxml import XMLSigner, methods
+
+import specs as test_data
+from facturae.generator import FacturaeGenerator
+from facturae.serializer import to_document, to_element
+from facturae.signing import FacturaeSigner
+from facturae.verification import (FacturaeVerifier, TrustStore,
+                                   check_signature)
+
+# The bundled certificate is valid from 2018-03-13 to 2018-04-12
+VALID_TIME = datetime(2018, 3, 20)
+
+
+def issue(subject, key, issuer=None, issuer_key=None, ca=False):
+    """Certificate of key, self-signed when no issuer is given"""
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, subject)])
+    return x509.CertificateBuilder().subject_name(name).issuer_name(
+        issuer.subject if issuer else name).public_key(
+        key.public_key()).serial_number(x509.random_serial_number()
+    ).not_valid_before(datetime(2018, 3, 13)).not_valid_after(
+        datetime(2018, 4, 12)).add_extension(
+        x509.BasicConstraints(ca=ca or issuer is None, path_length=None),
+        critical=True).sign(issuer_key or key, hashes.SHA256(),
+                            default_backend())
+
+with description('Verification'):
+    with before.each:
+        with open(test_data.CERTIFICATE, 'rb') as f:
+            self.certificate = f.read()
+        signer = FacturaeSigner.cached(self.certificate,
+                                       test_data.CERTIFICATE_PASSWD)
+        generator = FacturaeGenerator(seed=1)
+        self.signed = [signer.sign(generator.root(1, start=index))
+                       for index in range(3)]
+        self.tmpdir = tempfile.mkdtemp()
+
+    with after.each:
+        shutil.rmtree(self.tmpdir)
+
+    with it('checks every document and validates each certificate once'):
+        tampered = self.signed[0].replace(b'F000000000', b'F000000009')
+        verifier = FacturaeVerifier(TrustStore(
+            cafiles=[test_data.CERTIFICATE_PUBLIC],
+            verification_time=VALID_TIME))
+
+        results = list(verifier.verify_many(self.signed + [tampered],
+                                            workers=2))
+
+        expect([r.valid for r in results]).to(equal([True, True, True, False]))
+        expect(results[3].error).to(contain('InvalidDigest'))
+        expect(len(verifier.cache)).to(equal(1))
+
+    with it('streams the digests when asked to'):
+        tampered = self.signed[0].replace(b'F000000000', b'F000000009')
+        verifier = FacturaeVerifier(TrustStore(
+            cafiles=[test_data.CERTIFICATE_PUBLIC],
+            verification_time=VALID_TIME), streaming=True)
+
+        results = list(verifier.verify_many(self.signed + [tampered],
+                                            workers=2))
+
+        expect([r.valid for r in results]).to(equal([True, True, True, False]))
+        expect(results[3].error).to(contain('InvalidDigest'))
+
+    with it('rejects certificates missing from the trust store'):
+        verifier = FacturaeVerifier(TrustStore(verification_time=VALID_TIME))
+
+        result = verifier.verify(self.signed[0])
+
+        expect(result.fingerprint).to(have_length(64))
+        expect(result.error).to(start_with('InvalidCertificate'))
+
+    with it('rejects certificates revoked by a local CRL'):
+        # OpenSSL doesn't check the trust anchors themselves against CRLs
+        ca_key, key = [rsa.generate_private_key(65537, 2048, default_backend())
+                       for _ in range(2)]
+        ca = issue(u'CA', ca_key)
+        cert = issue(u'Signer', key, ca, ca_key)
+        revoked = x509.RevokedCertificateBuilder().serial_number(
+            cert.serial_number).revocation_date(datetime(2018, 3, 14)).build(
+            default_backend())
+        crl = x509.CertificateRevocationListBuilder().issuer_name(
+            ca.subject).last_update(datetime(2018, 3, 14)).next_update(
+            datetime(2018, 4, 1)).add_revoked_certificate(revoked).sign(
+            ca_key, hashes.SHA256(), default_backend())
+        cafile = os.path.join(self.tmpdir, 'ca.pem')
+        with open(cafile, 'wb') as f:
+            f.write(ca.public_bytes(serialization.Encoding.PEM))
+        crlfile = os.path.join(self.tmpdir, 'ca.crl')
+        with open(crlfile, 'wb') as f:
+            f.write(crl.public_bytes(serialization.Encoding.DER))
+        signer = FacturaeSigner(pkcs12.serialize_key_and_certificates(
+            b'signer', key, cert, None,
+            serialization.BestAvailableEncryption(b'secret')), b'secret')
+        signed = signer.sign(FacturaeGenerator(seed=1).root(1))
+
+        trusted = FacturaeVerifier(TrustStore(
+            cafiles=[cafile], verification_time=VALID_TIME))
+        verifier = FacturaeVerifier(TrustStore(
+            cafiles=[cafile], crlfiles=[crlfile],
+            verification_time=VALID_TIME))
+
+        expect(trusted.verify(signed).error).to(be_none)
+        expect(verifier.verify(signed).error).to(contain('revoked'))
+
+    with it('leaves the validity period to the trust store'):
+        # The bundled certificate has expired, only the store decides on it
+        expect(check_signature(self.signed[0])[1]).to(be_none)
+
+    with it('rejects signatures not covering the whole document'):
+        signer = FacturaeSigner.cached(self.certificate,
+                                       test_data.CERTIFICATE_PASSWD)
+        harmless = etree.Element('Anything')
+        harmless.text = 'harmless'
+        enveloping = XMLSigner(
+            method=methods.enveloping,
+            c14n_algorithm='http://www.w3.org/2001/10/xml-exc-c14n#'
+        ).sign(harmless, key=signer.key, cert=signer.cert_chain)
+        unsigned = to_element(FacturaeGenerator(seed=1).root(1))
+        unsigned.append(deepcopy(enveloping))
+        signed = etree.fromstring(self.signed[0])
+        signed.append(deepcopy(enveloping))
+
+        for document in (to_document(unsigned), to_document(signed)):
+            for streaming in (False, True):
+                error = check_signature(document, streaming=streaming)[1]
+                expect(error).to(start_with('InvalidInput'))
+
+    with it('caches the decisions by the whole certificate chain'):
+        verifier = FacturaeVerifier(TrustStore(
+            cafiles=[test_data.CERTIFICATE_PUBLIC],
+            verification_time=VALID_TIME))
+        certificates = check_signature(self.signed[0])[0]
+
+        expect(verifier.certificate_error(certificates)).to(be_none)
+        expect(verifier.certificate_error(
+            certificates + certificates)).to(be_none)
+        expect(len(verifier.cache)).to(equal(2))
+
+    with it('builds the chain with the intermediates of the signature'):
+        ca_key, intermediate_key, key = [
+            rsa.generate_private_key(65537, 2048, default_backend())
+            for _ in range(3)]
+        ca = issue(u'CA', ca_key)
+        intermediate = issue(u'Intermediate', intermediate_key, ca, ca_key,
+                             ca=True)
+        cert = issue(u'Signer', key, intermediate, intermediate_key)
+        cafile = os.path.join(self.tmpdir, 'ca.pem')
+        with open(cafile, 'wb') as f:
+            f.write(ca.public_bytes(serialization.Encoding.PEM))
+        certificate, chain = [
+            base64.b64encode(c.public_bytes(serialization.Encoding.DER))
+            for c in (cert, intermediate)]
+        store = TrustStore(cafiles=[cafile], verification_time=VALID_TIME)
+
+        expect(store.verify(certificate, [chain])).to(be_none)
+        expect(store.verify(certificate)).to(start_with('InvalidCertificate'))
+        expect(store.verify(chain)).to(be_none)
+
+    with it('only caches the decisions of the trust store'):
+        store = TrustStore(cafiles=[test_data.CERTIFICATE_PUBLIC],
+                           verification_time=VALID_TIME)
+        verifier = FacturaeVerifier(store)
+        certificates = check_signature(self.signed[0])[0]
+        check = store.check
+
+        def unavailable(certificate, chain=()):
+            raise RuntimeError('unavailable')
+        store.check = unavailable
+        expect(verifier.certificate_error(certificates)).to(
+            start_with('RuntimeError'))
+        expect(len(verifier.cache)).to(equal(0))
+
+        store.check = check
+        expect(verifier.certificate_error(certificates)).to(be_none)
+        expect(len(verifier.cache)).to(equal(1))
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from io import BytesIO
+
+from expects import *
+
+from facturae import facturae
+from facturae.generator import FacturaeGenerator
+from facturae.writer import FacturaeWriter
+
+with description('Writer'):
+    with before.each:
+        self.generator = FacturaeGenerator(seed=1)
+        self.expected = BytesIO()
+        self.generator.write_batch(self.expected, 3)
+
+    with it('computes the batch count and totals of spooled invoices'):
+        fileheader, parties = self.generator.header(3)
+        header = facturae.FileHeader()
+        header.feed({
+            'schemaversion': '3.2.1',
+            'invoiceissuertype': 'EM',
+        })
+        header.batch.feed({
+            'batchidentifier': fileheader.batch.batchidentifier.value,
+            'invoicecurrencycode': 'EUR',
+        })
+        output = BytesIO()
+
+        with FacturaeWriter(output, header, parties) as writer:
+            for index in range(3):
+                writer.write(self.generator.invoice(index))
+
+        expect(writer.spooled).to(be_true)
+        expect(output.getvalue()).to(equal(self.expected.getvalue()))
+
+    with it('fails when the invoices written do not match InvoicesCount'):
+        fileheader, parties = self.generator.header(3)
+        writer = FacturaeWriter(BytesIO(), fileheader, parties)
+        writer.write(self.generator.invoice(0))
+
+        expect(writer.close).to(raise_error(ValueError))
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import warnings
+from io import BytesIO
+
+from expects import *
+from lxml import etree
+from signxml.exceptions import InvalidDigest
+
+import specs as test_data
+from facturae import xmldsig
+from facturae.generator import FacturaeGenerator
+from facturae.serializer import to_element
+from facturae.signing import FacturaeSigner
+from facturae.verification import check_signature
+
+with description('Streamed XML signatures'):
+    with before.each:
+        with open(test_data.CERTIFICATE, 'rb') as f:
+            self.signer = FacturaeSigner.cached(f.read(),
+                                                test_data.CERTIFICATE_PASSWD)
+        self.root = FacturaeGenerator(seed=1, attachment_size=64 * 1024).root(2)
+
+    with it('signs as signxml does'):
+        signed = self.signer.sign(self.root, streaming=True)
+
+        expect(signed).to(equal(self.signer.sign(self.root)))
+
+    with it('verifies the signature of a document'):
+        signed = self.signer.sign(self.root)
+
+        root = xmldsig.verify(BytesIO(signed))
+
+        expect(root.find(xmldsig.ds('Signature'))).to(be_none)
+
+    with it('rejects a modified document'):
+        signed = self.signer.sign(self.root, streaming=True)
+        tampered = etree.fromstring(signed.replace(b'F000000000',
+                                                   b'F000000009'))
+
+        expect(lambda: xmldsig.verify(tampered)).to(raise_error(InvalidDigest))
+
+    with it('leaves the comments out of the digest as signxml does'):
+        def commented():
+            element = to_element(self.root)
+            element[0].addprevious(etree.Comment(' routing note '))
+            element[1].append(etree.Comment(' batch note '))
+            return element
+
+        streamed = self.signer.sign(commented(), streaming=True)
+        signed = self.signer.sign(commented())
+
+        expect(streamed).to(equal(signed))
+        expect(check_signature(streamed)[1]).to(be_none)
+        expect(check_signature(signed, streaming=True)[1]).to(be_none)
+
+    with it('warns the callers when the canonical document is in memory'):
+        chunks_text = xmldsig._chunks_text
+        signed = self.signer.sign(self.root)
+        calls = [
+            lambda: self.signer.sign(self.root, streaming=True),
+            lambda: self.signer.sign_element(to_element(self.root),
+                                             streaming=True),
+            lambda: check_signature(signed, streaming=True),
+        ]
+        try:
+            for chunked in (True, False):
+                xmldsig._chunks_text = chunked
+                for call in calls:
+                    with warnings.catch_warnings(record=True) as caught:
+                        warnings.simplefilter('always')
+                        call()
+
+                    caught = [w for w in caught if issubclass(
+                        w.category, xmldsig.InMemoryC14NWarning)]
+                    expect(len(caught)).to(equal(0 if chunked else 1))
+                    if caught:
+                        expect(caught[0].filename).to(equal(__file__))
+        finally:
+            xmldsig._chunks_text = chunks_text
+
+    with it('hashes the writes through views holding back a few bytes'):
+        updates = []
+
+        class Digest(object):
+            def update(self, data):
+                updates.append(data)
+
+            def digest(self):
+                return b''
+
+        sink = xmldsig.C14NDigest(Digest())
+        chunks = [b'<a xmlns="urn:a"><b xmln', b's=""', b'>' + b'x' * 4096,
+                  b' xmlns=""/></a>']
+        for chunk in chunks:
+            sink.write(chunk)
+            expect(len(sink._pending)).to(be_below_or_equal(sink.KEEP))
+        sink.finish()
+
+        expect(b''.join(data if isinstance(data, bytes) else data.tobytes()
+                        for data in updates)).to(equal(
+            b''.join(chunks).replace(xmldsig.EMPTY_DEFAULT_NS, b'')))
+        copies = [data for data in updates if isinstance(data, bytes)]
+        expect(max(len(data) for data in copies)).to(
+            be_below_or_equal(2 * sink.KEEP))
+
+    with it('streams the digest of a document with processing instructions'):
+        element = to_element(self.root)
+        element.addprevious(etree.ProcessingInstruction('before', 'a'))
+        element.addnext(etree.ProcessingInstruction('after', 'b'))
+
+        expect(xmldsig.c14n_digest(element)).to(equal(
+            hashlib.sha256(xmldsig.c14n(element)).digest()))
+        expect(element.getprevious().target).to(equal('before'))
+
+        signed = self.signer.sign(element, streaming=True)
+        expect(check_signature(signed)[1]).to(be_none)